@@ -1,125 +1,809 @@
 use crate::errors::{GrimpError, GrimpResult};
-use crate::filesystem::get_file_system_boxed;
-use crate::import_scanning::{DirectImport, imports_by_module_to_py};
-use crate::module_finding::Module;
-use pyo3::types::PyAnyMethods;
-use pyo3::types::{PyDict, PySet};
-use pyo3::types::{PyDictMethods, PySetMethods};
-use pyo3::{Bound, FromPyObject, PyAny, PyResult, Python, pyfunction};
-use std::collections::{HashMap, HashSet};
-
-/// Writes the cache file containing all the imports for a given package.
+use crate::filesystem::{FileBytes, get_file_system_boxed};
+use crate::import_parsing::ImportedObject;
+use crate::import_scanning::{
+    _determine_module_filename, ImportsByModule, ParsedModule, get_modules_from_found_packages,
+    py_found_packages_to_rust, resolve_parsed_modules,
+};
+use crate::module_finding::{FoundPackage, Module};
+use pyo3::prelude::*;
+use rayon::prelude::*;
+use std::collections::HashMap;
+use xxhash_rust::xxh3::xxh3_64;
+
+// Data file format
+// ================
+//
+// Each data file holds the parse results of the modules in a single package. These don't depend
+// on the arguments passed to build_graph, so they can be shared between different builds: the
+// imports are resolved from them each time the cache is read.
+//
+// Data files are binary so that they can be memory-mapped, and a single module looked up without
+// reading the rest of the file. All integers are little-endian u32s.
+//
+// - Header:       magic bytes, format version, string count, module count, import count.
+// - String table: (string count + 1) offsets into the string data, followed by the string data
+//                 itself. Each distinct string is stored once, and is referred to elsewhere by
+//                 its index in the table.
+// - Module index: a (name, key, is package, first import, import count) record for each module,
+//                 sorted by module name so that modules can be found with a binary search. The
+//                 key identifies the version of the module that was parsed (e.g. its mtime).
+// - Imports:      an (imported object name, line number, line contents, type checking only)
+//                 record for each imported object, grouped by module.
+//
+// The format version must be incremented whenever the format changes.
+//
+// Log file format
+// ===============
+//
+// Rewriting a whole data file when only a few of its modules have changed is slow for large
+// packages, so the modules that have changed are instead appended to a log file alongside it.
+// Each write appends a segment to the log: the length of the segment (a u32), followed by the
+// segment itself, in the data file format. When a module is looked up, the most recent segment
+// containing it takes precedence over the data file.
+//
+// Once the log grows too large, it is compacted: the data file is rewritten with all the
+// modules, and the log emptied.
+//
+// Stale entries are harmless, as a module is only read from the cache if its key matches.
+
+const MAGIC: &[u8; 8] = b"GRIMPIMP";
+const FORMAT_VERSION: u32 = 2;
+const HEADER_SIZE: u64 = 24;
+const U32_SIZE: u64 = 4;
+const MODULE_RECORD_SIZE: u64 = 5 * U32_SIZE;
+const IMPORT_RECORD_SIZE: u64 = 4 * U32_SIZE;
+// The log is compacted once it is at least this fraction of the size of the data file.
+const LOG_COMPACTION_DIVISOR: usize = 2;
+
+/// Appends the parse results of the modules in a package that its existing cache doesn't
+/// already hold (with the same key) to the package's log file.
+///
+/// Args:
+/// - log_filename: str
+/// - imports_by_module: ImportsByModule, as returned by scanning or reading from the cache.
+/// - module_keys: dict[str, str] of the names of the modules to write, to a key that identifies
+///   the version of each module (e.g. its mtime). Modules without parse results are skipped.
+/// - file_system: The file system interface to use. (A BasicFileSystem.)
+/// - data_file: The package's existing CacheDataFile.
+/// Returns "unchanged" or "appended", depending on what was written, or None if the data file
+/// needs rewriting instead, because the log would grow too large or couldn't be read.
+#[pyfunction]
+pub fn append_to_cache_log_file<'py>(
+    log_filename: &str,
+    imports_by_module: PyRef<'py, ImportsByModule>,
+    module_keys: HashMap<String, String>,
+    file_system: Bound<'py, PyAny>,
+    data_file: PyRef<'py, CacheDataFile>,
+) -> PyResult<Option<&'static str>> {
+    let mut file_system_boxed = get_file_system_boxed(&file_system)?;
+
+    let parsed_modules = select_parsed_modules(&imports_by_module, &module_keys);
+    let Ok(changed_modules) = data_file.changed_modules(&parsed_modules) else {
+        return Ok(None);
+    };
+    if changed_modules.is_empty() {
+        return Ok(Some("unchanged"));
+    }
+    let segment = serialize_parsed_modules(changed_modules);
+    let log_len = data_file.log_len + U32_SIZE as usize + segment.len();
+    if data_file.log_is_damaged
+        || log_len * LOG_COMPACTION_DIVISOR >= data_file.data_file.bytes.len()
+    {
+        return Ok(None);
+    }
+    let mut log_contents = (segment.len() as u32).to_le_bytes().to_vec();
+    log_contents.extend(segment);
+    file_system_boxed.append_bytes(log_filename, &log_contents)?;
+    Ok(Some("appended"))
+}
+
+/// Writes the parse results of the modules in a package to the cache, replacing its data file
+/// and emptying its log file.
+///
+/// The data file must not be memory-mapped (e.g. by a CacheDataFile) while it is replaced, as
+/// Windows doesn't allow mapped files to be replaced.
+///
 /// Args:
 /// - filename: str
-/// - imports_by_module: dict[Module, Set[DirectImport]]
+/// - log_filename: str
+/// - imports_by_module: ImportsByModule, as returned by scanning or reading from the cache.
+/// - module_keys: dict[str, str] of the names of the modules to write, to a key that identifies
+///   the version of each module (e.g. its mtime). Modules without parse results are skipped.
 /// - file_system: The file system interface to use. (A BasicFileSystem.)
 #[pyfunction]
-pub fn write_cache_data_map_file<'py>(
+pub fn write_cache_data_file<'py>(
     filename: &str,
-    imports_by_module: Bound<'py, PyDict>,
+    log_filename: &str,
+    imports_by_module: PyRef<'py, ImportsByModule>,
+    module_keys: HashMap<String, String>,
     file_system: Bound<'py, PyAny>,
 ) -> PyResult<()> {
     let mut file_system_boxed = get_file_system_boxed(&file_system)?;
 
-    let ImportsByModule(imports_by_module_rust) = imports_by_module.extract()?;
+    let parsed_modules = select_parsed_modules(&imports_by_module, &module_keys);
+    let file_contents = serialize_parsed_modules(parsed_modules);
+    file_system_boxed.write_bytes(filename, &file_contents)?;
+    // The data file now holds everything in the log.
+    if file_system_boxed.exists(log_filename) {
+        file_system_boxed.write_bytes(log_filename, &[])?;
+    }
+    Ok(())
+}
+
+/// Return the parse results of the modules to write, along with their names and keys.
+fn select_parsed_modules<'a>(
+    imports_by_module: &'a ImportsByModule,
+    module_keys: &'a HashMap<String, String>,
+) -> Vec<(&'a str, &'a str, &'a ParsedModule)> {
+    module_keys
+        .iter()
+        .filter_map(|(name, key)| {
+            imports_by_module
+                .parsed_modules
+                .get(&Module { name: name.clone() })
+                .map(|parsed_module| (name.as_str(), key.as_str(), parsed_module))
+        })
+        .collect()
+}
+
+/// Reads a cache data file, together with its log file.
+///
+/// Only the header of the data file is read up front: the rest is read when modules are looked
+/// up. A log file that is missing is treated as empty.
+///
+/// Args:
+/// - filename: str
+/// - log_filename: str
+/// - file_system: The file system interface to use. (A BasicFileSystem.)
+/// Returns CacheDataFile.
+#[pyfunction]
+pub fn read_cache_data_file<'py>(
+    filename: &str,
+    log_filename: &str,
+    file_system: Bound<'py, PyAny>,
+) -> PyResult<CacheDataFile> {
+    let file_system_boxed = get_file_system_boxed(&file_system)?;
 
-    let file_contents = serialize_imports_by_module(&imports_by_module_rust);
+    let data_file = DataFile::new(file_system_boxed.read_bytes(filename)?, filename)?;
+    let log_bytes = if file_system_boxed.exists(log_filename) {
+        Some(file_system_boxed.read_bytes(log_filename)?)
+    } else {
+        None
+    };
 
-    file_system_boxed.write(filename, &file_contents)?;
+    Ok(CacheDataFile::new(
+        data_file,
+        log_bytes.as_deref().unwrap_or_default(),
+        log_filename,
+    ))
+}
 
-    Ok(())
+/// Reads the imports of the supplied modules from the cache data files, skipping any that aren't
+/// in the cache or whose key doesn't match.
+///
+/// The imports are resolved from the cached parse results, in parallel.
+///
+/// Args:
+/// - data_files: list[CacheDataFile]
+/// - module_keys: dict[str, str] of the names of the modules to read, to a key that identifies
+///   the current version of each module (e.g. its mtime).
+/// - found_packages: set[FoundPackage] containing all the modules for analysis.
+/// - include_external_packages: Whether to include imports of external modules.
+/// - exclude_type_checking_imports: If True, don't include imports behind TYPE_CHECKING guards.
+/// Returns ImportsByModule.
+#[pyfunction]
+pub fn read_cached_imports<'py>(
+    py: Python<'py>,
+    data_files: Vec<Bound<'py, CacheDataFile>>,
+    module_keys: HashMap<String, String>,
+    found_packages: Bound<'py, PyAny>,
+    include_external_packages: bool,
+    exclude_type_checking_imports: bool,
+) -> PyResult<ImportsByModule> {
+    let found_packages_rust = py_found_packages_to_rust(&found_packages);
+    let all_modules = get_modules_from_found_packages(&found_packages_rust);
+    let data_files: Vec<&CacheDataFile> =
+        data_files.iter().map(|data_file| data_file.get()).collect();
+
+    let imports_by_module = py.detach(|| -> GrimpResult<ImportsByModule> {
+        let parsed_modules = module_keys
+            .into_par_iter()
+            .filter_map(|(name, key)| {
+                for data_file in &data_files {
+                    match data_file.read_parsed_module(&name, &key) {
+                        Ok(Some(parsed_module)) => {
+                            return Some(Ok((Module { name }, parsed_module)));
+                        }
+                        Ok(None) => continue,
+                        Err(e) => return Some(Err(e)),
+                    }
+                }
+                None
+            })
+            .collect::<GrimpResult<HashMap<_, _>>>()?;
+
+        let imports_by_module = resolve_parsed_modules(
+            &parsed_modules,
+            &found_packages_rust,
+            &all_modules,
+            include_external_packages,
+            exclude_type_checking_imports,
+        );
+        Ok(ImportsByModule {
+            imports_by_module,
+            parsed_modules,
+        })
+    })?;
+    Ok(imports_by_module)
 }
 
-/// Reads the cache file containing all the imports for a given package.
+/// Hashes the contents of each module in the supplied packages, in parallel.
+///
+/// Used to tell whether a module has changed since it was cached, when modification times
+/// can't be relied on.
+///
 /// Args:
-/// - filename: str
+/// - found_packages: set[FoundPackage]
 /// - file_system: The file system interface to use. (A BasicFileSystem.)
-/// Returns Dict[Module, Set[DirectImport]]
+/// Returns dict[str, str] of module names to hexadecimal hashes.
 #[pyfunction]
-pub fn read_cache_data_map_file<'py>(
+pub fn hash_module_contents<'py>(
     py: Python<'py>,
-    filename: &str,
+    found_packages: Bound<'py, PyAny>,
     file_system: Bound<'py, PyAny>,
-) -> PyResult<Bound<'py, PyDict>> {
+) -> PyResult<HashMap<String, String>> {
     let file_system_boxed = get_file_system_boxed(&file_system)?;
+    let found_packages_rust = py_found_packages_to_rust(&found_packages);
 
-    let file_contents = file_system_boxed.read(filename)?;
+    let modules: Vec<(&Module, &FoundPackage)> = found_packages_rust
+        .iter()
+        .flat_map(|found_package| {
+            found_package
+                .module_files
+                .iter()
+                .map(move |module_file| (&module_file.module, found_package))
+        })
+        .collect();
 
-    let imports_by_module = parse_json_to_map(&file_contents, filename)?;
+    let hashes = py.detach(|| {
+        modules
+            .into_par_iter()
+            .map(|(module, found_package)| {
+                let module_filename =
+                    _determine_module_filename(module, found_package, &file_system_boxed)?;
+                let contents = file_system_boxed.read_bytes(&module_filename)?;
+                Ok((module.name.clone(), format!("{:016x}", xxh3_64(&contents))))
+            })
+            .collect::<PyResult<HashMap<_, _>>>()
+    })?;
+    Ok(hashes)
+}
 
-    Ok(imports_by_module_to_py(py, imports_by_module))
+/// A cache data file, holding the parse results of the modules in a package, together with the
+/// modules in its log file.
+#[pyclass(frozen)]
+pub struct CacheDataFile {
+    data_file: DataFile,
+    log_segments: Vec<DataFile>,
+    // The index of the most recent log segment containing each module.
+    log_index: HashMap<String, usize>,
+    // The size of the readable part of the log.
+    log_len: usize,
+    // Whether the log file ended with something that couldn't be read, e.g. because the
+    // process writing it was interrupted.
+    log_is_damaged: bool,
 }
 
-/// A newtype wrapper for HashMap<Module, HashSet<DirectImport>> that implements FromPyObject.
-pub struct ImportsByModule(pub HashMap<Module, HashSet<DirectImport>>);
+impl CacheDataFile {
+    fn new(data_file: DataFile, log_bytes: &[u8], log_filename: &str) -> Self {
+        let mut log_segments = vec![];
+        let mut log_index = HashMap::new();
+        let mut log_len = 0;
+        while log_len < log_bytes.len() {
+            let Some(segment) = read_log_segment(log_bytes, log_len, log_filename) else {
+                break;
+            };
+            let segment_len = U32_SIZE as usize + segment.bytes.len();
+            for i in 0..segment.module_count {
+                // Module names have already been validated by read_log_segment.
+                let module_name = segment.module_name(i).unwrap().to_string();
+                log_index.insert(module_name, log_segments.len());
+            }
+            log_segments.push(segment);
+            log_len += segment_len;
+        }
+        CacheDataFile {
+            data_file,
+            log_segments,
+            log_index,
+            log_is_damaged: log_len < log_bytes.len(),
+            log_len,
+        }
+    }
 
-impl<'py> FromPyObject<'py> for ImportsByModule {
-    fn extract_bound(ob: &Bound<'py, PyAny>) -> PyResult<Self> {
-        let py_dict = ob.downcast::<PyDict>()?;
-        let mut imports_by_module_rust = HashMap::new();
+    /// Return where the module is stored: the log segment it was most recently written to, or
+    /// else the data file.
+    fn file_for_module(&self, module_name: &str) -> &DataFile {
+        match self.log_index.get(module_name) {
+            Some(&segment_index) => &self.log_segments[segment_index],
+            None => &self.data_file,
+        }
+    }
+
+    /// Return the parse results of the module, if it's cached with the supplied key.
+    fn read_parsed_module(
+        &self,
+        module_name: &str,
+        key: &str,
+    ) -> GrimpResult<Option<ParsedModule>> {
+        self.file_for_module(module_name)
+            .read_parsed_module(module_name, key)
+    }
 
-        for (py_key, py_value) in py_dict.iter() {
-            let module: Module = py_key.extract()?;
-            let py_set = py_value.downcast::<PySet>()?;
-            let mut hashset: HashSet<DirectImport> = HashSet::new();
-            for element in py_set.iter() {
-                let direct_import: DirectImport = element.extract()?;
-                hashset.insert(direct_import);
+    /// Return the modules that aren't cached with the same key.
+    fn changed_modules<'a>(
+        &self,
+        parsed_modules: &[(&'a str, &'a str, &'a ParsedModule)],
+    ) -> GrimpResult<Vec<(&'a str, &'a str, &'a ParsedModule)>> {
+        let mut changed_modules = vec![];
+        for &(module_name, key, parsed_module) in parsed_modules {
+            let file = self.file_for_module(module_name);
+            if file.find_module_with_key(module_name, key)?.is_none() {
+                changed_modules.push((module_name, key, parsed_module));
             }
-            imports_by_module_rust.insert(module, hashset);
         }
+        Ok(changed_modules)
+    }
+}
 
-        Ok(ImportsByModule(imports_by_module_rust))
+#[pymethods]
+impl CacheDataFile {
+    fn __contains__(&self, module_name: &str) -> PyResult<bool> {
+        Ok(self.log_index.contains_key(module_name)
+            || self.data_file.find_module(module_name)?.is_some())
+    }
+
+    fn __len__(&self) -> PyResult<usize> {
+        let mut modules_only_in_log = 0;
+        for module_name in self.log_index.keys() {
+            if self.data_file.find_module(module_name)?.is_none() {
+                modules_only_in_log += 1;
+            }
+        }
+        Ok(self.data_file.module_count + modules_only_in_log)
     }
 }
 
-fn serialize_imports_by_module(
-    imports_by_module: &HashMap<Module, HashSet<DirectImport>>,
-) -> String {
-    let raw_map: HashMap<&str, Vec<(&str, usize, &str)>> = imports_by_module
-        .iter()
-        .map(|(module, imports)| {
-            let imports_vec: Vec<(&str, usize, &str)> = imports
-                .iter()
-                .map(|import| {
-                    (
-                        import.imported.as_str(),
-                        import.line_number,
-                        import.line_contents.as_str(),
-                    )
-                })
-                .collect();
-            (module.name.as_str(), imports_vec)
+/// Read the log segment at the position in the log, if it can be read.
+fn read_log_segment(log_bytes: &[u8], position: usize, log_filename: &str) -> Option<DataFile> {
+    let segment_start = position + U32_SIZE as usize;
+    let segment_end = segment_start + read_u32(log_bytes, position)? as usize;
+    let segment_bytes = log_bytes.get(segment_start..segment_end)?;
+    let segment = DataFile::new(FileBytes::Owned(segment_bytes.to_vec()), log_filename).ok()?;
+    for i in 0..segment.module_count {
+        segment.module_name(i).ok()?;
+    }
+    Some(segment)
+}
+
+/// Builds the string table of a data file, storing each distinct string once.
+#[derive(Default)]
+pub(crate) struct StringTableBuilder<'a> {
+    indices: HashMap<&'a str, u32>,
+    strings: Vec<&'a str>,
+}
+
+impl<'a> StringTableBuilder<'a> {
+    pub(crate) fn intern(&mut self, string: &'a str) -> u32 {
+        *self.indices.entry(string).or_insert_with(|| {
+            self.strings.push(string);
+            (self.strings.len() - 1) as u32
         })
-        .collect();
+    }
+
+    pub(crate) fn len(&self) -> usize {
+        self.strings.len()
+    }
 
-    serde_json::to_string(&raw_map).expect("Failed to serialize to JSON")
+    /// Writes the offsets of the strings, followed by the string data.
+    pub(crate) fn write(&self, bytes: &mut Vec<u8>) {
+        let mut string_offset: u32 = 0;
+        bytes.extend_from_slice(&string_offset.to_le_bytes());
+        for string in &self.strings {
+            string_offset += string.len() as u32;
+            bytes.extend_from_slice(&string_offset.to_le_bytes());
+        }
+        for string in &self.strings {
+            bytes.extend_from_slice(string.as_bytes());
+        }
+    }
 }
 
-pub fn parse_json_to_map(
-    json_str: &str,
-    filename: &str,
-) -> GrimpResult<HashMap<Module, HashSet<DirectImport>>> {
-    let raw_map: HashMap<String, Vec<(String, usize, String)>> = serde_json::from_str(json_str)
-        .map_err(|_| GrimpError::CorruptCache(filename.to_string()))?;
+/// Serializes the parse results of some modules, given as (name, key, parse results).
+fn serialize_parsed_modules(mut parsed_modules: Vec<(&str, &str, &ParsedModule)>) -> Vec<u8> {
+    parsed_modules.sort_by_key(|(name, _, _)| *name);
 
-    let mut parsed_map: HashMap<Module, HashSet<DirectImport>> = HashMap::new();
+    let mut string_table = StringTableBuilder::default();
+    let mut module_records: Vec<[u32; 5]> = Vec::with_capacity(parsed_modules.len());
+    let mut import_records: Vec<[u32; 4]> = vec![];
+    for (name, key, parsed_module) in parsed_modules {
+        module_records.push([
+            string_table.intern(name),
+            string_table.intern(key),
+            parsed_module.is_package as u32,
+            import_records.len() as u32,
+            parsed_module.imported_objects.len() as u32,
+        ]);
+        for imported_object in &parsed_module.imported_objects {
+            import_records.push([
+                string_table.intern(&imported_object.name),
+                imported_object.line_number as u32,
+                string_table.intern(&imported_object.line_contents),
+                imported_object.typechecking_only as u32,
+            ]);
+        }
+    }
+
+    let mut bytes = MAGIC.to_vec();
+    for value in [
+        FORMAT_VERSION,
+        string_table.len() as u32,
+        module_records.len() as u32,
+        import_records.len() as u32,
+    ] {
+        bytes.extend_from_slice(&value.to_le_bytes());
+    }
+    string_table.write(&mut bytes);
+    for value in module_records.iter().flatten() {
+        bytes.extend_from_slice(&value.to_le_bytes());
+    }
+    for value in import_records.iter().flatten() {
+        bytes.extend_from_slice(&value.to_le_bytes());
+    }
+    bytes
+}
+
+/// A data file, read lazily.
+///
+/// Creating a DataFile only validates the header and the size of the file: the rest of the
+/// file is bounds-checked as it is read.
+struct DataFile {
+    bytes: FileBytes,
+    filename: String,
+    string_count: usize,
+    module_count: usize,
+    import_count: usize,
+    string_data_start: usize,
+    string_data_len: usize,
+    module_index_start: usize,
+    imports_start: usize,
+}
+
+impl DataFile {
+    fn new(bytes: FileBytes, filename: &str) -> GrimpResult<Self> {
+        let corrupt = || GrimpError::CorruptCache(filename.to_string());
+
+        if bytes.len() < HEADER_SIZE as usize || &bytes[..MAGIC.len()] != MAGIC {
+            return Err(corrupt());
+        }
+        let header_value = |position: usize| read_u32(&bytes, position).ok_or_else(corrupt);
+        if header_value(8)? != FORMAT_VERSION {
+            return Err(corrupt());
+        }
+        let string_count = header_value(12)? as u64;
+        let module_count = header_value(16)? as u64;
+        let import_count = header_value(20)? as u64;
+
+        let string_data_start = HEADER_SIZE + (string_count + 1) * U32_SIZE;
+        if string_data_start > bytes.len() as u64 {
+            return Err(corrupt());
+        }
+        let string_data_len = header_value((string_data_start - U32_SIZE) as usize)? as u64;
+        let module_index_start = string_data_start + string_data_len;
+        let imports_start = module_index_start + module_count * MODULE_RECORD_SIZE;
+        if imports_start + import_count * IMPORT_RECORD_SIZE != bytes.len() as u64 {
+            return Err(corrupt());
+        }
+
+        Ok(DataFile {
+            bytes,
+            filename: filename.to_string(),
+            string_count: string_count as usize,
+            module_count: module_count as usize,
+            import_count: import_count as usize,
+            string_data_start: string_data_start as usize,
+            string_data_len: string_data_len as usize,
+            module_index_start: module_index_start as usize,
+            imports_start: imports_start as usize,
+        })
+    }
 
-    for (module_name, imports) in raw_map {
-        let module = Module {
-            name: module_name.clone(),
+    fn corrupt(&self) -> GrimpError {
+        GrimpError::CorruptCache(self.filename.clone())
+    }
+
+    fn string(&self, index: u32) -> GrimpResult<&str> {
+        let index = index as usize;
+        if index >= self.string_count {
+            return Err(self.corrupt());
+        }
+        let offset_position = HEADER_SIZE as usize + index * U32_SIZE as usize;
+        let start = read_u32(&self.bytes, offset_position).ok_or_else(|| self.corrupt())? as usize;
+        let end = read_u32(&self.bytes, offset_position + U32_SIZE as usize)
+            .ok_or_else(|| self.corrupt())? as usize;
+        if start > end || end > self.string_data_len {
+            return Err(self.corrupt());
+        }
+        let string_bytes =
+            &self.bytes[self.string_data_start + start..self.string_data_start + end];
+        std::str::from_utf8(string_bytes).map_err(|_| self.corrupt())
+    }
+
+    fn record<const N: usize>(&self, position: usize) -> GrimpResult<[u32; N]> {
+        let mut record = [0; N];
+        for (i, value) in record.iter_mut().enumerate() {
+            *value = read_u32(&self.bytes, position + i * U32_SIZE as usize)
+                .ok_or_else(|| self.corrupt())?;
+        }
+        Ok(record)
+    }
+
+    fn module_name(&self, module_index: usize) -> GrimpResult<&str> {
+        let [name] =
+            self.record(self.module_index_start + module_index * MODULE_RECORD_SIZE as usize)?;
+        self.string(name)
+    }
+
+    /// Return the (key, is package, first import, import count) record of the module, if it's
+    /// in the file.
+    fn find_module(&self, module_name: &str) -> GrimpResult<Option<[u32; 4]>> {
+        let (mut low, mut high) = (0, self.module_count);
+        while low < high {
+            let middle = low + (high - low) / 2;
+            let [name, key, is_package, first_import, import_count] =
+                self.record(self.module_index_start + middle * MODULE_RECORD_SIZE as usize)?;
+            match self.string(name)?.cmp(module_name) {
+                std::cmp::Ordering::Less => low = middle + 1,
+                std::cmp::Ordering::Greater => high = middle,
+                std::cmp::Ordering::Equal => {
+                    if first_import as usize + import_count as usize > self.import_count {
+                        return Err(self.corrupt());
+                    }
+                    return Ok(Some([key, is_package, first_import, import_count]));
+                }
+            }
+        }
+        Ok(None)
+    }
+
+    /// Return the (is package, first import, import count) record of the module, if it's in
+    /// the file with the supplied key.
+    fn find_module_with_key(&self, module_name: &str, key: &str) -> GrimpResult<Option<[u32; 3]>> {
+        let Some([cached_key, is_package, first_import, import_count]) =
+            self.find_module(module_name)?
+        else {
+            return Ok(None);
         };
-        let import_set: HashSet<DirectImport> = imports
-            .into_iter()
-            .map(|(imported, line_number, line_contents)| DirectImport {
-                importer: module_name.clone(),
-                imported,
-                line_number,
-                line_contents,
+        if self.string(cached_key)? != key {
+            return Ok(None);
+        }
+        Ok(Some([is_package, first_import, import_count]))
+    }
+
+    /// Return the parse results of the module, if it's in the file with the supplied key.
+    fn read_parsed_module(
+        &self,
+        module_name: &str,
+        key: &str,
+    ) -> GrimpResult<Option<ParsedModule>> {
+        let Some([is_package, first_import, import_count]) =
+            self.find_module_with_key(module_name, key)?
+        else {
+            return Ok(None);
+        };
+        let (first_import, import_count) = (first_import as usize, import_count as usize);
+        let imported_objects = (first_import..first_import + import_count)
+            .map(|i| {
+                let [name, line_number, line_contents, typechecking_only] =
+                    self.record(self.imports_start + i * IMPORT_RECORD_SIZE as usize)?;
+                Ok(ImportedObject {
+                    name: self.string(name)?.to_string(),
+                    line_number: line_number as usize,
+                    line_contents: self.string(line_contents)?.to_string(),
+                    typechecking_only: typechecking_only != 0,
+                })
             })
-            .collect();
-        parsed_map.insert(module, import_set);
+            .collect::<GrimpResult<Vec<_>>>()?;
+        Ok(Some(ParsedModule {
+            is_package: is_package != 0,
+            imported_objects,
+        }))
+    }
+}
+
+pub(crate) fn read_u32(bytes: &[u8], position: usize) -> Option<u32> {
+    let value_bytes = bytes.get(position..position + U32_SIZE as usize)?;
+    Some(u32::from_le_bytes(value_bytes.try_into().unwrap()))
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn make_parsed_modules() -> Vec<(&'static str, &'static str, ParsedModule)> {
+        let imported_object =
+            |name: &str, line_number: usize, typechecking_only: bool| ImportedObject {
+                name: name.to_string(),
+                line_number,
+                line_contents: format!("import {name}"),
+                typechecking_only,
+            };
+        vec![
+            (
+                "mypackage.blue",
+                "1.5",
+                ParsedModule {
+                    is_package: false,
+                    imported_objects: vec![
+                        imported_object("mypackage.green", 1, false),
+                        imported_object("django", 2, true),
+                    ],
+                },
+            ),
+            (
+                "mypackage.green",
+                "2.5",
+                ParsedModule {
+                    is_package: false,
+                    imported_objects: vec![imported_object("django", 5, false)],
+                },
+            ),
+            (
+                "mypackage",
+                "3.5",
+                ParsedModule {
+                    is_package: true,
+                    imported_objects: vec![],
+                },
+            ),
+        ]
     }
 
-    Ok(parsed_map)
+    fn serialize(parsed_modules: &[(&str, &str, ParsedModule)]) -> Vec<u8> {
+        serialize_parsed_modules(
+            parsed_modules
+                .iter()
+                .map(|(name, key, parsed_module)| (*name, *key, parsed_module))
+                .collect(),
+        )
+    }
+
+    #[test]
+    fn test_round_trip() {
+        let parsed_modules = make_parsed_modules();
+
+        let bytes = serialize(&parsed_modules);
+        let data_file = DataFile::new(FileBytes::Owned(bytes), "some-file").unwrap();
+
+        assert_eq!(data_file.module_count, 3);
+        for (name, key, parsed_module) in &parsed_modules {
+            assert_eq!(
+                data_file.read_parsed_module(name, key).unwrap().as_ref(),
+                Some(parsed_module)
+            );
+        }
+        assert_eq!(
+            data_file
+                .read_parsed_module("mypackage.red", "1.5")
+                .unwrap(),
+            None
+        );
+    }
+
+    #[test]
+    fn test_ignores_module_with_different_key() {
+        let bytes = serialize(&make_parsed_modules());
+        let data_file = DataFile::new(FileBytes::Owned(bytes), "some-file").unwrap();
+
+        assert_eq!(
+            data_file
+                .read_parsed_module("mypackage.blue", "9.5")
+                .unwrap(),
+            None
+        );
+    }
+
+    #[test]
+    fn test_rejects_truncated_file() {
+        let mut bytes = serialize(&make_parsed_modules());
+        bytes.pop();
+
+        assert!(matches!(
+            DataFile::new(FileBytes::Owned(bytes), "some-file"),
+            Err(GrimpError::CorruptCache(_))
+        ));
+    }
+
+    fn log_segment(parsed_modules: &[(&str, &str, ParsedModule)]) -> Vec<u8> {
+        let segment = serialize(parsed_modules);
+        let mut log_bytes = (segment.len() as u32).to_le_bytes().to_vec();
+        log_bytes.extend(segment);
+        log_bytes
+    }
+
+    #[test]
+    fn test_log_takes_precedence_over_data_file() {
+        let parsed_modules = make_parsed_modules();
+        let data_file =
+            DataFile::new(FileBytes::Owned(serialize(&parsed_modules)), "some-file").unwrap();
+        let changed_module = ParsedModule {
+            is_package: false,
+            imported_objects: vec![],
+        };
+        let log_bytes = [
+            log_segment(&[("mypackage.blue", "4.5", parsed_modules[0].2.clone())]),
+            log_segment(&[("mypackage.blue", "5.5", changed_module.clone())]),
+        ]
+        .concat();
+
+        let cache_data_file = CacheDataFile::new(data_file, &log_bytes, "some-log-file");
+
+        assert!(!cache_data_file.log_is_damaged);
+        assert_eq!(cache_data_file.log_len, log_bytes.len());
+        assert_eq!(
+            cache_data_file
+                .read_parsed_module("mypackage.blue", "5.5")
+                .unwrap(),
+            Some(changed_module)
+        );
+        assert_eq!(
+            cache_data_file
+                .read_parsed_module("mypackage.blue", "1.5")
+                .unwrap(),
+            None
+        );
+        assert_eq!(
+            cache_data_file
+                .read_parsed_module("mypackage.green", "2.5")
+                .unwrap()
+                .as_ref(),
+            Some(&parsed_modules[1].2)
+        );
+    }
+
+    #[test]
+    fn test_reads_log_up_to_damage() {
+        let parsed_modules = make_parsed_modules();
+        let data_file =
+            DataFile::new(FileBytes::Owned(serialize(&parsed_modules)), "some-file").unwrap();
+        let complete_segment =
+            log_segment(&[("mypackage.red", "6.5", parsed_modules[0].2.clone())]);
+        let mut log_bytes = complete_segment.clone();
+        // A segment that was only partly written.
+        log_bytes.extend(&complete_segment[..complete_segment.len() - 1]);
+
+        let cache_data_file = CacheDataFile::new(data_file, &log_bytes, "some-log-file");
+
+        assert!(cache_data_file.log_is_damaged);
+        assert_eq!(cache_data_file.log_len, complete_segment.len());
+        assert_eq!(
+            cache_data_file
+                .read_parsed_module("mypackage.red", "6.5")
+                .unwrap()
+                .as_ref(),
+            Some(&parsed_modules[0].2)
+        );
+    }
+
+    #[test]
+    fn test_rejects_other_format_version() {
+        let mut bytes = serialize(&make_parsed_modules());
+        bytes[8..12].copy_from_slice(&(FORMAT_VERSION - 1).to_le_bytes());
+
+        assert!(matches!(
+            DataFile::new(FileBytes::Owned(bytes), "some-file"),
+            Err(GrimpError::CorruptCache(_))
+        ));
+    }
 }
@@ -36,6 +36,12 @@ pub enum GrimpError {
 
     #[error("Could not use corrupt cache file {0}.")]
     CorruptCache(String),
+
+    #[error("Cannot change a frozen graph.")]
+    FrozenGraph,
+
+    #[error("Could not load corrupt graph snapshot.")]
+    CorruptSnapshot,
 }
 
 pub type GrimpResult<T> = Result<T, GrimpError>;
@@ -55,6 +61,8 @@ impl From<GrimpError> for PyErr {
                 line_number, text, ..
             } => PyErr::new::<exceptions::ParseError, _>((line_number, text)),
             GrimpError::CorruptCache(_) => exceptions::CorruptCache::new_err(value.to_string()),
+            GrimpError::FrozenGraph => PyValueError::new_err(value.to_string()),
+            GrimpError::CorruptSnapshot => PyValueError::new_err(value.to_string()),
         }
     }
 }
@@ -1,19 +1,31 @@
 use itertools::Itertools;
+use memmap2::Mmap;
 use pyo3::exceptions::{PyFileNotFoundError, PyTypeError, PyUnicodeDecodeError};
 use pyo3::prelude::*;
 use regex::Regex;
 use std::collections::HashMap;
 use std::ffi::OsStr;
 use std::fs;
-use std::fs::File;
+use std::fs::{File, OpenOptions};
 use std::io::prelude::*;
+use std::ops::Deref;
 use std::path::{Path, PathBuf};
+use std::process;
+use std::sync::atomic::{AtomicUsize, Ordering};
 use std::sync::{Arc, LazyLock, Mutex};
+use std::time::UNIX_EPOCH;
 use unindent::unindent;
 
 static ENCODING_RE: LazyLock<Regex> =
     LazyLock::new(|| Regex::new(r"^[ \t\f]*#.*?coding[:=][ \t]*([-_.a-zA-Z0-9]+)").unwrap());
 
+// The mtime reported for files in a fake file system, unless otherwise specified.
+// Kept in sync with tests.adaptors.filesystem.DEFAULT_MTIME.
+const DEFAULT_FAKE_MTIME: f64 = 10000.0;
+
+// Distinguishes the temporary files written by different threads of the same process.
+static TEMPORARY_FILE_COUNTER: AtomicUsize = AtomicUsize::new(0);
+
 pub trait FileSystem: Send + Sync {
     fn sep(&self) -> &str;
 
@@ -23,9 +35,56 @@ pub trait FileSystem: Send + Sync {
 
     fn exists(&self, file_name: &str) -> bool;
 
+    /// List the immediate contents of a directory, returned as (subdirectory names, file names).
+    ///
+    /// Symlinks are followed. A directory that does not exist (or cannot be read) is treated
+    /// as empty, in the same way as os.walk.
+    fn list_directory(&self, directory: &str) -> (Vec<String>, Vec<String>);
+
+    /// Return the mtime of a file, as a number of seconds since the epoch.
+    fn get_mtime(&self, file_name: &str) -> PyResult<f64>;
+
+    /// Return the size of a file, in bytes.
+    fn get_size(&self, file_name: &str) -> PyResult<u64>;
+
     fn read(&self, file_name: &str) -> PyResult<String>;
 
+    /// Return the raw contents of a file, memory-mapped if the file system supports it.
+    fn read_bytes(&self, file_name: &str) -> PyResult<FileBytes>;
+
     fn write(&mut self, file_name: &str, contents: &str) -> PyResult<()>;
+
+    fn write_bytes(&mut self, file_name: &str, contents: &[u8]) -> PyResult<()>;
+
+    /// Append to a file, creating it if necessary.
+    fn append_bytes(&mut self, file_name: &str, contents: &[u8]) -> PyResult<()>;
+
+    /// Take an exclusive advisory lock on a file, creating it if necessary, and blocking until
+    /// the lock is available. The lock is released when the returned FileLock is dropped.
+    fn lock(&self, file_name: &str) -> PyResult<FileLock>;
+}
+
+/// An advisory lock on a file, released when dropped.
+pub struct FileLock {
+    // None for file systems that don't support locking.
+    _file: Option<File>,
+}
+
+/// The raw contents of a file.
+pub enum FileBytes {
+    Mapped(Mmap),
+    Owned(Vec<u8>),
+}
+
+impl Deref for FileBytes {
+    type Target = [u8];
+
+    fn deref(&self) -> &[u8] {
+        match self {
+            FileBytes::Mapped(mmap) => mmap,
+            FileBytes::Owned(bytes) => bytes,
+        }
+    }
 }
 
 #[derive(Clone)]
@@ -83,6 +142,44 @@ impl FileSystem for RealBasicFileSystem {
         Path::new(file_name).is_file()
     }
 
+    fn list_directory(&self, directory: &str) -> (Vec<String>, Vec<String>) {
+        let mut subdirectories = vec![];
+        let mut file_names = vec![];
+        let Ok(entries) = fs::read_dir(directory) else {
+            return (subdirectories, file_names);
+        };
+        for entry in entries.flatten() {
+            let Ok(name) = entry.file_name().into_string() else {
+                // Non-unicode names can't be Python modules.
+                continue;
+            };
+            // Path::is_dir follows symlinks, in line with os.walk(followlinks=True).
+            if entry.path().is_dir() {
+                subdirectories.push(name);
+            } else {
+                file_names.push(name);
+            }
+        }
+        (subdirectories, file_names)
+    }
+
+    fn get_mtime(&self, file_name: &str) -> PyResult<f64> {
+        let modified = fs::metadata(file_name)?.modified()?;
+        // Calculate the float in the same way as Python's os.stat, so the values are identical.
+        let seconds = match modified.duration_since(UNIX_EPOCH) {
+            Ok(duration) => duration.as_secs() as f64 + duration.subsec_nanos() as f64 * 1e-9,
+            Err(e) => {
+                let duration = e.duration();
+                -(duration.as_secs() as f64 + duration.subsec_nanos() as f64 * 1e-9)
+            }
+        };
+        Ok(seconds)
+    }
+
+    fn get_size(&self, file_name: &str) -> PyResult<u64> {
+        Ok(fs::metadata(file_name)?.len())
+    }
+
     fn read(&self, file_name: &str) -> PyResult<String> {
         // Python files are assumed UTF-8 by default (PEP 686), but they can specify an alternative
         // encoding, which we need to take into account here.
@@ -134,14 +231,73 @@ impl FileSystem for RealBasicFileSystem {
         }
     }
 
+    fn read_bytes(&self, file_name: &str) -> PyResult<FileBytes> {
+        let file = File::open(file_name)?;
+        if file.metadata()?.len() == 0 {
+            // Empty files can't be memory-mapped.
+            return Ok(FileBytes::Owned(vec![]));
+        }
+        // Safety: the mapped file must not be modified while the map is alive. Grimp only maps
+        // files in its cache directory, which are replaced by renaming or appended to, neither
+        // of which modifies the mapped bytes. (Windows doesn't allow a mapped file to be
+        // replaced at all, so Grimp drops its own maps of a file before replacing it.)
+        let mmap = unsafe { Mmap::map(&file)? };
+        Ok(FileBytes::Mapped(mmap))
+    }
+
     fn write(&mut self, file_name: &str, contents: &str) -> PyResult<()> {
+        self.write_bytes(file_name, contents.as_bytes())
+    }
+
+    /// Write the file atomically, by writing to a temporary file and then renaming it, so that
+    /// concurrent readers never see a partially written file.
+    fn write_bytes(&mut self, file_name: &str, contents: &[u8]) -> PyResult<()> {
         let file_path: PathBuf = file_name.into();
         if let Some(patent_dir) = file_path.parent() {
             fs::create_dir_all(patent_dir)?;
         }
-        File::create(file_path)?
-            .write_all(contents.as_bytes())
-            .map_err(Into::into)
+        let temporary_file_path: PathBuf = format!(
+            "{file_name}.{}.{}.tmp",
+            process::id(),
+            TEMPORARY_FILE_COUNTER.fetch_add(1, Ordering::Relaxed)
+        )
+        .into();
+        let result = File::create(&temporary_file_path)
+            .and_then(|mut file| file.write_all(contents))
+            .and_then(|_| fs::rename(&temporary_file_path, &file_path));
+        if result.is_err() {
+            let _ = fs::remove_file(&temporary_file_path);
+        }
+        result.map_err(Into::into)
+    }
+
+    /// Append to the file with a single write. Unlike write_bytes, this isn't atomic:
+    /// concurrent readers may see the contents partially written.
+    fn append_bytes(&mut self, file_name: &str, contents: &[u8]) -> PyResult<()> {
+        let file_path: PathBuf = file_name.into();
+        if let Some(parent_dir) = file_path.parent() {
+            fs::create_dir_all(parent_dir)?;
+        }
+        let mut file = OpenOptions::new()
+            .create(true)
+            .append(true)
+            .open(file_path)?;
+        file.write_all(contents)?;
+        Ok(())
+    }
+
+    fn lock(&self, file_name: &str) -> PyResult<FileLock> {
+        let file_path: PathBuf = file_name.into();
+        if let Some(parent_dir) = file_path.parent() {
+            fs::create_dir_all(parent_dir)?;
+        }
+        let file = OpenOptions::new()
+            .create(true)
+            .truncate(false)
+            .write(true)
+            .open(file_path)?;
+        file.lock()?;
+        Ok(FileLock { _file: Some(file) })
     }
 }
 
@@ -172,6 +328,10 @@ impl PyRealBasicFileSystem {
         self.inner.exists(file_name)
     }
 
+    fn get_mtime(&self, file_name: &str) -> PyResult<f64> {
+        self.inner.get_mtime(file_name)
+    }
+
     fn read(&self, file_name: &str) -> PyResult<String> {
         self.inner.read(file_name)
     }
@@ -179,13 +339,46 @@ impl PyRealBasicFileSystem {
     fn write(&mut self, file_name: &str, contents: &str) -> PyResult<()> {
         self.inner.write(file_name, contents)
     }
+
+    fn lock(&self, py: Python<'_>, file_name: &str) -> PyResult<PyFileLock> {
+        let lock = py.detach(|| self.inner.lock(file_name))?;
+        Ok(PyFileLock { lock: Some(lock) })
+    }
+}
+
+/// An advisory lock on a file, to be used as a context manager.
+#[pyclass(name = "FileLock")]
+pub struct PyFileLock {
+    lock: Option<FileLock>,
 }
 
-type FileSystemContents = HashMap<String, String>;
+#[pymethods]
+impl PyFileLock {
+    fn __enter__(slf: PyRef<'_, Self>) -> PyRef<'_, Self> {
+        slf
+    }
+
+    fn __exit__(
+        &mut self,
+        _exc_type: Bound<'_, PyAny>,
+        _exc_value: Bound<'_, PyAny>,
+        _traceback: Bound<'_, PyAny>,
+    ) {
+        self.release();
+    }
+
+    /// Release the lock, if it hasn't been released already.
+    fn release(&mut self) {
+        self.lock = None;
+    }
+}
+
+type FileSystemContents = HashMap<String, Vec<u8>>;
 
 #[derive(Clone)]
 struct FakeBasicFileSystem {
     contents: Arc<Mutex<FileSystemContents>>,
+    mtimes: Arc<Mutex<HashMap<String, f64>>>,
 }
 
 // Implements BasicFileSystem (defined in grimp.application.ports.filesystem.BasicFileSystem).
@@ -195,20 +388,28 @@ pub struct PyFakeBasicFileSystem {
 }
 
 impl FakeBasicFileSystem {
-    fn new(contents: Option<&str>, content_map: Option<HashMap<String, String>>) -> PyResult<Self> {
-        let mut parsed_contents = match contents {
-            Some(contents) => parse_indented_file_system_string(contents),
+    fn new(
+        contents: Option<&str>,
+        content_map: Option<HashMap<String, String>>,
+        mtime_map: Option<HashMap<String, f64>>,
+    ) -> PyResult<Self> {
+        let mut parsed_contents: FileSystemContents = match contents {
+            Some(contents) => parse_indented_file_system_string(contents)
+                .into_iter()
+                .map(|(key, val)| (key, val.into_bytes()))
+                .collect(),
             None => HashMap::new(),
         };
         if let Some(content_map) = content_map {
-            let unindented_map: HashMap<String, String> = content_map
+            let unindented_map: FileSystemContents = content_map
                 .into_iter()
-                .map(|(key, val)| (key, unindent(&val).trim().to_string()))
+                .map(|(key, val)| (key, unindent(&val).trim().to_string().into_bytes()))
                 .collect();
             parsed_contents.extend(unindented_map);
         };
         Ok(FakeBasicFileSystem {
             contents: Arc::new(Mutex::new(parsed_contents)),
+            mtimes: Arc::new(Mutex::new(mtime_map.unwrap_or_default())),
         })
     }
 }
@@ -253,31 +454,109 @@ impl FileSystem for FakeBasicFileSystem {
         self.contents.lock().unwrap().contains_key(file_name)
     }
 
+    fn list_directory(&self, directory: &str) -> (Vec<String>, Vec<String>) {
+        // Directories aren't stored explicitly, so derive them from the file paths.
+        let prefix = format!("{}/", directory.trim_end_matches('/'));
+        let mut subdirectories: Vec<String> = vec![];
+        let mut file_names: Vec<String> = vec![];
+        let contents = self.contents.lock().unwrap();
+        for file_path in contents.keys() {
+            let Some(relative_path) = file_path.strip_prefix(&prefix) else {
+                continue;
+            };
+            match relative_path.split_once('/') {
+                Some((subdirectory, _)) => subdirectories.push(subdirectory.to_string()),
+                None => file_names.push(relative_path.to_string()),
+            }
+        }
+        subdirectories.sort();
+        subdirectories.dedup();
+        file_names.sort();
+        (subdirectories, file_names)
+    }
+
+    fn get_mtime(&self, file_name: &str) -> PyResult<f64> {
+        if !self.exists(file_name) {
+            return Err(PyFileNotFoundError::new_err(format!(
+                "{file_name} does not exist."
+            )));
+        }
+        Ok(*self
+            .mtimes
+            .lock()
+            .unwrap()
+            .get(file_name)
+            .unwrap_or(&DEFAULT_FAKE_MTIME))
+    }
+
+    fn get_size(&self, file_name: &str) -> PyResult<u64> {
+        match self.contents.lock().unwrap().get(file_name) {
+            Some(file_contents) => Ok(file_contents.len() as u64),
+            None => Err(PyFileNotFoundError::new_err(format!(
+                "{file_name} does not exist."
+            ))),
+        }
+    }
+
     fn read(&self, file_name: &str) -> PyResult<String> {
+        let FileBytes::Owned(bytes) = self.read_bytes(file_name)? else {
+            unreachable!("Fake file system contents are never memory-mapped.")
+        };
+        String::from_utf8(bytes).map_err(|e| {
+            PyUnicodeDecodeError::new_err(format!(
+                "Failed to decode file {file_name} as UTF-8: {e}"
+            ))
+        })
+    }
+
+    fn read_bytes(&self, file_name: &str) -> PyResult<FileBytes> {
         let contents = self.contents.lock().unwrap();
         match contents.get(file_name) {
-            Some(file_contents) => Ok(file_contents.clone()),
+            Some(file_contents) => Ok(FileBytes::Owned(file_contents.clone())),
             None => Err(PyFileNotFoundError::new_err(format!(
                 "No such file: {file_name}"
             ))),
         }
     }
 
-    #[allow(unused_variables)]
     fn write(&mut self, file_name: &str, contents: &str) -> PyResult<()> {
+        self.write_bytes(file_name, contents.as_bytes())
+    }
+
+    fn write_bytes(&mut self, file_name: &str, contents: &[u8]) -> PyResult<()> {
+        let mut contents_mut = self.contents.lock().unwrap();
+        contents_mut.insert(file_name.to_string(), contents.to_vec());
+        self.mtimes.lock().unwrap().remove(file_name);
+        Ok(())
+    }
+
+    fn append_bytes(&mut self, file_name: &str, contents: &[u8]) -> PyResult<()> {
         let mut contents_mut = self.contents.lock().unwrap();
-        contents_mut.insert(file_name.to_string(), contents.to_string());
+        contents_mut
+            .entry(file_name.to_string())
+            .or_default()
+            .extend_from_slice(contents);
+        self.mtimes.lock().unwrap().remove(file_name);
         Ok(())
     }
+
+    /// Locking is a no-op, as fake file systems are only used within a single process.
+    fn lock(&self, _file_name: &str) -> PyResult<FileLock> {
+        Ok(FileLock { _file: None })
+    }
 }
 
 #[pymethods]
 impl PyFakeBasicFileSystem {
-    #[pyo3(signature = (contents=None, content_map=None))]
+    #[pyo3(signature = (contents=None, content_map=None, mtime_map=None))]
     #[new]
-    fn new(contents: Option<&str>, content_map: Option<HashMap<String, String>>) -> PyResult<Self> {
+    fn new(
+        contents: Option<&str>,
+        content_map: Option<HashMap<String, String>>,
+        mtime_map: Option<HashMap<String, f64>>,
+    ) -> PyResult<Self> {
         Ok(PyFakeBasicFileSystem {
-            inner: FakeBasicFileSystem::new(contents, content_map)?,
+            inner: FakeBasicFileSystem::new(contents, content_map, mtime_map)?,
         })
     }
 
@@ -300,6 +579,10 @@ impl PyFakeBasicFileSystem {
         self.inner.exists(file_name)
     }
 
+    fn get_mtime(&self, file_name: &str) -> PyResult<f64> {
+        self.inner.get_mtime(file_name)
+    }
+
     fn read(&self, file_name: &str) -> PyResult<String> {
         self.inner.read(file_name)
     }
@@ -308,6 +591,11 @@ impl PyFakeBasicFileSystem {
         self.inner.write(file_name, contents)
     }
 
+    fn lock(&self, file_name: &str) -> PyResult<PyFileLock> {
+        let lock = self.inner.lock(file_name)?;
+        Ok(PyFileLock { lock: Some(lock) })
+    }
+
     // Temporary workaround method for Python tests.
     fn convert_to_basic(&self) -> PyResult<Self> {
         Ok(PyFakeBasicFileSystem {
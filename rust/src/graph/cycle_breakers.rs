@@ -1,9 +1,10 @@
 use crate::errors::GrimpResult;
 
 use crate::graph::{Graph, ModuleToken};
+use rayon::prelude::*;
 use rustc_hash::{FxHashMap, FxHashSet};
 use slotmap::SecondaryMap;
-use std::cmp::Ordering;
+use std::collections::{BTreeSet, VecDeque};
 
 impl Graph {
     pub fn nominate_cycle_breakers(
@@ -18,232 +19,421 @@ impl Graph {
         if children.len() < 2 {
             return Ok(FxHashSet::default());
         }
-        let (orig_imports, orig_reverse_imports, edge_weights) =
-            self.build_graph_maps_of_children(children);
-
-        // Make a copy of the graph. We'll iteratively remove nodes from this.
-        let mut working_imports = orig_imports.clone();
-        let mut working_reverse_imports = orig_reverse_imports.clone();
-
-        // Iteratively extract sources into a vec.
-        let mut sources: Vec<ModuleToken> = vec![];
+        let dependencies = self.build_dependencies_between_children(children);
+        Ok(dependencies.nominate_cycle_breakers())
+    }
 
-        loop {
-            let current_sources: Vec<ModuleToken> = working_reverse_imports
-                .iter()
-                .filter(|(_imported, importers)| importers.is_empty())
-                .map(|(source, _)| source)
-                .collect();
+    /// Nominates cycle breakers for each of the packages, or for every visible package in the
+    /// graph if none are passed. Packages with no cycle breakers are left out.
+    ///
+    /// Each import is between two children of exactly one package: the closest package that
+    /// contains both its modules. So the imports between the children of all the packages are
+    /// found in a single pass over the graph, after which the packages are ordered in parallel.
+    pub fn nominate_cycle_breakers_by_package(
+        &self,
+        packages: Option<&FxHashSet<ModuleToken>>,
+    ) -> FxHashMap<ModuleToken, FxHashSet<(ModuleToken, ModuleToken)>> {
+        let packages: Vec<ModuleToken> = match packages {
+            Some(packages) => packages.iter().copied().collect(),
+            None => self
+                .modules
+                .values()
+                .filter(|module| !module.is_invisible())
+                .map(|module| module.token())
+                .collect(),
+        };
 
-            if current_sources.is_empty() {
-                break;
+        let mut ranks_by_child = SecondaryMap::default();
+        let mut imports_between_children_by_package: SecondaryMap<
+            ModuleToken,
+            (
+                usize,
+                FxHashMap<(u32, u32), Vec<(ModuleToken, ModuleToken)>>,
+            ),
+        > = SecondaryMap::default();
+        for package in packages {
+            let Some(children) = self.module_children.get(package) else {
+                continue;
+            };
+            if children.len() < 2 {
+                continue;
             }
+            let mut children: Vec<_> = children.iter().copied().collect();
+            children.sort_unstable_by_key(|child| self.module_name(*child));
+            for (rank, child) in children.iter().enumerate() {
+                ranks_by_child.insert(*child, rank as u32);
+            }
+            imports_between_children_by_package
+                .insert(package, (children.len(), FxHashMap::default()));
+        }
 
-            sources.extend(current_sources);
-            // Remove sources from graph, then try again for another round.
-            for source in sources.iter() {
-                remove_module_from_graph(
-                    source,
-                    &mut working_imports,
-                    &mut working_reverse_imports,
-                );
+        for importer in self.modules.keys() {
+            for imported in self.modules_directly_imported_by(importer) {
+                if let Some((package, importer_child, imported_child)) =
+                    self.find_children_of_closest_common_package(importer, imported)
+                    && let Some((_, imports_between)) =
+                        imports_between_children_by_package.get_mut(package)
+                {
+                    imports_between
+                        .entry((
+                            ranks_by_child[importer_child],
+                            ranks_by_child[imported_child],
+                        ))
+                        .or_default()
+                        .push((importer, imported));
+                }
             }
         }
 
-        // Iteratively extract sinks into a vec.
-        let mut sinks: Vec<ModuleToken> = vec![];
-        loop {
-            let new_sinks: Vec<ModuleToken> = working_imports
-                .iter()
-                .filter(|(_importer, importeds)| importeds.is_empty())
-                .map(|(sink, _)| sink)
-                .collect();
+        imports_between_children_by_package
+            .into_iter()
+            .collect::<Vec<_>>()
+            .into_par_iter()
+            .map(|(package, (child_count, imports_between))| {
+                let dependencies = ChildDependencies::new(child_count, imports_between);
+                (package, dependencies.nominate_cycle_breakers())
+            })
+            .filter(|(_, cycle_breakers)| !cycle_breakers.is_empty())
+            .collect()
+    }
 
-            if new_sinks.is_empty() {
-                break;
+    /// Finds the closest package that contains both modules, along with the children of that
+    /// package that are (or contain) each module.
+    ///
+    /// Returns `None` if either module contains the other, or if no package contains both.
+    fn find_children_of_closest_common_package(
+        &self,
+        module: ModuleToken,
+        other_module: ModuleToken,
+    ) -> Option<(ModuleToken, ModuleToken, ModuleToken)> {
+        let parent = |module| self.module_parents.get(module).copied().flatten();
+        let depth = |mut module| {
+            let mut depth = 0;
+            while let Some(module_parent) = parent(module) {
+                module = module_parent;
+                depth += 1;
             }
+            depth
+        };
 
-            // Remove sinks from graph, then try again for another round.
-            for sink in new_sinks.iter() {
-                remove_module_from_graph(sink, &mut working_imports, &mut working_reverse_imports);
+        let (mut module, mut other_module) = (module, other_module);
+        let (mut module_depth, mut other_module_depth) = (depth(module), depth(other_module));
+        while module_depth > other_module_depth {
+            module = parent(module)?;
+            module_depth -= 1;
+        }
+        while other_module_depth > module_depth {
+            other_module = parent(other_module)?;
+            other_module_depth -= 1;
+        }
+        if module == other_module {
+            return None;
+        }
+        loop {
+            let (module_parent, other_module_parent) = (parent(module)?, parent(other_module)?);
+            if module_parent == other_module_parent {
+                return Some((module_parent, module, other_module));
             }
-            // Add the new sinks to the beginning of sinks - these need to appear earlier in
-            // the overall order, as they depend on the sinks previously found.
-            sinks.splice(0..0, new_sinks);
-            //sinks.extend(new_sinks);
+            module = module_parent;
+            other_module = other_module_parent;
         }
+    }
 
-        // Iteratively extract remaining nodes, based on out-degree - in-degree.
-        let mut middle: Vec<ModuleToken> = vec![];
-        loop {
-            if working_imports.is_empty() {
-                // We've finished ordering the nodes.
-                break;
+    /// Finds the imports between each pair of children, with each child standing for itself and
+    /// its descendants.
+    fn build_dependencies_between_children(
+        &self,
+        children: &FxHashSet<ModuleToken>,
+    ) -> ChildDependencies {
+        // Children are identified by their alphabetical rank, which is used to break ties.
+        let mut children: Vec<_> = children.iter().copied().collect();
+        children.sort_unstable_by_key(|child| self.module_name(*child));
+
+        let mut ranks_by_module = SecondaryMap::default();
+        for (rank, child) in children.iter().enumerate() {
+            let rank = rank as u32;
+            ranks_by_module.insert(*child, rank);
+            for descendant in self.get_module_descendants(*child) {
+                ranks_by_module.insert(descendant.token(), rank);
             }
+        }
 
-            // Initialize with the first node.
-            let mut node_with_highest_difference: Option<ModuleToken> = None;
-            let mut highest_difference_so_far: Option<isize> = None;
-
-            for (candidate, _) in working_imports.iter() {
-                let difference = calculate_degree_difference(
-                    &candidate,
-                    &working_imports,
-                    &working_reverse_imports,
-                    &edge_weights,
-                );
-
-                match node_with_highest_difference {
-                    Some(incumbent) => {
-                        match difference.cmp(&highest_difference_so_far.unwrap()) {
-                            Ordering::Greater => {
-                                highest_difference_so_far = Some(difference);
-                                node_with_highest_difference = Some(candidate);
-                            }
-                            Ordering::Equal => {
-                                // Tie breaker - choose the earlier one alphabetically.
-                                let incumbent_name = self.get_module(incumbent).unwrap().name();
-                                let candidate_name = self.get_module(candidate).unwrap().name();
-
-                                if candidate_name < incumbent_name {
-                                    highest_difference_so_far = Some(difference);
-                                    node_with_highest_difference = Some(candidate);
-                                }
-                            }
-                            Ordering::Less => {}
-                        }
-                    }
-                    None => {
-                        node_with_highest_difference = Some(candidate);
-                        highest_difference_so_far = Some(difference);
-                    }
+        let mut imports_between: FxHashMap<(u32, u32), Vec<(ModuleToken, ModuleToken)>> =
+            FxHashMap::default();
+        for (module, rank) in ranks_by_module.iter() {
+            for imported in self.modules_directly_imported_by(module) {
+                if let Some(imported_rank) = ranks_by_module.get(imported)
+                    && imported_rank != rank
+                {
+                    imports_between
+                        .entry((*rank, *imported_rank))
+                        .or_default()
+                        .push((module, imported));
                 }
             }
+        }
 
-            // Extract node with highest difference to one of the two middle vecs.
-            let node_with_highest_difference = node_with_highest_difference.unwrap();
+        ChildDependencies::new(children.len(), imports_between)
+    }
+}
 
-            // Prioritize high out-degree.
-            middle.push(node_with_highest_difference);
-            remove_module_from_graph(
-                &node_with_highest_difference,
-                &mut working_imports,
-                &mut working_reverse_imports,
-            );
+/// The dependencies between the children of a package, where the weight of each dependency is
+/// the number of imports it is made up of.
+struct ChildDependencies {
+    // The children that each child imports, along with the weight of each dependency.
+    imports: Vec<Vec<(u32, usize)>>,
+    // The children that import each child, along with the weight of each dependency.
+    reverse_imports: Vec<Vec<(u32, usize)>>,
+    imports_between: FxHashMap<(u32, u32), Vec<(ModuleToken, ModuleToken)>>,
+}
+
+impl ChildDependencies {
+    fn new(
+        child_count: usize,
+        imports_between: FxHashMap<(u32, u32), Vec<(ModuleToken, ModuleToken)>>,
+    ) -> Self {
+        let mut imports = vec![vec![]; child_count];
+        let mut reverse_imports = vec![vec![]; child_count];
+        for ((importer, imported), imports_of_dependency) in &imports_between {
+            let weight = imports_of_dependency.len();
+            imports[*importer as usize].push((*imported, weight));
+            reverse_imports[*imported as usize].push((*importer, weight));
+        }
+        ChildDependencies {
+            imports,
+            reverse_imports,
+            imports_between,
+        }
+    }
+
+    /// Nominates the imports that point backwards in the ordering found by `order_children`.
+    fn nominate_cycle_breakers(&self) -> FxHashSet<(ModuleToken, ModuleToken)> {
+        let positions = self.order_children();
+        self.imports_between
+            .iter()
+            .filter(|((importer, imported), _)| {
+                positions[*imported as usize] < positions[*importer as usize]
+            })
+            .flat_map(|(_, imports_of_dependency)| imports_of_dependency.iter().copied())
+            .collect()
+    }
+
+    /// Orders the children so that as few imports as possible point backwards, using the
+    /// heuristic of Eades, Lin and Smyth, and returns the position of each child.
+    ///
+    /// Sources are repeatedly taken from the front, and then sinks from the back. Of the children
+    /// that remain, the one that most imports more than it is imported (in weight) is repeatedly
+    /// taken next, with ties going to the alphabetically earliest. Each step is constant time,
+    /// apart from the tie-breaks, so the whole ordering is close to linear in the size of the
+    /// dependency graph.
+    fn order_children(&self) -> Vec<u32> {
+        let child_count = self.imports.len();
+        let mut positions = vec![0; child_count];
+        let mut removed = vec![false; child_count];
+        let mut next_front_position = 0;
+        let mut next_back_position = child_count as u32;
+
+        // Sources.
+        let mut in_degrees: Vec<_> = self.reverse_imports.iter().map(Vec::len).collect();
+        let mut queue: VecDeque<_> = (0..child_count as u32)
+            .filter(|child| in_degrees[*child as usize] == 0)
+            .collect();
+        while let Some(source) = queue.pop_front() {
+            removed[source as usize] = true;
+            positions[source as usize] = next_front_position;
+            next_front_position += 1;
+            for (imported, _) in &self.imports[source as usize] {
+                in_degrees[*imported as usize] -= 1;
+                if in_degrees[*imported as usize] == 0 {
+                    queue.push_back(*imported);
+                }
+            }
         }
-        if !working_reverse_imports.is_empty() {
-            panic!("Expected reverse imports also to be empty.");
-        }
-
-        // Combine sources + ordered + sinks.
-        let full_ordering: Vec<_> = sources.into_iter().chain(middle).chain(sinks).collect();
-        // Iterate through all edges in original graph.
-        // If the edge points leftwards in the full ordering, it is a circuit breaker.
-        let mut package_cycle_breakers: Vec<(ModuleToken, ModuleToken)> = vec![];
-        for (importer, importeds) in orig_imports.iter() {
-            for imported in importeds.iter() {
-                let importer_position = get_module_position(&full_ordering, &importer).unwrap();
-                let imported_position = get_module_position(&full_ordering, imported).unwrap();
-                if imported_position < importer_position {
-                    package_cycle_breakers.push((importer, *imported));
+
+        // Sinks. These depend on the sinks found before them, so go in front of them.
+        let mut out_degrees: Vec<_> = self
+            .imports
+            .iter()
+            .map(|imported| {
+                imported
+                    .iter()
+                    .filter(|(imported, _)| !removed[*imported as usize])
+                    .count()
+            })
+            .collect();
+        let mut queue: VecDeque<_> = (0..child_count as u32)
+            .filter(|child| !removed[*child as usize] && out_degrees[*child as usize] == 0)
+            .collect();
+        while let Some(sink) = queue.pop_front() {
+            removed[sink as usize] = true;
+            next_back_position -= 1;
+            positions[sink as usize] = next_back_position;
+            for (importer, _) in &self.reverse_imports[sink as usize] {
+                if removed[*importer as usize] {
+                    continue;
+                }
+                out_degrees[*importer as usize] -= 1;
+                if out_degrees[*importer as usize] == 0 {
+                    queue.push_back(*importer);
                 }
             }
         }
 
-        // Expand the package cycle breakers to the specific imports from the unsquashed graph.
-        let mut cycle_breakers = FxHashSet::default();
-        for (importer, imported) in package_cycle_breakers {
-            cycle_breakers.extend(
-                self.find_direct_imports_between(importer, imported, true)
-                    .unwrap(),
-            );
+        // The rest, by weighted out-degree minus in-degree. The children with each difference
+        // are kept in a bucket, ordered by rank.
+        let weight_to_remaining = |dependencies: &[(u32, usize)]| -> isize {
+            dependencies
+                .iter()
+                .filter(|(child, _)| !removed[*child as usize])
+                .map(|(_, weight)| *weight as isize)
+                .sum()
+        };
+        let remaining: Vec<u32> = (0..child_count as u32)
+            .filter(|child| !removed[*child as usize])
+            .collect();
+        if remaining.is_empty() {
+            return positions;
+        }
+        let mut differences = vec![0; child_count];
+        let (mut lowest_difference, mut highest_difference) = (0, 0);
+        for child in &remaining {
+            let out_degree = weight_to_remaining(&self.imports[*child as usize]);
+            let in_degree = weight_to_remaining(&self.reverse_imports[*child as usize]);
+            differences[*child as usize] = out_degree - in_degree;
+            // A child's difference can only rise to its out-degree, or fall to minus its in-degree.
+            highest_difference = highest_difference.max(out_degree);
+            lowest_difference = lowest_difference.min(-in_degree);
+        }
+        let bucket_index = |difference: isize| (difference - lowest_difference) as usize;
+        let mut buckets = vec![BTreeSet::new(); bucket_index(highest_difference) + 1];
+        for child in &remaining {
+            buckets[bucket_index(differences[*child as usize])].insert(*child);
         }
 
-        Ok(cycle_breakers)
-    }
+        let mut highest_bucket = buckets.len() - 1;
+        for _ in 0..remaining.len() {
+            while buckets[highest_bucket].is_empty() {
+                highest_bucket -= 1;
+            }
+            let child = buckets[highest_bucket].pop_first().unwrap();
+            removed[child as usize] = true;
+            positions[child as usize] = next_front_position;
+            next_front_position += 1;
 
-    // These maps represent the local graph. Each module appears as a key in the maps,
-    // with empty sets if they have no imports to / from.
-    // They are denormalized into two maps for fast lookups.
-    #[allow(clippy::type_complexity)]
-    fn build_graph_maps_of_children(
-        &self,
-        children: &FxHashSet<ModuleToken>,
-    ) -> (
-        SecondaryMap<ModuleToken, FxHashSet<ModuleToken>>, // Imports
-        SecondaryMap<ModuleToken, FxHashSet<ModuleToken>>, // Reverse imports
-        FxHashMap<(ModuleToken, ModuleToken), usize>,      // Weights
-    ) {
-        let mut orig_imports: SecondaryMap<ModuleToken, FxHashSet<ModuleToken>> =
-            SecondaryMap::default();
-        let mut orig_reverse_imports: SecondaryMap<ModuleToken, FxHashSet<ModuleToken>> =
-            SecondaryMap::default();
-        let mut weights = FxHashMap::default();
-
-        for child in children {
-            orig_imports.insert(*child, FxHashSet::default());
-            orig_reverse_imports.insert(*child, FxHashSet::default());
-        }
-        // Get number of imports between each child.
-        // Add as edges.
-        for child_a in children {
-            for child_b in children.iter().filter(|child| *child != child_a) {
-                // Get number of imports from child_a to child_b (as package).
-                let num_imports_from_a_to_b = self
-                    .find_direct_imports_between(*child_a, *child_b, true)
-                    .unwrap()
-                    .len();
-
-                if num_imports_from_a_to_b > 0 {
-                    // a depends on b - add it as an edge in our temporary graph.
-                    orig_imports[*child_a].insert(*child_b);
-                    orig_reverse_imports[*child_b].insert(*child_a);
-                    weights.insert((*child_a, *child_b), num_imports_from_a_to_b);
+            for (importer, weight) in &self.reverse_imports[child as usize] {
+                if !removed[*importer as usize] {
+                    let difference = &mut differences[*importer as usize];
+                    buckets[bucket_index(*difference)].remove(importer);
+                    *difference -= *weight as isize;
+                    buckets[bucket_index(*difference)].insert(*importer);
+                }
+            }
+            for (imported, weight) in &self.imports[child as usize] {
+                if !removed[*imported as usize] {
+                    let difference = &mut differences[*imported as usize];
+                    buckets[bucket_index(*difference)].remove(imported);
+                    *difference += *weight as isize;
+                    highest_bucket = highest_bucket.max(bucket_index(*difference));
+                    buckets[bucket_index(*difference)].insert(*imported);
                 }
             }
         }
-        (orig_imports, orig_reverse_imports, weights)
+
+        positions
     }
 }
 
-/// Removes the module from the graph, along with any imports to or from it.
-fn remove_module_from_graph(
-    module: &ModuleToken,
-    imports: &mut SecondaryMap<ModuleToken, FxHashSet<ModuleToken>>,
-    reverse_imports: &mut SecondaryMap<ModuleToken, FxHashSet<ModuleToken>>,
-) {
-    imports.remove(*module);
-    for (_, importeds) in imports.iter_mut() {
-        importeds.remove(module);
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::graph::test_utils::build_graph;
+
+    fn nominate_cycle_breakers(graph: &Graph, package: &str) -> Vec<(String, String)> {
+        let package = graph.get_module_by_name(package).unwrap().token();
+        let mut cycle_breakers: Vec<_> = graph
+            .nominate_cycle_breakers(package)
+            .unwrap()
+            .into_iter()
+            .map(|(importer, imported)| {
+                (
+                    graph.module_name(importer).to_owned(),
+                    graph.module_name(imported).to_owned(),
+                )
+            })
+            .collect();
+        cycle_breakers.sort();
+        cycle_breakers
     }
-    reverse_imports.remove(*module);
-    for (_, importers) in reverse_imports.iter_mut() {
-        importers.remove(module);
+
+    #[test]
+    fn test_breaks_lighter_dependency() {
+        let graph = build_graph(&[
+            ("pkg.a.one", "pkg.b"),
+            ("pkg.a.two", "pkg.b"),
+            ("pkg.b", "pkg.a"),
+            // Sources and sinks are never part of a cycle.
+            ("pkg.source", "pkg.a"),
+            ("pkg.b", "pkg.sink"),
+        ]);
+
+        assert_eq!(
+            nominate_cycle_breakers(&graph, "pkg"),
+            vec![("pkg.b".to_owned(), "pkg.a".to_owned())]
+        );
     }
-}
 
-/// Removes the module from the graph, along with any imports to or from it.
-fn calculate_degree_difference(
-    module: &ModuleToken,
-    imports: &SecondaryMap<ModuleToken, FxHashSet<ModuleToken>>,
-    reverse_imports: &SecondaryMap<ModuleToken, FxHashSet<ModuleToken>>,
-    edge_weights: &FxHashMap<(ModuleToken, ModuleToken), usize>,
-) -> isize {
-    let importer_modules = &reverse_imports[*module];
-    let imported_modules = &imports[*module];
-
-    let indegree: isize = importer_modules
-        .iter()
-        .map(|importer| edge_weights[&(*importer, *module)] as isize)
-        .sum();
-    let outdegree: isize = imported_modules
-        .iter()
-        .map(|imported| edge_weights[&(*module, *imported)] as isize)
-        .sum();
-
-    outdegree - indegree
-}
+    #[test]
+    fn test_nominate_cycle_breakers_by_package_matches_each_package() {
+        let mut graph = build_graph(&[
+            // Between the children of pkg.
+            ("pkg.a.one", "pkg.b"),
+            ("pkg.b.two", "pkg.a.three"),
+            // Between the children of pkg.a.
+            ("pkg.a.one", "pkg.a.three.four"),
+            ("pkg.a.three", "pkg.a.one"),
+            // Between a package and its descendants, so not between any children.
+            ("pkg.b", "pkg.b.two"),
+            ("pkg.b.two", "pkg"),
+            // No package in common.
+            ("pkg.b", "other.c"),
+            ("other", "pkg.a"),
+        ]);
+        for package in ["pkg", "pkg.a", "pkg.b", "other"] {
+            graph.get_or_add_module(package);
+        }
 
-fn get_module_position(vec: &[ModuleToken], module: &ModuleToken) -> Option<usize> {
-    vec.iter().position(|&i| i == *module)
+        let cycle_breakers_by_package = graph.nominate_cycle_breakers_by_package(None);
+
+        let mut packages: Vec<_> = cycle_breakers_by_package
+            .keys()
+            .map(|package| graph.module_name(*package))
+            .collect();
+        packages.sort();
+        assert_eq!(packages, vec!["pkg", "pkg.a"]);
+        for (package, cycle_breakers) in &cycle_breakers_by_package {
+            assert_eq!(
+                *cycle_breakers,
+                graph.nominate_cycle_breakers(*package).unwrap()
+            );
+        }
+
+        let pkg_a = graph.get_module_by_name("pkg.a").unwrap().token();
+        let cycle_breakers_by_package =
+            graph.nominate_cycle_breakers_by_package(Some(&FxHashSet::from_iter([pkg_a])));
+        assert_eq!(
+            cycle_breakers_by_package.keys().collect::<Vec<_>>(),
+            vec![&pkg_a]
+        );
+    }
+
+    #[test]
+    fn test_ties_are_broken_alphabetically() {
+        let graph = build_graph(&[("pkg.a", "pkg.b"), ("pkg.b", "pkg.c"), ("pkg.c", "pkg.a")]);
+
+        // Each child imports as much as it is imported, so pkg.a goes first, and then pkg.b.
+        assert_eq!(
+            nominate_cycle_breakers(&graph, "pkg"),
+            vec![("pkg.c".to_owned(), "pkg.a".to_owned())]
+        );
+    }
 }
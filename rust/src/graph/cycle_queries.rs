@@ -0,0 +1,236 @@
+use crate::graph::pathfinding::find_strongly_connected_components;
+use crate::graph::{Graph, ModuleToken};
+use indexmap::IndexMap;
+use rustc_hash::{FxHashSet, FxHasher};
+use slotmap::SecondaryMap;
+use std::hash::BuildHasherDefault;
+
+type FxIndexMap<K, V> = IndexMap<K, V, BuildHasherDefault<FxHasher>>;
+
+impl Graph {
+    /// Finds the groups of modules that import each other, even indirectly.
+    ///
+    /// If a package is passed, each of its children stands for itself and its descendants, and
+    /// only the groups of children are found. Otherwise, the groups are found across all the
+    /// modules in the graph. Modules that aren't part of a cycle are not included, but a module
+    /// that imports itself is a group of its own.
+    pub fn find_strongly_connected_components(
+        &self,
+        package: Option<ModuleToken>,
+    ) -> Vec<Vec<ModuleToken>> {
+        match package {
+            Some(package) => {
+                let imports_of_children = self.build_imports_map_of_children(package);
+                find_cyclic_components(imports_of_children.keys(), |child| {
+                    imports_of_children[child].iter().copied()
+                })
+            }
+            None => find_cyclic_components(self.modules.keys(), |module| {
+                self.modules_directly_imported_by(module)
+            }),
+        }
+    }
+
+    /// Finds one cycle of imports within each group of modules that import each other.
+    ///
+    /// Each cycle starts at the alphabetically first module in its group, and is a shortest cycle
+    /// through that module. Each module in the cycle imports the next, and the last imports the
+    /// first. Packages are treated as in `find_strongly_connected_components`.
+    pub fn find_cycles(&self, package: Option<ModuleToken>) -> Vec<Vec<ModuleToken>> {
+        match package {
+            Some(package) => {
+                let imports_of_children = self.build_imports_map_of_children(package);
+                self.find_cycles_between(imports_of_children.keys(), |child| {
+                    imports_of_children[child].iter().copied()
+                })
+            }
+            None => self.find_cycles_between(self.modules.keys(), |module| {
+                self.modules_directly_imported_by(module)
+            }),
+        }
+    }
+
+    fn find_cycles_between<I: Iterator<Item = ModuleToken>>(
+        &self,
+        modules: impl IntoIterator<Item = ModuleToken>,
+        imports_of: impl Fn(ModuleToken) -> I,
+    ) -> Vec<Vec<ModuleToken>> {
+        find_cyclic_components(modules, &imports_of)
+            .into_iter()
+            .map(|component| {
+                let start = *component
+                    .iter()
+                    .min_by_key(|module| self.module_name(**module))
+                    .unwrap();
+                find_shortest_cycle(start, &component.into_iter().collect(), &imports_of)
+            })
+            .collect()
+    }
+
+    /// Builds a map of the imports between the package's children, with each child standing for
+    /// itself and its descendants. Every child appears as a key.
+    pub(crate) fn build_imports_map_of_children(
+        &self,
+        package: ModuleToken,
+    ) -> SecondaryMap<ModuleToken, FxHashSet<ModuleToken>> {
+        let mut children_by_module = SecondaryMap::default();
+        let mut imports_map = SecondaryMap::default();
+        for child in self.get_module_children(package) {
+            children_by_module.insert(child.token(), child.token());
+            for descendant in self.get_module_descendants(child.token()) {
+                children_by_module.insert(descendant.token(), child.token());
+            }
+            imports_map.insert(child.token(), FxHashSet::default());
+        }
+
+        for (module, child) in children_by_module.iter() {
+            for imported in self.modules_directly_imported_by(module) {
+                if let Some(imported_child) = children_by_module.get(imported)
+                    && imported_child != child
+                {
+                    imports_map[*child].insert(*imported_child);
+                }
+            }
+        }
+        imports_map
+    }
+}
+
+/// Finds the strongly connected components that contain a cycle: those with more than one
+/// module, or whose one module imports itself.
+fn find_cyclic_components<I: Iterator<Item = ModuleToken>>(
+    modules: impl IntoIterator<Item = ModuleToken>,
+    imports_of: impl Fn(ModuleToken) -> I,
+) -> Vec<Vec<ModuleToken>> {
+    find_strongly_connected_components(modules, &imports_of)
+        .into_iter()
+        .filter(|component| match component.as_slice() {
+            [module] => imports_of(*module).any(|imported| imported == *module),
+            _ => true,
+        })
+        .collect()
+}
+
+/// Finds a shortest cycle through the start module, via a BFS within the supplied modules.
+///
+/// The start module must be part of a cycle within those modules.
+fn find_shortest_cycle<I: Iterator<Item = ModuleToken>>(
+    start: ModuleToken,
+    modules: &FxHashSet<ModuleToken>,
+    imports_of: impl Fn(ModuleToken) -> I,
+) -> Vec<ModuleToken> {
+    let mut predecessors: FxIndexMap<ModuleToken, Option<ModuleToken>> =
+        FxIndexMap::from_iter([(start, None)]);
+
+    let mut i = 0;
+    let last = 'l: loop {
+        let module = *predecessors.get_index(i).unwrap().0;
+        for next_module in imports_of(module) {
+            if next_module == start {
+                break 'l module;
+            }
+            if modules.contains(&next_module) && !predecessors.contains_key(&next_module) {
+                predecessors.insert(next_module, Some(module));
+            }
+        }
+        i += 1;
+    };
+
+    let mut cycle = vec![];
+    let mut node = Some(last);
+    while let Some(n) = node {
+        cycle.push(n);
+        node = predecessors[&n];
+    }
+    cycle.reverse();
+    cycle
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::graph::test_utils::build_graph;
+
+    fn names(graph: &Graph, modules: &[ModuleToken]) -> Vec<String> {
+        modules
+            .iter()
+            .map(|module| graph.module_name(*module).to_owned())
+            .collect()
+    }
+
+    #[test]
+    fn test_find_strongly_connected_components() {
+        let graph = build_graph(&[
+            ("pkg.a", "pkg.b"),
+            ("pkg.b", "pkg.a"),
+            ("pkg.b", "pkg.c"),
+            ("pkg.c", "pkg.d"),
+            ("pkg.d", "pkg.e"),
+            ("pkg.e", "pkg.c"),
+        ]);
+
+        let mut components: Vec<Vec<String>> = graph
+            .find_strongly_connected_components(None)
+            .iter()
+            .map(|component| {
+                let mut component = names(&graph, component);
+                component.sort();
+                component
+            })
+            .collect();
+        components.sort();
+
+        assert_eq!(
+            components,
+            vec![vec!["pkg.a", "pkg.b"], vec!["pkg.c", "pkg.d", "pkg.e"]]
+        );
+    }
+
+    #[test]
+    fn test_find_strongly_connected_components_of_children() {
+        let graph = build_graph(&[
+            ("pkg.a.one", "pkg.b.two"),
+            ("pkg.b.three", "pkg.a"),
+            ("pkg.b.two", "pkg.c"),
+            // Imports within a child don't count.
+            ("pkg.c.four", "pkg.c"),
+        ]);
+        let package = graph.get_module_by_name("pkg").unwrap().token();
+
+        let components = graph.find_strongly_connected_components(Some(package));
+
+        assert_eq!(components.len(), 1);
+        let mut component = names(&graph, &components[0]);
+        component.sort();
+        assert_eq!(component, vec!["pkg.a", "pkg.b"]);
+    }
+
+    #[test]
+    fn test_find_cycles() {
+        let graph = build_graph(&[
+            ("pkg.a", "pkg.b"),
+            ("pkg.b", "pkg.c"),
+            ("pkg.c", "pkg.a"),
+            ("pkg.b", "pkg.a"),
+            ("pkg.c", "pkg.d"),
+        ]);
+
+        let cycles = graph.find_cycles(None);
+
+        assert_eq!(cycles.len(), 1);
+        assert_eq!(names(&graph, &cycles[0]), vec!["pkg.a", "pkg.b"]);
+    }
+
+    #[test]
+    fn test_module_that_imports_itself_is_a_cycle() {
+        let graph = build_graph(&[("pkg.a", "pkg.a"), ("pkg.a", "pkg.b")]);
+
+        let components = graph.find_strongly_connected_components(None);
+        let cycles = graph.find_cycles(None);
+
+        assert_eq!(components.len(), 1);
+        assert_eq!(names(&graph, &components[0]), vec!["pkg.a"]);
+        assert_eq!(cycles.len(), 1);
+        assert_eq!(names(&graph, &cycles[0]), vec!["pkg.a"]);
+    }
+}
@@ -1,14 +1,27 @@
 use crate::errors::{GrimpError, GrimpResult};
 use crate::graph::{
-    EMPTY_IMPORT_DETAILS, EMPTY_MODULE_TOKENS, ExtendWithDescendants, Graph, MODULE_NAMES,
-    ModuleToken, PyImportDetails,
+    EMPTY_IMPORT_DETAILS, EMPTY_MODULE_TOKENS, ExtendWithDescendants, Graph, ModuleToken,
+    PyImportDetails,
 };
 use crate::module_expressions::ModuleExpression;
-use rustc_hash::FxHashSet;
+use itertools::Either;
+use rustc_hash::{FxHashMap, FxHashSet};
+use slotmap::SecondaryMap;
+
+/// What to collapse each module into, for `Graph::collapse_imports`.
+pub enum Collapse<'a> {
+    /// Its ancestor at this depth, where top level modules have a depth of 1.
+    ToDepth(usize),
+    /// The closest of these packages that contains it.
+    ToPackages(&'a FxHashSet<ModuleToken>),
+}
 
 impl Graph {
     pub fn count_imports(&self) -> usize {
-        self.imports.values().map(|imports| imports.len()).sum()
+        match &self.frozen_imports {
+            Some(frozen_imports) => frozen_imports.count(),
+            None => self.imports.values().map(|imports| imports.len()).sum(),
+        }
     }
 
     pub fn direct_import_exists(
@@ -27,12 +40,10 @@ impl Graph {
             }
         }
 
-        let direct_imports = importers
-            .iter()
-            .flat_map(|importer_module| self.imports.get(*importer_module).unwrap().iter().cloned())
-            .collect::<FxHashSet<ModuleToken>>();
-
-        Ok(!(&direct_imports & &importeds).is_empty())
+        Ok(importers.iter().any(|importer_module| {
+            self.modules_directly_imported_by(*importer_module)
+                .any(|imported_module| importeds.contains(&imported_module))
+        }))
     }
 
     pub fn find_direct_imports_between(
@@ -54,27 +65,46 @@ impl Graph {
         }
 
         for importer_module in importers.iter() {
-            if let Some(all_imports_imported_by_this_one) = self.imports.get(*importer_module) {
-                let imports_of_supplied_package: FxHashSet<_> = all_imports_imported_by_this_one
-                    .iter()
-                    .filter(|candidate| importeds.contains(*candidate))
-                    .map(|imported_module| (*importer_module, *imported_module))
-                    .collect();
-                all_imports.extend(imports_of_supplied_package);
-            }
+            all_imports.extend(
+                self.modules_directly_imported_by(*importer_module)
+                    .filter(|candidate| importeds.contains(candidate))
+                    .map(|imported_module| (*importer_module, imported_module)),
+            );
         }
 
         Ok(all_imports)
     }
 
-    pub fn modules_directly_imported_by(&self, importer: ModuleToken) -> &FxHashSet<ModuleToken> {
-        self.imports.get(importer).unwrap_or(&EMPTY_MODULE_TOKENS)
+    pub fn modules_directly_imported_by(
+        &self,
+        importer: ModuleToken,
+    ) -> impl Iterator<Item = ModuleToken> + '_ {
+        match &self.frozen_imports {
+            Some(frozen_imports) => Either::Left(frozen_imports.imports_of(importer)),
+            None => Either::Right(
+                self.imports
+                    .get(importer)
+                    .unwrap_or(&EMPTY_MODULE_TOKENS)
+                    .iter()
+                    .copied(),
+            ),
+        }
     }
 
-    pub fn modules_that_directly_import(&self, imported: ModuleToken) -> &FxHashSet<ModuleToken> {
-        self.reverse_imports
-            .get(imported)
-            .unwrap_or(&EMPTY_MODULE_TOKENS)
+    pub fn modules_that_directly_import(
+        &self,
+        imported: ModuleToken,
+    ) -> impl Iterator<Item = ModuleToken> + '_ {
+        match &self.frozen_imports {
+            Some(frozen_imports) => Either::Left(frozen_imports.importers_of(imported)),
+            None => Either::Right(
+                self.reverse_imports
+                    .get(imported)
+                    .unwrap_or(&EMPTY_MODULE_TOKENS)
+                    .iter()
+                    .copied(),
+            ),
+        }
     }
 
     pub fn get_import_details(
@@ -88,30 +118,82 @@ impl Graph {
         }
     }
 
+    pub fn import_line_contents(&self, import_details: &PyImportDetails) -> &str {
+        self.import_line_contents
+            .resolve(import_details.interned_line_contents())
+            .unwrap()
+    }
+
     pub fn find_matching_direct_imports(
         &self,
         importer_expression: &ModuleExpression,
         imported_expression: &ModuleExpression,
     ) -> FxHashSet<(ModuleToken, ModuleToken)> {
-        let interner = MODULE_NAMES.read().unwrap();
-        self.imports
-            .iter()
-            .flat_map(|(importer, imports)| {
-                imports
-                    .iter()
-                    .cloned()
+        self.modules
+            .keys()
+            .flat_map(|importer| {
+                self.modules_directly_imported_by(importer)
                     .map(move |imported| (importer, imported))
             })
             .filter(|(importer, imported)| {
-                let importer = self.get_module(*importer).unwrap();
-                let importer_name = interner.resolve(importer.interned_name).unwrap();
-                let imported = self.get_module(*imported).unwrap();
-                let imported_name = interner.resolve(imported.interned_name).unwrap();
-                importer_expression.is_match(importer_name)
-                    && imported_expression.is_match(imported_name)
+                importer_expression.is_match(self.module_name(*importer))
+                    && imported_expression.is_match(self.module_name(*imported))
             })
             .collect()
     }
+
+    /// Counts the imports between packages, with each module collapsed into a package.
+    ///
+    /// Modules that aren't within any of the packages stand for themselves. Imports within a
+    /// package are left out. The graph is gone through once, and isn't changed or copied.
+    pub fn collapse_imports(
+        &self,
+        collapse: Collapse,
+    ) -> FxHashMap<(ModuleToken, ModuleToken), usize> {
+        let is_collapsed_into = |module: ModuleToken| match &collapse {
+            Collapse::ToDepth(depth) => self.module_name(module).split('.').count() == *depth,
+            Collapse::ToPackages(packages) => packages.contains(&module),
+        };
+
+        // The package each module is collapsed into, if any.
+        let mut packages_by_module: SecondaryMap<ModuleToken, Option<ModuleToken>> =
+            SecondaryMap::default();
+        for module in self.modules.keys() {
+            let mut modules_on_the_way = vec![];
+            let mut current = Some(module);
+            let package = loop {
+                let Some(current_module) = current else {
+                    break None;
+                };
+                if let Some(package) = packages_by_module.get(current_module) {
+                    break *package;
+                }
+                modules_on_the_way.push(current_module);
+                if is_collapsed_into(current_module) {
+                    break Some(current_module);
+                }
+                current = self.module_parents.get(current_module).copied().flatten();
+            };
+            for module_on_the_way in modules_on_the_way {
+                packages_by_module.insert(module_on_the_way, package);
+            }
+        }
+        let collapsed = |module: ModuleToken| packages_by_module[module].unwrap_or(module);
+
+        let mut import_counts = FxHashMap::default();
+        for importer in self.modules.keys() {
+            let collapsed_importer = collapsed(importer);
+            for imported in self.modules_directly_imported_by(importer) {
+                let collapsed_imported = collapsed(imported);
+                if collapsed_importer != collapsed_imported {
+                    *import_counts
+                        .entry((collapsed_importer, collapsed_imported))
+                        .or_default() += 1;
+                }
+            }
+        }
+        import_counts
+    }
 }
 
 #[cfg(test)]
@@ -155,4 +237,41 @@ mod test {
             FxHashSet::from_iter([(dog, chicken), (cat, fish)])
         );
     }
+
+    #[test]
+    fn test_collapse_imports() {
+        let mut graph = Graph::default();
+
+        let pkg = graph.get_or_add_module("pkg").token;
+        let animals = graph.get_or_add_module("pkg.animals").token;
+        let dog = graph.get_or_add_module("pkg.animals.dog").token;
+        let cat = graph.get_or_add_module("pkg.animals.cat").token;
+        let food = graph.get_or_add_module("pkg.food").token;
+        let chicken = graph.get_or_add_module("pkg.food.chicken").token;
+        let fish = graph.get_or_add_module("pkg.food.fish").token;
+        let salmon = graph.get_or_add_module("pkg.food.fish.salmon").token;
+        let utils = graph.get_or_add_module("utils").token;
+
+        graph.add_import(dog, chicken);
+        graph.add_import(cat, salmon);
+        graph.add_import(cat, animals);
+        graph.add_import(salmon, fish);
+        graph.add_import(fish, cat);
+        graph.add_import(chicken, utils);
+        graph.add_import(pkg, food);
+
+        assert_eq!(
+            graph.collapse_imports(Collapse::ToDepth(2)),
+            FxHashMap::from_iter([
+                ((animals, food), 2),
+                ((food, animals), 1),
+                ((food, utils), 1),
+                ((pkg, food), 1),
+            ])
+        );
+        assert_eq!(
+            graph.collapse_imports(Collapse::ToPackages(&FxHashSet::from_iter([pkg, fish]))),
+            FxHashMap::from_iter([((fish, pkg), 1), ((pkg, fish), 1), ((pkg, utils), 1)])
+        );
+    }
 }
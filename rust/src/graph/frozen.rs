@@ -0,0 +1,177 @@
+//! An immutable, compact representation of a graph's imports.
+//!
+//! Each module is given a contiguous `u32` index, and the modules imported by (or importing) each
+//! module are stored consecutively in a single array, in compressed sparse row form. This takes
+//! far less memory than a hash set per module, and is quicker to traverse.
+use crate::graph::{Graph, ModuleToken};
+use rustc_hash::FxHashSet;
+use slotmap::SecondaryMap;
+use std::sync::Arc;
+
+#[derive(Debug)]
+pub struct FrozenImports {
+    indices_by_module: SecondaryMap<ModuleToken, u32>,
+    modules: Vec<ModuleToken>,
+    imports: CompressedSparseRows,
+    reverse_imports: CompressedSparseRows,
+}
+
+#[derive(Debug)]
+struct CompressedSparseRows {
+    // The neighbours of the module with index i are neighbours[offsets[i]..offsets[i + 1]].
+    offsets: Vec<u32>,
+    neighbours: Vec<u32>,
+}
+
+impl CompressedSparseRows {
+    fn build(
+        modules: &[ModuleToken],
+        indices_by_module: &SecondaryMap<ModuleToken, u32>,
+        adjacency: &SecondaryMap<ModuleToken, FxHashSet<ModuleToken>>,
+    ) -> Self {
+        let mut offsets = Vec::with_capacity(modules.len() + 1);
+        let mut neighbours = Vec::with_capacity(adjacency.values().map(|set| set.len()).sum());
+        offsets.push(0);
+        for module in modules {
+            let start = neighbours.len();
+            if let Some(adjacent_modules) = adjacency.get(*module) {
+                neighbours.extend(
+                    adjacent_modules
+                        .iter()
+                        .map(|adjacent| indices_by_module[*adjacent]),
+                );
+            }
+            // Sorted, so that each row is read in memory order when traversing the graph.
+            neighbours[start..].sort_unstable();
+            offsets.push(neighbours.len() as u32);
+        }
+        CompressedSparseRows {
+            offsets,
+            neighbours,
+        }
+    }
+
+    fn row(&self, index: u32) -> &[u32] {
+        let index = index as usize;
+        &self.neighbours[self.offsets[index] as usize..self.offsets[index + 1] as usize]
+    }
+}
+
+impl FrozenImports {
+    pub fn build(
+        modules: impl IntoIterator<Item = ModuleToken>,
+        imports: &SecondaryMap<ModuleToken, FxHashSet<ModuleToken>>,
+        reverse_imports: &SecondaryMap<ModuleToken, FxHashSet<ModuleToken>>,
+    ) -> Self {
+        let modules: Vec<_> = modules.into_iter().collect();
+        let mut indices_by_module = SecondaryMap::default();
+        for (index, module) in modules.iter().enumerate() {
+            indices_by_module.insert(*module, index as u32);
+        }
+        FrozenImports {
+            imports: CompressedSparseRows::build(&modules, &indices_by_module, imports),
+            reverse_imports: CompressedSparseRows::build(
+                &modules,
+                &indices_by_module,
+                reverse_imports,
+            ),
+            indices_by_module,
+            modules,
+        }
+    }
+
+    pub fn imports_of(&self, importer: ModuleToken) -> impl Iterator<Item = ModuleToken> + '_ {
+        self.neighbours(&self.imports, importer)
+    }
+
+    pub fn importers_of(&self, imported: ModuleToken) -> impl Iterator<Item = ModuleToken> + '_ {
+        self.neighbours(&self.reverse_imports, imported)
+    }
+
+    pub fn count(&self) -> usize {
+        self.imports.neighbours.len()
+    }
+
+    fn neighbours<'a>(
+        &'a self,
+        rows: &'a CompressedSparseRows,
+        module: ModuleToken,
+    ) -> impl Iterator<Item = ModuleToken> + 'a {
+        let row = match self.indices_by_module.get(module) {
+            Some(index) => rows.row(*index),
+            None => &[],
+        };
+        row.iter().map(|index| self.modules[*index as usize])
+    }
+}
+
+impl Graph {
+    /// Return an immutable copy of the graph, with its imports in compressed sparse row form.
+    ///
+    /// Queries work as normal on the copy, but it must not be changed.
+    pub fn freeze(&self) -> Graph {
+        let frozen_imports =
+            FrozenImports::build(self.modules.keys(), &self.imports, &self.reverse_imports);
+        Graph {
+            module_names: self.module_names.clone(),
+            import_line_contents: self.import_line_contents.clone(),
+            modules_by_name: self.modules_by_name.clone(),
+            modules: self.modules.clone(),
+            module_parents: self.module_parents.clone(),
+            module_children: self.module_children.clone(),
+            imports: Arc::default(),
+            reverse_imports: Arc::default(),
+            import_details: self.import_details.clone(),
+            frozen_imports: Some(Arc::new(frozen_imports)),
+            reachability_index: self.reachability_index.clone(),
+            generation: self.generation,
+        }
+    }
+
+    pub fn is_frozen(&self) -> bool {
+        self.frozen_imports.is_some()
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_frozen_graph_has_same_imports() {
+        let mut graph = Graph::default();
+        let a = graph.get_or_add_module("pkg.a").token();
+        let b = graph.get_or_add_module("pkg.b").token();
+        let c = graph.get_or_add_module("pkg.c").token();
+        graph.add_import(a, b);
+        graph.add_import(a, c);
+        graph.add_import(c, b);
+
+        let frozen_graph = graph.freeze();
+
+        assert!(frozen_graph.is_frozen());
+        assert_eq!(frozen_graph.count_imports(), 3);
+        for module in [a, b, c] {
+            assert_eq!(
+                frozen_graph
+                    .modules_directly_imported_by(module)
+                    .collect::<FxHashSet<_>>(),
+                graph
+                    .modules_directly_imported_by(module)
+                    .collect::<FxHashSet<_>>(),
+            );
+            assert_eq!(
+                frozen_graph
+                    .modules_that_directly_import(module)
+                    .collect::<FxHashSet<_>>(),
+                graph
+                    .modules_that_directly_import(module)
+                    .collect::<FxHashSet<_>>(),
+            );
+        }
+        assert_eq!(
+            frozen_graph.find_upstream_modules(a, false),
+            FxHashSet::from_iter([b, c])
+        );
+    }
+}
@@ -1,8 +1,7 @@
-use crate::graph::{
-    Graph, IMPORT_LINE_CONTENTS, MODULE_NAMES, Module, ModuleIterator, ModuleToken, PyImportDetails,
-};
+use crate::graph::{Graph, Module, ModuleIterator, ModuleToken, PyImportDetails};
 use rustc_hash::FxHashSet;
 use slotmap::secondary::Entry;
+use std::sync::Arc;
 
 impl Graph {
     /// `foo.bar.baz => [foo.bar.baz, foo.bar, foo]`
@@ -16,35 +15,39 @@ impl Graph {
 
     pub fn get_or_add_module(&mut self, name: &str) -> &Module {
         if let Some(module) = self.get_module_by_name(name) {
-            let module = self.modules.get_mut(module.token).unwrap();
-            module.is_invisible = false;
-            return module;
+            let (module, is_invisible) = (module.token, module.is_invisible);
+            // Only copy the modules if this is a change, as they may be shared with a clone.
+            if is_invisible {
+                Arc::make_mut(&mut self.modules)[module].is_invisible = false;
+            }
+            return &self.modules[module];
         }
 
+        self.record_change();
         let mut ancestor_names = self.module_name_to_self_and_ancestors(name);
 
         {
-            let mut interner = MODULE_NAMES.write().unwrap();
             let mut parent: Option<ModuleToken> = None;
             while let Some(name) = ancestor_names.pop() {
-                let name = interner.get_or_intern(name);
+                let name = Arc::make_mut(&mut self.module_names).get_or_intern(name);
                 if let Some(module) = self.modules_by_name.get_by_left(&name) {
                     parent = Some(*module)
                 } else {
-                    let module = self.modules.insert_with_key(|token| Module {
+                    let module = Arc::make_mut(&mut self.modules).insert_with_key(|token| Module {
                         token,
                         interned_name: name,
                         is_invisible: !ancestor_names.is_empty(),
                         is_squashed: false,
                     });
-                    self.modules_by_name.insert(name, module);
-                    self.module_parents.insert(module, parent);
-                    self.module_children.insert(module, FxHashSet::default());
-                    self.imports.insert(module, FxHashSet::default());
-                    self.reverse_imports.insert(module, FxHashSet::default());
+                    Arc::make_mut(&mut self.modules_by_name).insert(name, module);
+                    Arc::make_mut(&mut self.module_parents).insert(module, parent);
+                    let module_children = Arc::make_mut(&mut self.module_children);
+                    module_children.insert(module, FxHashSet::default());
                     if let Some(parent) = parent {
-                        self.module_children[parent].insert(module);
+                        module_children[parent].insert(module);
                     }
+                    Arc::make_mut(&mut self.imports).insert(module, FxHashSet::default());
+                    Arc::make_mut(&mut self.reverse_imports).insert(module, FxHashSet::default());
                     parent = Some(module)
                 }
             }
@@ -60,11 +63,10 @@ impl Graph {
     }
 
     fn mark_module_squashed(&mut self, module: ModuleToken) {
-        let module = self.modules.get_mut(module).unwrap();
-        if !self.module_children[module.token].is_empty() {
+        if !self.module_children[module].is_empty() {
             panic!("cannot mark a module with children as squashed")
         }
-        module.is_squashed = true;
+        Arc::make_mut(&mut self.modules)[module].is_squashed = true;
     }
 
     pub fn remove_module(&mut self, module: ModuleToken) {
@@ -73,6 +75,7 @@ impl Graph {
             return;
         }
         let module = module.unwrap().token();
+        self.record_change();
 
         // TODO(peter) Remove children automatically here, or raise an error?
         if !self.module_children[module].is_empty() {
@@ -82,32 +85,44 @@ impl Graph {
         }
 
         // Update hierarchy.
+        let module_children = Arc::make_mut(&mut self.module_children);
         if let Some(parent) = self.module_parents[module] {
-            self.module_children[parent].remove(&module);
+            module_children[parent].remove(&module);
         }
-        self.modules_by_name.remove_by_right(&module);
-        self.modules.remove(module);
-        self.module_parents.remove(module);
-        self.module_children.remove(module);
+        module_children.remove(module);
+        Arc::make_mut(&mut self.modules_by_name).remove_by_right(&module);
+        Arc::make_mut(&mut self.modules).remove(module);
+        Arc::make_mut(&mut self.module_parents).remove(module);
 
         // Update imports.
-        for imported in self.modules_directly_imported_by(module).clone() {
+        for imported in self
+            .modules_directly_imported_by(module)
+            .collect::<Vec<_>>()
+        {
             self.remove_import(module, imported);
         }
-        for importer in self.modules_that_directly_import(module).clone() {
+        for importer in self
+            .modules_that_directly_import(module)
+            .collect::<Vec<_>>()
+        {
             self.remove_import(importer, module);
         }
-        self.imports.remove(module);
-        self.reverse_imports.remove(module);
+        Arc::make_mut(&mut self.imports).remove(module);
+        Arc::make_mut(&mut self.reverse_imports).remove(module);
     }
 
     pub fn add_import(&mut self, importer: ModuleToken, imported: ModuleToken) {
-        self.imports
+        // Only copy the imports if this is a change, as they may be shared with a clone.
+        if self.direct_import_exists_between(importer, imported) {
+            return;
+        }
+        self.record_change();
+        Arc::make_mut(&mut self.imports)
             .entry(importer)
             .unwrap()
             .or_default()
             .insert(imported);
-        self.reverse_imports
+        Arc::make_mut(&mut self.reverse_imports)
             .entry(imported)
             .unwrap()
             .or_default()
@@ -121,20 +136,19 @@ impl Graph {
         line_number: u32,
         line_contents: &str,
     ) {
-        self.imports
-            .entry(importer)
-            .unwrap()
-            .or_default()
-            .insert(imported);
-        self.reverse_imports
-            .entry(imported)
-            .unwrap()
-            .or_default()
-            .insert(importer);
-        {
-            let mut interner = IMPORT_LINE_CONTENTS.write().unwrap();
-            let line_contents = interner.get_or_intern(line_contents);
-            self.import_details
+        self.add_detailed_imports([(importer, imported, line_number, line_contents)]);
+    }
+
+    /// Add many detailed imports.
+    pub fn add_detailed_imports<'a>(
+        &mut self,
+        imports: impl IntoIterator<Item = (ModuleToken, ModuleToken, u32, &'a str)>,
+    ) {
+        for (importer, imported, line_number, line_contents) in imports {
+            self.add_import(importer, imported);
+            let line_contents =
+                Arc::make_mut(&mut self.import_line_contents).get_or_intern(line_contents);
+            Arc::make_mut(&mut self.import_details)
                 .entry((importer, imported))
                 .or_default()
                 .insert(PyImportDetails::new(line_number, line_contents));
@@ -142,19 +156,26 @@ impl Graph {
     }
 
     pub fn remove_import(&mut self, importer: ModuleToken, imported: ModuleToken) {
-        match self.imports.entry(importer).unwrap() {
+        if !self.direct_import_exists_between(importer, imported) {
+            return;
+        }
+        self.record_change();
+        match Arc::make_mut(&mut self.imports).entry(importer).unwrap() {
             Entry::Occupied(mut entry) => {
                 entry.get_mut().remove(&imported);
             }
             Entry::Vacant(_) => {}
         };
-        match self.reverse_imports.entry(imported).unwrap() {
+        match Arc::make_mut(&mut self.reverse_imports)
+            .entry(imported)
+            .unwrap()
+        {
             Entry::Occupied(mut entry) => {
                 entry.get_mut().remove(&importer);
             }
             Entry::Vacant(_) => {}
         };
-        self.import_details.remove(&(importer, imported));
+        Arc::make_mut(&mut self.import_details).remove(&(importer, imported));
     }
 
     pub fn squash_module(&mut self, module: ModuleToken) {
@@ -163,19 +184,11 @@ impl Graph {
 
         let modules_imported_by_descendants: FxHashSet<_> = descendants
             .iter()
-            .flat_map(|descendant| {
-                self.modules_directly_imported_by(*descendant)
-                    .iter()
-                    .cloned()
-            })
+            .flat_map(|descendant| self.modules_directly_imported_by(*descendant))
             .collect();
         let modules_that_import_descendants: FxHashSet<_> = descendants
             .iter()
-            .flat_map(|descendant| {
-                self.modules_that_directly_import(*descendant)
-                    .iter()
-                    .cloned()
-            })
+            .flat_map(|descendant| self.modules_that_directly_import(*descendant))
             .collect();
 
         // Add descendants and imports to parent module.
@@ -194,6 +207,18 @@ impl Graph {
 
         self.mark_module_squashed(module);
     }
+
+    fn direct_import_exists_between(&self, importer: ModuleToken, imported: ModuleToken) -> bool {
+        self.imports
+            .get(importer)
+            .is_some_and(|imported_modules| imported_modules.contains(&imported))
+    }
+
+    /// Discards anything derived from the graph as it was before a change.
+    fn record_change(&mut self) {
+        self.reachability_index = None;
+        self.generation += 1;
+    }
 }
 
 fn parent_name(name: &str) -> Option<String> {
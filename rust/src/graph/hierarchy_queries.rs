@@ -1,11 +1,10 @@
-use crate::graph::{Graph, MODULE_NAMES, Module, ModuleIterator, ModuleToken};
+use crate::graph::{Graph, Module, ModuleIterator, ModuleToken};
 use crate::module_expressions::ModuleExpression;
 use rustc_hash::FxHashSet;
 
 impl Graph {
     pub fn get_module_by_name(&self, name: &str) -> Option<&Module> {
-        let interner = MODULE_NAMES.read().unwrap();
-        let name = interner.get(name)?;
+        let name = self.module_names.get(name)?;
         match self.modules_by_name.get_by_left(&name) {
             Some(token) => self.get_module(*token),
             None => None,
@@ -16,6 +15,13 @@ impl Graph {
         self.modules.get(module)
     }
 
+    /// Returns the name of a module in the graph.
+    pub fn module_name(&self, module: ModuleToken) -> &str {
+        self.module_names
+            .resolve(self.modules[module].interned_name)
+            .unwrap()
+    }
+
     // TODO(peter) Guarantee order?
     pub fn all_modules(&self) -> impl ModuleIterator<'_> {
         self.modules.values()
@@ -54,11 +60,10 @@ impl Graph {
         &self,
         expression: &ModuleExpression,
     ) -> impl ModuleIterator<'_> + use<'_> {
-        let interner = MODULE_NAMES.read().unwrap();
         let modules: FxHashSet<_> = self
             .modules
             .values()
-            .filter(|m| expression.is_match(interner.resolve(m.interned_name).unwrap()))
+            .filter(|m| expression.is_match(self.module_names.resolve(m.interned_name).unwrap()))
             .collect();
         modules.into_iter()
     }
@@ -105,4 +110,14 @@ mod tests {
                 .collect()
         );
     }
+    #[test]
+    fn test_module_names_belong_to_their_graph() {
+        let mut graph = Graph::default();
+        let foo = graph.get_or_add_module("foo").token();
+        let other_graph = Graph::default();
+
+        assert_eq!(graph.module_name(foo), "foo");
+        assert!(other_graph.get_module_by_name("foo").is_none());
+        assert!(other_graph.module_names.is_empty());
+    }
 }
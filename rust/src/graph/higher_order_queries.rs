@@ -1,9 +1,12 @@
-use crate::errors::GrimpResult;
+use crate::errors::{GrimpError, GrimpResult};
+use crate::graph::pathfinding::DisjointShortestPaths;
 use crate::graph::{ExtendWithDescendants, Graph, ModuleToken};
 use derive_new::new;
-use getset::Getters;
+use getset::{CopyGetters, Getters};
 use rayon::prelude::*;
-use rustc_hash::FxHashSet;
+use rustc_hash::{FxHashMap, FxHashSet};
+use std::borrow::Cow;
+use std::time::Instant;
 
 use tap::prelude::*;
 
@@ -20,7 +23,7 @@ pub struct Level {
     closed: bool,
 }
 
-#[derive(Debug, Clone, PartialEq, Eq, new, Getters)]
+#[derive(Debug, Clone, PartialEq, Eq, new, Getters, CopyGetters)]
 pub struct PackageDependency {
     #[getset(get = "pub")]
     importer: ModuleToken,
@@ -31,6 +34,41 @@ pub struct PackageDependency {
     #[new(into)]
     #[getset(get = "pub")]
     routes: Vec<Route>,
+
+    // Whether the search stopped before all the routes were found. Once the deadline has
+    // passed, this is set without checking whether there were any more routes.
+    #[new(default)]
+    #[getset(get_copy = "pub")]
+    truncated: bool,
+}
+
+/// Limits on how many routes are found for each illegal dependency.
+#[derive(Debug, Clone, Copy, Default)]
+pub struct RouteLimits {
+    pub max_routes_per_dependency: Option<usize>,
+    // Once this has passed, only one route is found for each remaining dependency.
+    pub deadline: Option<Instant>,
+}
+
+impl RouteLimits {
+    fn max_routes_reached(&self, route_count: usize) -> bool {
+        self.max_routes_per_dependency
+            .is_some_and(|max_routes| route_count >= max_routes)
+    }
+
+    fn deadline_passed(&self) -> bool {
+        self.deadline
+            .is_some_and(|deadline| Instant::now() >= deadline)
+    }
+}
+
+/// The modules of each layer, and what they import, shared between the permutations of layers.
+struct LayerModules {
+    // Each layer along with its descendants.
+    modules_by_layer: FxHashMap<ModuleToken, FxHashSet<ModuleToken>>,
+    // The modules imported, even indirectly, by each layer that mustn't import another. Layers
+    // reached after the deadline are left out: searching for a single route is no slower.
+    upstream_modules_by_layer: FxHashMap<ModuleToken, FxHashSet<ModuleToken>>,
 }
 
 #[derive(Debug, Clone, PartialEq, Eq, new, Getters)]
@@ -52,14 +90,34 @@ impl Graph {
     pub fn find_illegal_dependencies_for_layers(
         &self,
         levels: &[Level],
+        limits: &RouteLimits,
     ) -> GrimpResult<Vec<PackageDependency>> {
-        let all_layer_modules = levels
-            .iter()
-            .flat_map(|level| level.layers().clone())
-            .flat_map(|m| m.conv::<FxHashSet<_>>().with_descendants(self))
+        let permutations = self.generate_illegal_import_permutations_for_layers(levels);
+
+        // Work that is shared between permutations is done once, up front.
+        let layer_modules = LayerModules {
+            modules_by_layer: levels
+                .iter()
+                .flat_map(|level| level.layers().iter())
+                .map(|layer| (*layer, layer.conv::<FxHashSet<_>>().with_descendants(self)))
+                .collect(),
+            upstream_modules_by_layer: permutations
+                .iter()
+                .map(|(from_layer, _)| *from_layer)
+                .collect::<FxHashSet<_>>()
+                .into_par_iter()
+                .filter(|_| !limits.deadline_passed())
+                .map(|layer| (layer, self.find_upstream_modules(layer, true)))
+                .collect(),
+        };
+        let all_layer_modules = layer_modules
+            .modules_by_layer
+            .values()
+            .flatten()
+            .copied()
             .collect::<FxHashSet<_>>();
 
-        self.generate_illegal_import_permutations_for_layers(levels)
+        permutations
             .into_par_iter()
             .try_fold(
                 Vec::new,
@@ -67,7 +125,9 @@ impl Graph {
                     if let Some(dep) = self.find_illegal_dependencies(
                         from_package,
                         to_package,
+                        &layer_modules,
                         &all_layer_modules,
+                        limits,
                     )? {
                         v.push(dep);
                     }
@@ -130,26 +190,46 @@ impl Graph {
         &self,
         from_layer: ModuleToken,
         to_layer: ModuleToken,
+        layer_modules: &LayerModules,
         all_layers_modules: &FxHashSet<ModuleToken>,
+        limits: &RouteLimits,
     ) -> GrimpResult<Option<PackageDependency>> {
+        let from_layer_with_descendants = &layer_modules.modules_by_layer[&from_layer];
+        let to_layer_with_descendants = &layer_modules.modules_by_layer[&to_layer];
+        if !from_layer_with_descendants.is_disjoint(to_layer_with_descendants) {
+            return Err(GrimpError::SharedDescendants);
+        }
+
         // Shortcut the detailed implementation in the case of no chains.
         // This will be much faster!
-        if !self.chain_exists(from_layer, to_layer, true)? {
+        if layer_modules
+            .upstream_modules_by_layer
+            .get(&from_layer)
+            .is_some_and(|upstream_modules| upstream_modules.is_disjoint(to_layer_with_descendants))
+        {
             return Ok(None);
         }
 
-        let from_layer_with_descendants = from_layer.conv::<FxHashSet<_>>().with_descendants(self);
-        let to_layer_with_descendants = to_layer.conv::<FxHashSet<_>>().with_descendants(self);
-
-        // Disallow chains via other layers.
-        let excluded_modules =
-            all_layers_modules - &(&from_layer_with_descendants | &to_layer_with_descendants);
-
-        let chains = self._find_shortest_chains(
-            &from_layer_with_descendants,
-            &to_layer_with_descendants,
-            &excluded_modules,
+        // Disallow chains via other layers. (The search never excludes the layers themselves.)
+        let mut remaining_chains = DisjointShortestPaths::new(
+            Cow::Borrowed(from_layer_with_descendants),
+            Cow::Borrowed(to_layer_with_descendants),
+            Cow::Borrowed(all_layers_modules),
         )?;
+        let mut chains = vec![];
+        let mut truncated = false;
+        while let Some(chain) = remaining_chains.next_path(self) {
+            chains.push(chain);
+            if limits.deadline_passed() {
+                // Don't spend any more time checking whether there were more routes.
+                truncated = true;
+                break;
+            }
+            if limits.max_routes_reached(chains.len()) {
+                truncated = remaining_chains.next_path(self).is_some();
+                break;
+            }
+        }
 
         // Collect direct imports...
         let mut direct_imports = vec![];
@@ -191,7 +271,10 @@ impl Graph {
 
         match routes.is_empty() {
             true => Ok(None),
-            false => Ok(Some(PackageDependency::new(from_layer, to_layer, routes))),
+            false => Ok(Some(PackageDependency {
+                truncated,
+                ..PackageDependency::new(from_layer, to_layer, routes)
+            })),
         }
     }
 
@@ -311,4 +394,109 @@ mod tests {
             ])
         );
     }
+
+    #[test]
+    fn test_find_illegal_dependencies_for_layers_after_deadline() {
+        let mut graph = Graph::default();
+        let high = graph.get_or_add_module("app.high").token;
+        let mid = graph.get_or_add_module("app.mid").token;
+        let low = graph.get_or_add_module("app.low").token;
+        graph.add_import(low, mid);
+        let levels = vec![
+            Level::new(FxHashSet::from_iter([high]), false, false),
+            Level::new(FxHashSet::from_iter([mid]), false, false),
+            Level::new(FxHashSet::from_iter([low]), false, false),
+        ];
+        let limits = RouteLimits {
+            deadline: Some(Instant::now()),
+            ..RouteLimits::default()
+        };
+
+        let dependencies = graph
+            .find_illegal_dependencies_for_layers(&levels, &limits)
+            .unwrap();
+
+        // Without the upstream modules to rule out layers, each one is searched, and any route
+        // found is marked as truncated without searching for another.
+        assert_eq!(
+            dependencies,
+            vec![PackageDependency {
+                truncated: true,
+                ..PackageDependency::new(
+                    low,
+                    mid,
+                    vec![Route::new(
+                        FxHashSet::from_iter([low]),
+                        vec![],
+                        FxHashSet::from_iter([mid]),
+                    )],
+                )
+            }]
+        );
+    }
+
+    #[test]
+    fn test_find_illegal_dependencies_for_layers() {
+        let mut graph = Graph::default();
+        let high = graph.get_or_add_module("app.high").token;
+        let mid = graph.get_or_add_module("app.mid").token;
+        let low = graph.get_or_add_module("app.low").token;
+        let low_one = graph.get_or_add_module("app.low.one").token;
+        let other = graph.get_or_add_module("app.other").token;
+        // An indirect illegal import, via a module outside the layers.
+        graph.add_import(low_one, other);
+        graph.add_import(other, high);
+        // Chains via another layer only count as dependencies on that layer.
+        graph.add_import(low, mid);
+        graph.add_import(mid, high);
+
+        let levels = vec![
+            Level::new(FxHashSet::from_iter([high]), false, false),
+            Level::new(FxHashSet::from_iter([mid]), false, false),
+            Level::new(FxHashSet::from_iter([low]), false, false),
+        ];
+
+        let mut dependencies = graph
+            .find_illegal_dependencies_for_layers(&levels, &RouteLimits::default())
+            .unwrap();
+        dependencies.sort_by_key(|dependency| {
+            (
+                graph.module_name(dependency.importer).to_owned(),
+                graph.module_name(dependency.imported).to_owned(),
+            )
+        });
+
+        assert_eq!(
+            dependencies,
+            vec![
+                PackageDependency::new(
+                    low,
+                    high,
+                    vec![Route::new(
+                        FxHashSet::from_iter([low_one]),
+                        vec![other],
+                        FxHashSet::from_iter([high]),
+                    )],
+                ),
+                PackageDependency::new(
+                    low,
+                    mid,
+                    vec![Route::new(
+                        FxHashSet::from_iter([low]),
+                        vec![],
+                        FxHashSet::from_iter([mid]),
+                    )],
+                ),
+                PackageDependency::new(
+                    mid,
+                    high,
+                    vec![Route::new(
+                        FxHashSet::from_iter([mid]),
+                        vec![],
+                        FxHashSet::from_iter([high]),
+                    )],
+                ),
+            ]
+        );
+    }
 }
@@ -1,7 +1,6 @@
 use crate::errors::GrimpResult;
-use crate::graph::pathfinding::{find_reach, find_shortest_path};
+use crate::graph::pathfinding::{find_disjoint_shortest_paths, find_reach, find_shortest_path};
 use crate::graph::{ExtendWithDescendants, Graph, ModuleToken};
-use itertools::Itertools;
 use rustc_hash::{FxHashMap, FxHashSet};
 use tap::Conv;
 
@@ -16,7 +15,14 @@ impl Graph {
             from_modules.extend_with_descendants(self);
         }
 
-        find_reach(&self.reverse_imports, &from_modules)
+        if let Some(index) = &self.reachability_index
+            && let Some(downstream_modules) = index.find_downstream_modules(&from_modules)
+        {
+            return downstream_modules;
+        }
+        find_reach(&from_modules, |module| {
+            self.modules_that_directly_import(module)
+        })
     }
 
     pub fn find_upstream_modules(
@@ -29,7 +35,14 @@ impl Graph {
             from_modules.extend_with_descendants(self);
         }
 
-        find_reach(&self.imports, &from_modules)
+        if let Some(index) = &self.reachability_index
+            && let Some(upstream_modules) = index.find_upstream_modules(&from_modules)
+        {
+            return upstream_modules;
+        }
+        find_reach(&from_modules, |module| {
+            self.modules_directly_imported_by(module)
+        })
     }
 
     pub fn find_shortest_chain(
@@ -77,8 +90,27 @@ impl Graph {
         imported: ModuleToken,
         as_packages: bool,
     ) -> GrimpResult<bool> {
+        let mut from_modules = importer.conv::<FxHashSet<_>>();
+        let mut to_modules = imported.conv::<FxHashSet<_>>();
+        if as_packages {
+            from_modules.extend_with_descendants(self);
+            to_modules.extend_with_descendants(self);
+        }
+
+        // Modules shared between importer and imported are an error, which the search reports.
+        if from_modules.is_disjoint(&to_modules)
+            && let Some(index) = &self.reachability_index
+            && let Some(chain_exists) = index.chain_exists(&from_modules, &to_modules)
+        {
+            return Ok(chain_exists);
+        }
         Ok(self
-            .find_shortest_chain(importer, imported, as_packages)?
+            .find_shortest_chain_with_excluded_modules_and_imports(
+                &from_modules,
+                &to_modules,
+                &FxHashSet::default(),
+                &FxHashMap::default(),
+            )?
             .is_some())
     }
 
@@ -119,36 +151,105 @@ impl Graph {
         to_modules: &FxHashSet<ModuleToken>,
         excluded_modules: &FxHashSet<ModuleToken>,
     ) -> GrimpResult<Vec<Vec<ModuleToken>>> {
-        let mut chains = vec![];
+        find_disjoint_shortest_paths(self, from_modules, to_modules, excluded_modules)
+    }
+}
 
-        // Disallow chains via these imports.
-        // We'll add chains to this set as we discover them.
-        let mut excluded_imports = FxHashMap::default();
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::graph::test_utils::{build_graph, tokens};
+    use itertools::Itertools;
 
-        loop {
-            let chain = self.find_shortest_chain_with_excluded_modules_and_imports(
+    // Finds the chains by searching the graph again for each one, excluding the imports of the
+    // chains found so far.
+    fn find_shortest_chains_one_at_a_time(
+        graph: &Graph,
+        from_modules: &FxHashSet<ModuleToken>,
+        to_modules: &FxHashSet<ModuleToken>,
+        excluded_modules: &FxHashSet<ModuleToken>,
+    ) -> Vec<Vec<ModuleToken>> {
+        let mut chains = vec![];
+        let mut excluded_imports: FxHashMap<ModuleToken, FxHashSet<ModuleToken>> =
+            FxHashMap::default();
+        while let Some(chain) = graph
+            .find_shortest_chain_with_excluded_modules_and_imports(
                 from_modules,
                 to_modules,
                 excluded_modules,
                 &excluded_imports,
-            )?;
-
-            if chain.is_none() {
-                break;
-            }
-            let chain = chain.unwrap();
-
-            // Exclude this chain from further searching.
+            )
+            .unwrap()
+        {
             for (importer, imported) in chain.iter().tuple_windows() {
                 excluded_imports
                     .entry(*importer)
                     .or_default()
                     .insert(*imported);
             }
-
             chains.push(chain);
         }
+        chains
+    }
 
-        Ok(chains)
+    #[test]
+    fn test_find_shortest_chains_finds_chains_of_each_length() {
+        let graph = build_graph(&[
+            // Two direct imports.
+            ("high.a", "low.a"),
+            ("high.b", "low.a"),
+            // Two chains of length three, sharing a middle module but not an import.
+            ("high.a", "mid.a"),
+            ("high.b", "mid.a"),
+            ("mid.a", "low.b"),
+            ("mid.a", "low.c"),
+            // A third chain via mid.a isn't found, as its imports are used by the other two.
+            ("high.c", "mid.a"),
+            // A longer chain, via an excluded module and not.
+            ("high.c", "mid.b"),
+            ("mid.b", "mid.c"),
+            ("mid.c", "low.d"),
+            ("mid.b", "excluded"),
+            ("excluded", "low.d"),
+        ]);
+        let from_modules = tokens(&graph, &["high.a", "high.b", "high.c"]);
+        let to_modules = tokens(&graph, &["low.a", "low.b", "low.c", "low.d"]);
+        let excluded_modules = tokens(&graph, &["excluded"]);
+
+        let chains = graph
+            ._find_shortest_chains(&from_modules, &to_modules, &excluded_modules)
+            .unwrap();
+
+        let chain_lengths = |chains: &[Vec<ModuleToken>]| -> Vec<usize> {
+            chains.iter().map(|chain| chain.len()).sorted().collect()
+        };
+        assert_eq!(chain_lengths(&chains), vec![2, 2, 3, 3, 4]);
+        assert_eq!(
+            chain_lengths(&chains),
+            chain_lengths(&find_shortest_chains_one_at_a_time(
+                &graph,
+                &from_modules,
+                &to_modules,
+                &excluded_modules
+            ))
+        );
+        // No two chains share an import.
+        let imports = chains
+            .iter()
+            .flat_map(|chain| chain.iter().copied().tuple_windows::<(_, _)>())
+            .collect::<Vec<_>>();
+        assert_eq!(imports.iter().unique().count(), imports.len());
+    }
+
+    #[test]
+    fn test_find_shortest_chains_with_shared_modules_is_an_error() {
+        let graph = build_graph(&[("pkg.a", "pkg.b")]);
+        let modules = tokens(&graph, &["pkg.a", "pkg.b"]);
+
+        assert!(
+            graph
+                ._find_shortest_chains(&modules, &modules, &FxHashSet::default())
+                .is_err()
+        );
     }
 }
@@ -3,35 +3,46 @@ use derive_new::new;
 use getset::{CopyGetters, Getters};
 use itertools::Itertools;
 use pyo3::IntoPyObjectExt;
-use pyo3::exceptions::PyValueError;
+use pyo3::exceptions::{PyRuntimeError, PyValueError};
 use pyo3::prelude::*;
-use pyo3::types::{IntoPyDict, PyDict, PyFrozenSet, PyList, PySet, PyString, PyTuple};
+use pyo3::pybacked::PyBackedStr;
+use pyo3::types::{IntoPyDict, PyBytes, PyDict, PyFrozenSet, PyList, PySet, PyString, PyTuple};
 use rayon::prelude::*;
 use rustc_hash::{FxHashMap, FxHashSet};
 use slotmap::{SecondaryMap, SlotMap, new_key_type};
+use std::borrow::Cow;
 use std::collections::HashSet;
-use std::sync::{LazyLock, RwLock};
+use std::sync::{Arc, LazyLock};
+use std::time::{Duration, Instant};
 use string_interner::backend::StringBackend;
 use string_interner::{DefaultSymbol, StringInterner};
 
 use crate::errors::{GrimpError, GrimpResult, ModuleNotPresent};
+use crate::graph::direct_import_queries::Collapse;
+use crate::graph::frozen::FrozenImports;
 use crate::graph::higher_order_queries::Level;
 use crate::graph::higher_order_queries::PackageDependency as PyPackageDependency;
+use crate::graph::higher_order_queries::RouteLimits;
+use crate::graph::pathfinding::DisjointShortestPaths;
+use crate::graph::reachability::ReachabilityIndex;
+use crate::import_scanning::ImportsByModule;
 use crate::module_expressions::ModuleExpression;
 
 pub mod direct_import_queries;
+pub mod frozen;
 pub mod graph_manipulation;
 pub mod hierarchy_queries;
 pub mod higher_order_queries;
 pub mod import_chain_queries;
+pub mod reachability;
+pub mod snapshots;
 
 pub mod cycle_breakers;
+pub mod cycle_queries;
 pub(crate) mod pathfinding;
+#[cfg(test)]
+mod test_utils;
 
-static MODULE_NAMES: LazyLock<RwLock<StringInterner<StringBackend>>> =
-    LazyLock::new(|| RwLock::new(StringInterner::default()));
-static IMPORT_LINE_CONTENTS: LazyLock<RwLock<StringInterner<StringBackend>>> =
-    LazyLock::new(|| RwLock::new(StringInterner::default()));
 static EMPTY_MODULE_TOKENS: LazyLock<FxHashSet<ModuleToken>> = LazyLock::new(FxHashSet::default);
 static EMPTY_IMPORT_DETAILS: LazyLock<FxHashSet<PyImportDetails>> =
     LazyLock::new(FxHashSet::default);
@@ -54,24 +65,30 @@ pub struct Module {
     is_squashed: bool,
 }
 
-impl Module {
-    pub fn name(&self) -> String {
-        let interner = MODULE_NAMES.read().unwrap();
-        interner.resolve(self.interned_name).unwrap().to_owned()
-    }
-}
-
+/// A graph of modules and the imports between them.
+///
+/// Each of the graph's collections is shared between clones of the graph, so cloning takes
+/// constant time. A collection is only copied when it is first changed, by `Arc::make_mut`.
 #[derive(Default, Clone)]
 pub struct Graph {
+    // Strings, interned per graph so that they are freed along with it.
+    module_names: Arc<StringInterner<StringBackend>>,
+    import_line_contents: Arc<StringInterner<StringBackend>>,
     // Hierarchy
-    modules_by_name: BiMap<DefaultSymbol, ModuleToken>,
-    modules: SlotMap<ModuleToken, Module>,
-    module_parents: SecondaryMap<ModuleToken, Option<ModuleToken>>,
-    module_children: SecondaryMap<ModuleToken, FxHashSet<ModuleToken>>,
+    modules_by_name: Arc<BiMap<DefaultSymbol, ModuleToken>>,
+    modules: Arc<SlotMap<ModuleToken, Module>>,
+    module_parents: Arc<SecondaryMap<ModuleToken, Option<ModuleToken>>>,
+    module_children: Arc<SecondaryMap<ModuleToken, FxHashSet<ModuleToken>>>,
     // Imports
-    imports: SecondaryMap<ModuleToken, FxHashSet<ModuleToken>>,
-    reverse_imports: SecondaryMap<ModuleToken, FxHashSet<ModuleToken>>,
-    import_details: FxHashMap<(ModuleToken, ModuleToken), FxHashSet<PyImportDetails>>,
+    imports: Arc<SecondaryMap<ModuleToken, FxHashSet<ModuleToken>>>,
+    reverse_imports: Arc<SecondaryMap<ModuleToken, FxHashSet<ModuleToken>>>,
+    import_details: Arc<FxHashMap<(ModuleToken, ModuleToken), FxHashSet<PyImportDetails>>>,
+    // Once the graph is frozen, these replace imports and reverse_imports, which are left empty.
+    frozen_imports: Option<Arc<FrozenImports>>,
+    // Indexes
+    reachability_index: Option<Arc<ReachabilityIndex>>,
+    // Incremented on every change to the modules or imports.
+    generation: u64,
 }
 
 #[pyclass(name = "Graph")]
@@ -81,6 +98,97 @@ pub struct GraphWrapper {
 }
 
 impl GraphWrapper {
+    /// Add the modules and imports found by scanning, adding imported modules that aren't within
+    /// any of the packages as squashed modules.
+    fn add_imports_by_module_checked(
+        &mut self,
+        imports_by_module: &ImportsByModule,
+        package_names: &HashSet<String>,
+    ) -> PyResult<()> {
+        // Each module only needs to be checked once.
+        let mut added_modules: HashSet<(&str, bool)> = HashSet::new();
+        let mut unsquashed_ancestors = FxHashSet::default();
+        let mut detailed_imports = vec![];
+        for (module, imports) in &imports_by_module.imports_by_module {
+            if added_modules.insert((&module.name, false)) {
+                self.add_module_checked(&module.name, false, &mut unsquashed_ancestors)?;
+            }
+            for import in imports {
+                let is_squashed = is_external(&import.imported, package_names);
+                if added_modules.insert((&import.imported, is_squashed)) {
+                    self.add_module_checked(
+                        &import.imported,
+                        is_squashed,
+                        &mut unsquashed_ancestors,
+                    )?;
+                }
+                detailed_imports.push((
+                    self._graph.get_or_add_module(&import.importer).token(),
+                    self._graph.get_or_add_module(&import.imported).token(),
+                    import.line_number as u32,
+                    import.line_contents.as_str(),
+                ));
+            }
+        }
+        self._graph.add_detailed_imports(detailed_imports);
+        Ok(())
+    }
+
+    /// Add a module, checking that it's consistent with the squashed modules in the graph.
+    ///
+    /// Ancestors that are known not to be squashed are remembered in `unsquashed_ancestors`, so
+    /// that they only need to be checked once when adding many modules.
+    fn add_module_checked(
+        &mut self,
+        module: &str,
+        is_squashed: bool,
+        unsquashed_ancestors: &mut FxHashSet<String>,
+    ) -> PyResult<()> {
+        let mut checked_ancestors = vec![];
+        for ancestor_module in self
+            ._graph
+            .module_name_to_self_and_ancestors(module)
+            .into_iter()
+            .skip(1)
+        {
+            if unsquashed_ancestors.contains(&ancestor_module) {
+                // Its own ancestors will have been checked too.
+                break;
+            }
+            if self.is_module_squashed(&ancestor_module).unwrap_or(false) {
+                return Err(PyValueError::new_err(format!(
+                    "Module is a descendant of squashed module {}.",
+                    &ancestor_module,
+                )));
+            };
+            checked_ancestors.push(ancestor_module);
+        }
+        unsquashed_ancestors.extend(checked_ancestors);
+
+        if self.contains_module(module) && self.is_module_squashed(module)? != is_squashed {
+            return Err(PyValueError::new_err(
+                "Cannot add a squashed module when it is already present in the graph \
+                        as an unsquashed module, or vice versa.",
+            ));
+        }
+
+        match is_squashed {
+            false => self._graph.get_or_add_module(module),
+            true => {
+                unsquashed_ancestors.remove(module);
+                self._graph.get_or_add_squashed_module(module)
+            }
+        };
+        Ok(())
+    }
+
+    fn check_not_frozen(&self) -> GrimpResult<()> {
+        if self._graph.is_frozen() {
+            return Err(GrimpError::FrozenGraph);
+        }
+        Ok(())
+    }
+
     fn get_visible_module_by_name(&self, name: &str) -> Result<&Module, ModuleNotPresent> {
         self._graph
             .get_module_by_name(name)
@@ -88,6 +196,22 @@ impl GraphWrapper {
             .ok_or(ModuleNotPresent(name.to_owned()))
     }
 
+    fn parse_chain_queries(
+        &self,
+        queries: &[(PyBackedStr, PyBackedStr, bool)],
+    ) -> Result<Vec<(ModuleToken, ModuleToken, bool)>, ModuleNotPresent> {
+        queries
+            .iter()
+            .map(|(importer, imported, as_packages)| {
+                Ok((
+                    self.get_visible_module_by_name(importer)?.token(),
+                    self.get_visible_module_by_name(imported)?.token(),
+                    *as_packages,
+                ))
+            })
+            .collect()
+    }
+
     fn parse_containers(
         &self,
         containers: &HashSet<String>,
@@ -108,7 +232,10 @@ impl GraphWrapper {
     ) -> Vec<Vec<Level>> {
         let containers = match containers.is_empty() {
             true => vec![None],
-            false => containers.iter().map(|c| Some(c.name())).collect(),
+            false => containers
+                .iter()
+                .map(|c| Some(self._graph.module_name(c.token()).to_owned()))
+                .collect(),
         };
 
         let mut levels_by_container: Vec<Vec<Level>> = vec![];
@@ -193,11 +320,40 @@ impl GraphWrapper {
             }
 
             python_dependency.set_item("routes", PyTuple::new(py, python_routes)?)?;
+            python_dependency.set_item("truncated", rust_dependency.truncated)?;
             python_dependencies.push(python_dependency)
         }
 
         PyTuple::new(py, python_dependencies)
     }
+
+    fn convert_cycle_breakers_to_python<'py>(
+        &self,
+        py: Python<'py>,
+        cycle_breakers: FxHashSet<(ModuleToken, ModuleToken)>,
+    ) -> PyResult<Bound<'py, PySet>> {
+        PySet::new(
+            py,
+            cycle_breakers
+                .into_iter()
+                .map(|(importer, imported)| {
+                    Import::new(
+                        self._graph.module_name(importer).to_owned(),
+                        self._graph.module_name(imported).to_owned(),
+                    )
+                })
+                .map(|import| {
+                    PyTuple::new(
+                        py,
+                        [
+                            import.importer.into_py_any(py).unwrap(),
+                            import.imported.into_py_any(py).unwrap(),
+                        ],
+                    )
+                    .unwrap()
+                }),
+        )
+    }
 }
 
 /// Wrapper around the Graph struct that integrates with Python.
@@ -210,8 +366,12 @@ impl GraphWrapper {
         }
     }
 
-    pub fn get_modules(&self) -> HashSet<String> {
-        self._graph.all_modules().visible().names().collect()
+    pub fn get_modules(&self) -> HashSet<&str> {
+        self._graph
+            .all_modules()
+            .visible()
+            .names(&self._graph)
+            .collect()
     }
 
     pub fn contains_module(&self, name: &str) -> bool {
@@ -220,41 +380,32 @@ impl GraphWrapper {
 
     #[pyo3(signature = (module, is_squashed = false))]
     pub fn add_module(&mut self, module: &str, is_squashed: bool) -> PyResult<()> {
-        for ancestor_module in self
-            ._graph
-            .module_name_to_self_and_ancestors(module)
-            .into_iter()
-            .skip(1)
-        {
-            if self.is_module_squashed(&ancestor_module).unwrap_or(false) {
-                return Err(PyValueError::new_err(format!(
-                    "Module is a descendant of squashed module {}.",
-                    &ancestor_module,
-                )));
-            };
-        }
+        self.check_not_frozen()?;
+        self.add_module_checked(module, is_squashed, &mut FxHashSet::default())
+    }
 
-        if self.contains_module(module) && self.is_module_squashed(module)? != is_squashed {
-            return Err(PyValueError::new_err(
-                "Cannot add a squashed module when it is already present in the graph \
-                        as an unsquashed module, or vice versa.",
-            ));
+    /// Add many modules, from an iterable of module names.
+    #[pyo3(signature = (modules, is_squashed = false))]
+    pub fn add_modules(&mut self, modules: &Bound<'_, PyAny>, is_squashed: bool) -> PyResult<()> {
+        self.check_not_frozen()?;
+        let mut unsquashed_ancestors = FxHashSet::default();
+        for module in modules.try_iter()? {
+            let module: PyBackedStr = module?.extract()?;
+            self.add_module_checked(&module, is_squashed, &mut unsquashed_ancestors)?;
         }
-
-        match is_squashed {
-            false => self._graph.get_or_add_module(module),
-            true => self._graph.get_or_add_squashed_module(module),
-        };
         Ok(())
     }
 
-    pub fn remove_module(&mut self, module: &str) {
+    pub fn remove_module(&mut self, module: &str) -> PyResult<()> {
+        self.check_not_frozen()?;
         if let Some(module) = self._graph.get_module_by_name(module) {
             self._graph.remove_module(module.token())
         }
+        Ok(())
     }
 
     pub fn squash_module(&mut self, module: &str) -> PyResult<()> {
+        self.check_not_frozen()?;
         let module = self.get_visible_module_by_name(module)?.token();
         self._graph.squash_module(module);
         Ok(())
@@ -271,7 +422,8 @@ impl GraphWrapper {
         imported: &str,
         line_number: Option<u32>,
         line_contents: Option<&str>,
-    ) {
+    ) -> PyResult<()> {
+        self.check_not_frozen()?;
         let importer = self._graph.get_or_add_module(importer).token();
         let imported = self._graph.get_or_add_module(imported).token();
         match (line_number, line_contents) {
@@ -287,10 +439,133 @@ impl GraphWrapper {
                 panic!("Expected line_number and line_contents, or neither.");
             }
         }
+        Ok(())
+    }
+
+    /// Add many direct imports, from an iterable of (importer, imported) or
+    /// (importer, imported, line_number, line_contents) tuples.
+    pub fn add_imports(&mut self, imports: &Bound<'_, PyAny>) -> PyResult<()> {
+        self.check_not_frozen()?;
+        // Every import is extracted before any are added, so that a bad import leaves the graph
+        // unchanged.
+        let mut extracted_imports: Vec<(PyBackedStr, PyBackedStr, Option<(u32, PyBackedStr)>)> =
+            vec![];
+        for import in imports.try_iter()? {
+            let import = import?;
+            let import = import.downcast::<PyTuple>()?;
+            extracted_imports.push(match import.len() {
+                2 => {
+                    let (importer, imported): (PyBackedStr, PyBackedStr) = import.extract()?;
+                    (importer, imported, None)
+                }
+                4 => {
+                    let (importer, imported, line_number, line_contents): (
+                        PyBackedStr,
+                        PyBackedStr,
+                        u32,
+                        PyBackedStr,
+                    ) = import.extract()?;
+                    (importer, imported, Some((line_number, line_contents)))
+                }
+                _ => {
+                    return Err(PyValueError::new_err(
+                        "Expected (importer, imported) or \
+                        (importer, imported, line_number, line_contents) tuples.",
+                    ));
+                }
+            });
+        }
+
+        for (importer, imported, details) in &extracted_imports {
+            let importer = self._graph.get_or_add_module(importer).token();
+            let imported = self._graph.get_or_add_module(imported).token();
+            match details {
+                Some((line_number, line_contents)) => {
+                    self._graph
+                        .add_detailed_import(importer, imported, *line_number, line_contents)
+                }
+                None => self._graph.add_import(importer, imported),
+            }
+        }
+        Ok(())
+    }
+
+    /// Add the modules and imports found by scanning some packages.
+    ///
+    /// Imported modules that aren't within any of the packages are added as squashed modules.
+    #[pyo3(signature = (imports_by_module, *, package_names))]
+    pub fn add_imports_by_module(
+        &mut self,
+        imports_by_module: PyRef<'_, ImportsByModule>,
+        package_names: HashSet<String>,
+    ) -> PyResult<()> {
+        self.check_not_frozen()?;
+        self.add_imports_by_module_checked(&imports_by_module, &package_names)
+    }
+
+    /// Replace the imports of some modules with newly scanned ones, and remove deleted modules.
+    ///
+    /// The existing imports of each module in imports_by_module are removed before its new
+    /// imports are added. External (squashed) modules that are no longer imported by anything
+    /// are removed, so the graph ends up the same as if it had been built from scratch.
+    #[pyo3(signature = (imports_by_module, *, removed_modules, package_names))]
+    pub fn update_imports_by_module(
+        &mut self,
+        imports_by_module: PyRef<'_, ImportsByModule>,
+        removed_modules: HashSet<String>,
+        package_names: HashSet<String>,
+    ) -> PyResult<()> {
+        self.check_not_frozen()?;
+        let replaced_modules = imports_by_module
+            .imports_by_module
+            .keys()
+            .map(|module| module.name.as_str())
+            .chain(removed_modules.iter().map(String::as_str));
+        let mut previously_imported = FxHashSet::default();
+        for module_name in replaced_modules {
+            let Some(module) = self._graph.get_module_by_name(module_name) else {
+                continue;
+            };
+            let module = module.token();
+            for imported in self
+                ._graph
+                .modules_directly_imported_by(module)
+                .collect::<Vec<_>>()
+            {
+                self._graph.remove_import(module, imported);
+                previously_imported.insert(imported);
+            }
+        }
+        for module_name in &removed_modules {
+            // Removing a module removes its descendants too, so it may already have gone.
+            if let Some(module) = self._graph.get_module_by_name(module_name) {
+                self._graph.remove_module(module.token());
+            }
+        }
+
+        self.add_imports_by_module_checked(&imports_by_module, &package_names)?;
+
+        for imported in previously_imported {
+            let Some(module) = self._graph.get_module(imported) else {
+                continue;
+            };
+            let is_unused_external = module.is_squashed()
+                && is_external(self._graph.module_name(imported), &package_names)
+                && self
+                    ._graph
+                    .modules_that_directly_import(imported)
+                    .next()
+                    .is_none();
+            if is_unused_external {
+                self._graph.remove_module(imported);
+            }
+        }
+        Ok(())
     }
 
     #[pyo3(signature = (*, importer, imported))]
     pub fn remove_import(&mut self, importer: &str, imported: &str) -> PyResult<()> {
+        self.check_not_frozen()?;
         let importer = self.get_visible_module_by_name(importer)?.token();
         let imported = self.get_visible_module_by_name(imported)?.token();
         self._graph.remove_import(importer, imported);
@@ -301,7 +576,7 @@ impl GraphWrapper {
         self._graph.count_imports()
     }
 
-    pub fn find_children(&self, module: &str) -> PyResult<HashSet<String>> {
+    pub fn find_children(&self, module: &str) -> PyResult<HashSet<&str>> {
         let module = self
             ._graph
             .get_module_by_name(module)
@@ -310,11 +585,11 @@ impl GraphWrapper {
             ._graph
             .get_module_children(module.token())
             .visible()
-            .names()
+            .names(&self._graph)
             .collect())
     }
 
-    pub fn find_descendants(&self, module: &str) -> PyResult<HashSet<String>> {
+    pub fn find_descendants(&self, module: &str) -> PyResult<HashSet<&str>> {
         let module = self
             ._graph
             .get_module_by_name(module)
@@ -323,17 +598,17 @@ impl GraphWrapper {
             ._graph
             .get_module_descendants(module.token())
             .visible()
-            .names()
+            .names(&self._graph)
             .collect())
     }
 
-    pub fn find_matching_modules(&self, expression: &str) -> PyResult<HashSet<String>> {
+    pub fn find_matching_modules(&self, expression: &str) -> PyResult<HashSet<&str>> {
         let expression: ModuleExpression = expression.parse()?;
         Ok(self
             ._graph
             .find_matching_modules(&expression)
             .visible()
-            .names()
+            .names(&self._graph)
             .collect())
     }
 
@@ -351,27 +626,25 @@ impl GraphWrapper {
             .direct_import_exists(importer, imported, as_packages)?)
     }
 
-    pub fn find_modules_directly_imported_by(&self, module: &str) -> PyResult<HashSet<String>> {
+    pub fn find_modules_directly_imported_by(&self, module: &str) -> PyResult<HashSet<&str>> {
         let module = self.get_visible_module_by_name(module)?.token();
         Ok(self
             ._graph
             .modules_directly_imported_by(module)
-            .iter()
-            .into_module_iterator(&self._graph)
+            .map(|module| self._graph.get_module(module).unwrap())
             .visible()
-            .names()
+            .names(&self._graph)
             .collect())
     }
 
-    pub fn find_modules_that_directly_import(&self, module: &str) -> PyResult<HashSet<String>> {
+    pub fn find_modules_that_directly_import(&self, module: &str) -> PyResult<HashSet<&str>> {
         let module = self.get_visible_module_by_name(module)?.token();
         Ok(self
             ._graph
             .modules_that_directly_import(module)
-            .iter()
-            .into_module_iterator(&self._graph)
+            .map(|module| self._graph.get_module(module).unwrap())
             .visible()
-            .names()
+            .names(&self._graph)
             .collect())
     }
 
@@ -398,10 +671,10 @@ impl GraphWrapper {
                 .iter()
                 .map(|import_details| {
                     ImportDetails::new(
-                        importer.name(),
-                        imported.name(),
+                        self._graph.module_name(importer.token()).to_owned(),
+                        self._graph.module_name(imported.token()).to_owned(),
                         import_details.line_number(),
-                        import_details.line_contents(),
+                        self._graph.import_line_contents(import_details).to_owned(),
                     )
                 })
                 .sorted()
@@ -443,9 +716,10 @@ impl GraphWrapper {
             matching_imports
                 .into_iter()
                 .map(|(importer, imported)| {
-                    let importer = self._graph.get_module(importer).unwrap();
-                    let imported = self._graph.get_module(imported).unwrap();
-                    Import::new(importer.name(), imported.name())
+                    Import::new(
+                        self._graph.module_name(importer).to_owned(),
+                        self._graph.module_name(imported).to_owned(),
+                    )
                 })
                 .sorted()
                 .map(|import| {
@@ -459,73 +733,133 @@ impl GraphWrapper {
         )
     }
 
+    #[pyo3(signature = (*, depth=None, packages=None))]
+    pub fn collapse_imports<'py>(
+        &self,
+        py: Python<'py>,
+        depth: Option<usize>,
+        packages: Option<HashSet<String>>,
+    ) -> PyResult<Bound<'py, PyDict>> {
+        let packages = match packages {
+            Some(packages) => Some(
+                packages
+                    .iter()
+                    .map(|package| Ok(self.get_visible_module_by_name(package)?.token()))
+                    .collect::<Result<FxHashSet<_>, ModuleNotPresent>>()?,
+            ),
+            None => None,
+        };
+        let collapse = match (depth, &packages) {
+            (Some(depth), None) => Collapse::ToDepth(depth),
+            (None, Some(packages)) => Collapse::ToPackages(packages),
+            _ => {
+                return Err(PyValueError::new_err(
+                    "Exactly one of depth and packages must be passed.",
+                ));
+            }
+        };
+        let import_counts = py.detach(|| self._graph.collapse_imports(collapse));
+
+        let python_import_counts = PyDict::new(py);
+        for ((importer, imported), count) in import_counts {
+            python_import_counts.set_item(
+                (
+                    self._graph.module_name(importer),
+                    self._graph.module_name(imported),
+                ),
+                count,
+            )?;
+        }
+        Ok(python_import_counts)
+    }
+
     #[allow(unused_variables)]
     #[pyo3(signature = (module, as_package=false))]
     pub fn find_downstream_modules(
         &self,
+        py: Python<'_>,
         module: &str,
         as_package: bool,
-    ) -> PyResult<HashSet<String>> {
+    ) -> PyResult<HashSet<&str>> {
         let module = self.get_visible_module_by_name(module)?.token();
-        Ok(self
-            ._graph
-            .find_downstream_modules(module, as_package)
-            .iter()
-            .into_module_iterator(&self._graph)
-            .visible()
-            .names()
-            .collect())
+        Ok(py.detach(|| {
+            self._graph
+                .find_downstream_modules(module, as_package)
+                .iter()
+                .into_module_iterator(&self._graph)
+                .visible()
+                .names(&self._graph)
+                .collect()
+        }))
     }
 
     #[allow(unused_variables)]
     #[pyo3(signature = (module, as_package=false))]
     pub fn find_upstream_modules(
         &self,
+        py: Python<'_>,
         module: &str,
         as_package: bool,
-    ) -> PyResult<HashSet<String>> {
+    ) -> PyResult<HashSet<&str>> {
         let module = self.get_visible_module_by_name(module)?.token();
-        Ok(self
-            ._graph
-            .find_upstream_modules(module, as_package)
-            .iter()
-            .into_module_iterator(&self._graph)
-            .visible()
-            .names()
-            .collect())
+        Ok(py.detach(|| {
+            self._graph
+                .find_upstream_modules(module, as_package)
+                .iter()
+                .into_module_iterator(&self._graph)
+                .visible()
+                .names(&self._graph)
+                .collect()
+        }))
     }
 
     #[pyo3(signature = (importer, imported, as_packages=false))]
     pub fn find_shortest_chain(
         &self,
+        py: Python<'_>,
         importer: &str,
         imported: &str,
         as_packages: bool,
-    ) -> PyResult<Option<Vec<String>>> {
+    ) -> PyResult<Option<Vec<&str>>> {
         let importer = self.get_visible_module_by_name(importer)?.token();
         let imported = self.get_visible_module_by_name(imported)?.token();
-        Ok(self
-            ._graph
-            .find_shortest_chain(importer, imported, as_packages)?
-            .map(|chain| {
-                chain
-                    .iter()
-                    .into_module_iterator(&self._graph)
-                    .names()
-                    .collect()
-            }))
+        let chain = py.detach(|| {
+            self._graph
+                .find_shortest_chain(importer, imported, as_packages)
+        })?;
+        Ok(chain.map(|chain| {
+            chain
+                .iter()
+                .into_module_iterator(&self._graph)
+                .names(&self._graph)
+                .collect()
+        }))
     }
 
     #[pyo3(signature = (importer, imported, as_packages=false))]
     pub fn chain_exists(
         &self,
+        py: Python<'_>,
         importer: &str,
         imported: &str,
         as_packages: bool,
     ) -> PyResult<bool> {
         let importer = self.get_visible_module_by_name(importer)?.token();
         let imported = self.get_visible_module_by_name(imported)?.token();
-        Ok(self._graph.chain_exists(importer, imported, as_packages)?)
+        Ok(py.detach(|| self._graph.chain_exists(importer, imported, as_packages))?)
+    }
+
+    pub fn build_reachability_index(slf: &Bound<'_, Self>) -> PyResult<()> {
+        // The index is built with the graph only borrowed immutably, like any other query, so
+        // that other threads can go on querying the graph in the meantime.
+        let index = {
+            let graph_wrapper = slf.try_borrow()?;
+            let graph = &graph_wrapper._graph;
+            slf.py().detach(|| ReachabilityIndex::build(graph))
+        };
+        // The GIL has been held since the borrow ended, so the graph can't have changed.
+        slf.try_borrow_mut()?._graph.set_reachability_index(index);
+        Ok(())
     }
 
     #[pyo3(signature = (importer, imported, as_packages=true))]
@@ -538,9 +872,11 @@ impl GraphWrapper {
     ) -> PyResult<Bound<'py, PySet>> {
         let importer = self.get_visible_module_by_name(importer)?.token();
         let imported = self.get_visible_module_by_name(imported)?.token();
-        let chains = self
-            ._graph
-            .find_shortest_chains(importer, imported, as_packages)?
+        let chains = py
+            .detach(|| {
+                self._graph
+                    .find_shortest_chains(importer, imported, as_packages)
+            })?
             .into_iter()
             .map(|chain| {
                 PyTuple::new(
@@ -548,7 +884,7 @@ impl GraphWrapper {
                     chain
                         .iter()
                         .into_module_iterator(&self._graph)
-                        .names()
+                        .names(&self._graph)
                         .collect::<Vec<_>>(),
                 )
                 .unwrap()
@@ -556,40 +892,141 @@ impl GraphWrapper {
         PySet::new(py, chains)
     }
 
-    #[pyo3(signature = (layers, containers))]
+    #[pyo3(signature = (importer, imported, as_packages=true, limit=None))]
+    pub fn iter_shortest_chains(
+        slf: &Bound<'_, Self>,
+        importer: &str,
+        imported: &str,
+        as_packages: bool,
+        limit: Option<usize>,
+    ) -> PyResult<ShortestChainsIterator> {
+        let wrapper = slf.borrow();
+        let graph = &wrapper._graph;
+        let mut downstream_modules =
+            FxHashSet::from_iter([wrapper.get_visible_module_by_name(importer)?.token()]);
+        let mut upstream_modules =
+            FxHashSet::from_iter([wrapper.get_visible_module_by_name(imported)?.token()]);
+        if as_packages {
+            downstream_modules.extend_with_descendants(graph);
+            upstream_modules.extend_with_descendants(graph);
+        }
+        Ok(ShortestChainsIterator {
+            graph: slf.clone().unbind(),
+            generation: graph.generation,
+            chains: DisjointShortestPaths::new(
+                Cow::Owned(downstream_modules),
+                Cow::Owned(upstream_modules),
+                Cow::Owned(FxHashSet::default()),
+            )?,
+            remaining: limit,
+        })
+    }
+
+    pub fn find_shortest_chains_many<'py>(
+        &self,
+        py: Python<'py>,
+        queries: Vec<(PyBackedStr, PyBackedStr, bool)>,
+    ) -> PyResult<Bound<'py, PyList>> {
+        let queries = self.parse_chain_queries(&queries)?;
+        let chains_by_query = py.detach(|| {
+            queries
+                .par_iter()
+                .map(|(importer, imported, as_packages)| {
+                    self._graph
+                        .find_shortest_chains(*importer, *imported, *as_packages)
+                })
+                .collect::<GrimpResult<Vec<_>>>()
+        })?;
+        let chains_by_query = chains_by_query
+            .into_iter()
+            .map(|chains| {
+                PySet::new(
+                    py,
+                    chains.into_iter().map(|chain| {
+                        PyTuple::new(
+                            py,
+                            chain
+                                .iter()
+                                .into_module_iterator(&self._graph)
+                                .names(&self._graph)
+                                .collect::<Vec<_>>(),
+                        )
+                        .unwrap()
+                    }),
+                )
+            })
+            .collect::<PyResult<Vec<_>>>()?;
+        PyList::new(py, chains_by_query)
+    }
+
+    pub fn chain_exists_many(
+        &self,
+        py: Python<'_>,
+        queries: Vec<(PyBackedStr, PyBackedStr, bool)>,
+    ) -> PyResult<Vec<bool>> {
+        let queries = self.parse_chain_queries(&queries)?;
+        Ok(py.detach(|| {
+            queries
+                .par_iter()
+                .map(|(importer, imported, as_packages)| {
+                    self._graph.chain_exists(*importer, *imported, *as_packages)
+                })
+                .collect::<GrimpResult<Vec<_>>>()
+        })?)
+    }
+
+    #[pyo3(signature = (layers, containers, max_routes_per_dependency=None, timeout=None))]
     pub fn find_illegal_dependencies_for_layers<'py>(
         &self,
         py: Python<'py>,
         layers: &Bound<'py, PyTuple>,
         containers: HashSet<String>,
+        max_routes_per_dependency: Option<usize>,
+        timeout: Option<f64>,
     ) -> PyResult<Bound<'py, PyTuple>> {
+        let limits = RouteLimits {
+            max_routes_per_dependency,
+            deadline: match timeout {
+                Some(timeout) => Some(
+                    Instant::now()
+                        + Duration::try_from_secs_f64(timeout)
+                            .map_err(|e| PyValueError::new_err(e.to_string()))?,
+                ),
+                None => None,
+            },
+        };
         let containers = self.parse_containers(&containers)?;
         let levels_by_container = self.parse_levels_by_container(layers, &containers);
 
-        let illegal_dependencies = levels_by_container
-            .into_iter()
-            .par_bridge()
-            .try_fold(
-                Vec::new,
-                |mut v: Vec<PyPackageDependency>, levels| -> GrimpResult<_> {
-                    v.extend(self._graph.find_illegal_dependencies_for_layers(&levels)?);
-                    Ok(v)
-                },
-            )
-            .try_reduce(
-                Vec::new,
-                |mut v: Vec<PyPackageDependency>, package_dependencies| {
-                    v.extend(package_dependencies);
-                    Ok(v)
-                },
-            )?;
+        let illegal_dependencies = py.detach(|| {
+            levels_by_container
+                .into_iter()
+                .par_bridge()
+                .try_fold(
+                    Vec::new,
+                    |mut v: Vec<PyPackageDependency>, levels| -> GrimpResult<_> {
+                        v.extend(
+                            self._graph
+                                .find_illegal_dependencies_for_layers(&levels, &limits)?,
+                        );
+                        Ok(v)
+                    },
+                )
+                .try_reduce(
+                    Vec::new,
+                    |mut v: Vec<PyPackageDependency>, package_dependencies| {
+                        v.extend(package_dependencies);
+                        Ok(v)
+                    },
+                )
+        })?;
 
         let illegal_dependencies = illegal_dependencies
             .into_iter()
             .map(|dep| {
                 PackageDependency::new(
-                    self._graph.get_module(*dep.importer()).unwrap().name(),
-                    self._graph.get_module(*dep.imported()).unwrap().name(),
+                    self._graph.module_name(*dep.importer()).to_owned(),
+                    self._graph.module_name(*dep.imported()).to_owned(),
                     dep.routes()
                         .iter()
                         .map(|route| {
@@ -597,21 +1034,22 @@ impl GraphWrapper {
                                 route
                                     .heads()
                                     .iter()
-                                    .map(|m| self._graph.get_module(*m).unwrap().name())
+                                    .map(|m| self._graph.module_name(*m).to_owned())
                                     .collect(),
                                 route
                                     .middle()
                                     .iter()
-                                    .map(|m| self._graph.get_module(*m).unwrap().name())
+                                    .map(|m| self._graph.module_name(*m).to_owned())
                                     .collect(),
                                 route
                                     .tails()
                                     .iter()
-                                    .map(|m| self._graph.get_module(*m).unwrap().name())
+                                    .map(|m| self._graph.module_name(*m).to_owned())
                                     .collect(),
                             )
                         })
                         .collect(),
+                    dep.truncated(),
                 )
             })
             .sorted()
@@ -626,33 +1064,167 @@ impl GraphWrapper {
         package: &str,
     ) -> PyResult<Bound<'py, PySet>> {
         let package = self.get_visible_module_by_name(package)?.token();
-        let cycle_breakers = self._graph.nominate_cycle_breakers(package)?;
+        let cycle_breakers = py.detach(|| self._graph.nominate_cycle_breakers(package))?;
+        self.convert_cycle_breakers_to_python(py, cycle_breakers)
+    }
+
+    #[pyo3(signature = (packages=None))]
+    pub fn nominate_cycle_breakers_by_package<'py>(
+        &self,
+        py: Python<'py>,
+        packages: Option<HashSet<String>>,
+    ) -> PyResult<Bound<'py, PyDict>> {
+        let packages = match packages {
+            Some(packages) => Some(
+                packages
+                    .iter()
+                    .map(|package| Ok(self.get_visible_module_by_name(package)?.token()))
+                    .collect::<Result<FxHashSet<_>, ModuleNotPresent>>()?,
+            ),
+            None => None,
+        };
+        let cycle_breakers_by_package = py.detach(|| {
+            self._graph
+                .nominate_cycle_breakers_by_package(packages.as_ref())
+        });
+        let python_cycle_breakers_by_package = PyDict::new(py);
+        for (package, cycle_breakers) in cycle_breakers_by_package {
+            python_cycle_breakers_by_package.set_item(
+                self._graph.module_name(package),
+                self.convert_cycle_breakers_to_python(py, cycle_breakers)?,
+            )?;
+        }
+        Ok(python_cycle_breakers_by_package)
+    }
+
+    #[pyo3(signature = (package=None))]
+    pub fn find_strongly_connected_components<'py>(
+        &self,
+        py: Python<'py>,
+        package: Option<&str>,
+    ) -> PyResult<Bound<'py, PySet>> {
+        let package = match package {
+            Some(package) => Some(self.get_visible_module_by_name(package)?.token()),
+            None => None,
+        };
+        let components = py.detach(|| self._graph.find_strongly_connected_components(package));
         PySet::new(
             py,
-            cycle_breakers
+            components
                 .into_iter()
-                .map(|(importer, imported)| {
-                    let importer = self._graph.get_module(importer).unwrap();
-                    let imported = self._graph.get_module(imported).unwrap();
-                    Import::new(importer.name(), imported.name())
+                .map(|component| {
+                    PyFrozenSet::new(
+                        py,
+                        component
+                            .into_iter()
+                            .map(|module| self._graph.module_name(module).to_owned()),
+                    )
                 })
-                .map(|import| {
+                .collect::<PyResult<Vec<_>>>()?,
+        )
+    }
+
+    #[pyo3(signature = (package=None))]
+    pub fn find_cycles<'py>(
+        &self,
+        py: Python<'py>,
+        package: Option<&str>,
+    ) -> PyResult<Bound<'py, PySet>> {
+        let package = match package {
+            Some(package) => Some(self.get_visible_module_by_name(package)?.token()),
+            None => None,
+        };
+        let cycles = py.detach(|| self._graph.find_cycles(package));
+        PySet::new(
+            py,
+            cycles
+                .into_iter()
+                .map(|cycle| {
                     PyTuple::new(
                         py,
-                        [
-                            import.importer.into_py_any(py).unwrap(),
-                            import.imported.into_py_any(py).unwrap(),
-                        ],
+                        cycle
+                            .into_iter()
+                            .map(|module| self._graph.module_name(module).to_owned()),
                     )
-                    .unwrap()
-                }),
+                })
+                .collect::<PyResult<Vec<_>>>()?,
         )
     }
 
+    pub fn freeze(&self, py: Python<'_>) -> GraphWrapper {
+        GraphWrapper {
+            _graph: py.detach(|| self._graph.freeze()),
+        }
+    }
+
+    pub fn is_frozen(&self) -> bool {
+        self._graph.is_frozen()
+    }
+
     #[pyo3(name = "clone")]
     pub fn clone_py(&self) -> GraphWrapper {
         self.clone()
     }
+
+    pub fn to_snapshot<'py>(&self, py: Python<'py>) -> Bound<'py, PyBytes> {
+        let snapshot = py.detach(|| self._graph.to_snapshot());
+        PyBytes::new(py, &snapshot)
+    }
+
+    #[staticmethod]
+    pub fn from_snapshot(py: Python<'_>, snapshot: &[u8]) -> PyResult<GraphWrapper> {
+        Ok(GraphWrapper {
+            _graph: py.detach(|| Graph::from_snapshot(snapshot))?,
+        })
+    }
+}
+
+/// Yields the chains found by `find_shortest_chains`, one at a time, as they are found.
+#[pyclass]
+pub struct ShortestChainsIterator {
+    graph: Py<GraphWrapper>,
+    // The generation of the graph when iteration started.
+    generation: u64,
+    chains: DisjointShortestPaths<'static>,
+    // How many more chains may be yielded, if limited.
+    remaining: Option<usize>,
+}
+
+#[pymethods]
+impl ShortestChainsIterator {
+    fn __iter__(slf: PyRef<'_, Self>) -> PyRef<'_, Self> {
+        slf
+    }
+
+    fn __next__<'py>(&mut self, py: Python<'py>) -> PyResult<Option<Bound<'py, PyTuple>>> {
+        if self.remaining == Some(0) {
+            return Ok(None);
+        }
+        // The graph can't be borrowed if another thread is changing it.
+        let Ok(wrapper) = self.graph.bind(py).try_borrow() else {
+            return Err(PyRuntimeError::new_err("Graph changed during iteration."));
+        };
+        let graph = &wrapper._graph;
+        if graph.generation != self.generation {
+            return Err(PyRuntimeError::new_err("Graph changed during iteration."));
+        }
+
+        let chains = &mut self.chains;
+        let Some(chain) = py.detach(|| chains.next_path(graph)) else {
+            return Ok(None);
+        };
+        if let Some(remaining) = &mut self.remaining {
+            *remaining -= 1;
+        }
+        Ok(Some(PyTuple::new(
+            py,
+            chain
+                .iter()
+                .into_module_iterator(graph)
+                .names(graph)
+                .collect::<Vec<_>>(),
+        )?))
+    }
 }
 
 #[derive(Debug, Clone, PartialEq, Eq, PartialOrd, Ord, new)]
@@ -674,6 +1246,7 @@ struct PackageDependency {
     importer: String,
     imported: String,
     routes: Vec<Route>,
+    truncated: bool,
 }
 
 #[derive(Debug, Clone, PartialEq, Eq, PartialOrd, Ord, new)]
@@ -683,6 +1256,15 @@ struct Route {
     tails: Vec<String>,
 }
 
+/// Whether the module is outside all of the packages.
+fn is_external(module_name: &str, package_names: &HashSet<String>) -> bool {
+    !package_names.iter().any(|package_name| {
+        module_name
+            .strip_prefix(package_name.as_str())
+            .is_some_and(|rest| rest.is_empty() || rest.starts_with('.'))
+    })
+}
+
 impl From<ModuleToken> for Vec<ModuleToken> {
     fn from(value: ModuleToken) -> Self {
         vec![value]
@@ -727,9 +1309,8 @@ pub trait ModuleIterator<'a>: Iterator<Item = &'a Module> + Sized {
         self.map(|m| m.interned_name)
     }
 
-    fn names(self) -> impl Iterator<Item = String> {
-        let interner = MODULE_NAMES.read().unwrap();
-        self.map(move |m| interner.resolve(m.interned_name).unwrap().to_owned())
+    fn names(self, graph: &'a Graph) -> impl Iterator<Item = &'a str> {
+        self.map(|m| graph.module_names.resolve(m.interned_name).unwrap())
     }
 
     fn visible(self) -> impl ModuleIterator<'a> {
@@ -755,13 +1336,3 @@ pub struct PyImportDetails {
     #[getset(get_copy = "pub")]
     interned_line_contents: DefaultSymbol,
 }
-
-impl PyImportDetails {
-    pub fn line_contents(&self) -> String {
-        let interner = IMPORT_LINE_CONTENTS.read().unwrap();
-        interner
-            .resolve(self.interned_line_contents)
-            .unwrap()
-            .to_owned()
-    }
-}
@@ -1,26 +1,30 @@
 use crate::errors::{GrimpError, GrimpResult};
 use crate::graph::{EMPTY_MODULE_TOKENS, Graph, ModuleToken};
 use indexmap::{IndexMap, IndexSet};
+use itertools::Itertools;
 use rustc_hash::{FxHashMap, FxHashSet, FxHasher};
 use slotmap::SecondaryMap;
+use std::borrow::Cow;
+use std::collections::VecDeque;
 use std::hash::BuildHasherDefault;
+use std::iter;
 
 type FxIndexSet<K> = IndexSet<K, BuildHasherDefault<FxHasher>>;
 type FxIndexMap<K, V> = IndexMap<K, V, BuildHasherDefault<FxHasher>>;
 
-pub fn find_reach(
-    imports_map: &SecondaryMap<ModuleToken, FxHashSet<ModuleToken>>,
+/// Finds the modules reachable from the supplied modules, where `next_modules` returns the
+/// modules directly reachable from a module.
+pub fn find_reach<I: Iterator<Item = ModuleToken>>(
     from_modules: &FxHashSet<ModuleToken>,
+    next_modules: impl Fn(ModuleToken) -> I,
 ) -> FxHashSet<ModuleToken> {
     let mut seen = FxIndexSet::default();
     seen.extend(from_modules.iter().cloned());
 
     let mut i = 0;
     while let Some(module) = seen.get_index(i) {
-        for next_module in imports_map.get(*module).unwrap_or(&EMPTY_MODULE_TOKENS) {
-            if !seen.contains(next_module) {
-                seen.insert(*next_module);
-            }
+        for next_module in next_modules(*module) {
+            seen.insert(next_module);
         }
         i += 1;
     }
@@ -53,16 +57,15 @@ pub fn find_shortest_path(
     let middle = 'l: loop {
         for _ in 0..(predecessors.len() - i_forwards) {
             let module = *predecessors.get_index(i_forwards).unwrap().0;
-            let next_modules = graph.imports.get(module).unwrap();
-            for next_module in next_modules {
-                if import_is_excluded(&module, next_module, excluded_modules, excluded_imports) {
+            for next_module in graph.modules_directly_imported_by(module) {
+                if import_is_excluded(&module, &next_module, excluded_modules, excluded_imports) {
                     continue;
                 }
-                if !predecessors.contains_key(next_module) {
-                    predecessors.insert(*next_module, Some(module));
+                if !predecessors.contains_key(&next_module) {
+                    predecessors.insert(next_module, Some(module));
                 }
-                if successors.contains_key(next_module) {
-                    break 'l Some(*next_module);
+                if successors.contains_key(&next_module) {
+                    break 'l Some(next_module);
                 }
             }
             i_forwards += 1;
@@ -70,16 +73,15 @@ pub fn find_shortest_path(
 
         for _ in 0..(successors.len() - i_backwards) {
             let module = *successors.get_index(i_backwards).unwrap().0;
-            let next_modules = graph.reverse_imports.get(module).unwrap();
-            for next_module in next_modules {
-                if import_is_excluded(next_module, &module, excluded_modules, excluded_imports) {
+            for next_module in graph.modules_that_directly_import(module) {
+                if import_is_excluded(&next_module, &module, excluded_modules, excluded_imports) {
                     continue;
                 }
-                if !successors.contains_key(next_module) {
-                    successors.insert(*next_module, Some(module));
+                if !successors.contains_key(&next_module) {
+                    successors.insert(next_module, Some(module));
                 }
-                if predecessors.contains_key(next_module) {
-                    break 'l Some(*next_module);
+                if predecessors.contains_key(&next_module) {
+                    break 'l Some(next_module);
                 }
             }
             i_backwards += 1;
@@ -109,6 +111,224 @@ pub fn find_shortest_path(
     }))
 }
 
+/// Finds shortest paths that share no imports, until no more paths remain.
+///
+/// See `DisjointShortestPaths`, which finds the same paths one at a time.
+pub fn find_disjoint_shortest_paths(
+    graph: &Graph,
+    from_modules: &FxHashSet<ModuleToken>,
+    to_modules: &FxHashSet<ModuleToken>,
+    excluded_modules: &FxHashSet<ModuleToken>,
+) -> GrimpResult<Vec<Vec<ModuleToken>>> {
+    let mut paths = DisjointShortestPaths::new(
+        Cow::Borrowed(from_modules),
+        Cow::Borrowed(to_modules),
+        Cow::Borrowed(excluded_modules),
+    )?;
+    Ok(iter::from_fn(|| paths.next_path(graph)).collect())
+}
+
+/// Finds shortest paths that share no imports, one at a time, until no more paths remain.
+///
+/// The paths are found in phases, as in Dinic's algorithm, rather than by searching the whole
+/// graph for every path. Each phase labels the modules with their distance to the `to_modules`,
+/// then follows imports that step one closer each time, finding a maximal set of paths of the
+/// shortest remaining length that share no imports: no path of that length can be added
+/// without reusing an import, though a different choice of paths might have found more.
+/// Removing imports can only make paths longer, so only one search of the graph is needed per
+/// length of path.
+///
+/// Excluded modules that are also `from_modules` or `to_modules` are allowed at the ends of
+/// paths (see `PathSearch::import_is_excluded`), so a package can be excluded without ruling
+/// out paths that start or end in it. Paths don't pass through any other excluded modules.
+/// The graph must not change between calls to `next_path`.
+#[derive(Debug)]
+pub struct DisjointShortestPaths<'a> {
+    search: PathSearch<'a>,
+    phase: Option<ShortestPathsPhase>,
+    finished: bool,
+}
+
+impl<'a> DisjointShortestPaths<'a> {
+    pub fn new(
+        from_modules: Cow<'a, FxHashSet<ModuleToken>>,
+        to_modules: Cow<'a, FxHashSet<ModuleToken>>,
+        excluded_modules: Cow<'a, FxHashSet<ModuleToken>>,
+    ) -> GrimpResult<Self> {
+        if !from_modules.is_disjoint(&to_modules) {
+            return Err(GrimpError::SharedDescendants);
+        }
+        Ok(DisjointShortestPaths {
+            search: PathSearch {
+                from_modules,
+                to_modules,
+                excluded_modules,
+                excluded_imports: FxHashMap::default(),
+            },
+            phase: None,
+            finished: false,
+        })
+    }
+
+    pub fn next_path(&mut self, graph: &Graph) -> Option<Vec<ModuleToken>> {
+        while !self.finished {
+            if self.phase.is_none() {
+                self.phase = self.search.start_phase(graph);
+                self.finished = self.phase.is_none();
+                continue;
+            }
+            let phase = self.phase.as_mut().unwrap();
+            while let Some(from_module) = phase.remaining_from_modules.last().copied() {
+                if let Some(path) = phase.find_path(graph, &self.search, from_module) {
+                    for (importer, imported) in path.iter().tuple_windows() {
+                        self.search
+                            .excluded_imports
+                            .entry(*importer)
+                            .or_default()
+                            .insert(*imported);
+                    }
+                    return Some(path);
+                }
+                phase.remaining_from_modules.pop();
+            }
+            self.phase = None;
+        }
+        None
+    }
+}
+
+/// The modules to find paths between, and the modules and imports that paths may not use.
+#[derive(Debug)]
+struct PathSearch<'a> {
+    from_modules: Cow<'a, FxHashSet<ModuleToken>>,
+    to_modules: Cow<'a, FxHashSet<ModuleToken>>,
+    excluded_modules: Cow<'a, FxHashSet<ModuleToken>>,
+    // The imports of the paths found so far.
+    excluded_imports: FxHashMap<ModuleToken, FxHashSet<ModuleToken>>,
+}
+
+impl PathSearch<'_> {
+    fn import_is_excluded(&self, importer: ModuleToken, imported: ModuleToken) -> bool {
+        (self.excluded_modules.contains(&imported)
+            && !self.from_modules.contains(&imported)
+            && !self.to_modules.contains(&imported))
+            || self
+                .excluded_imports
+                .get(&importer)
+                .is_some_and(|imported_modules| imported_modules.contains(&imported))
+    }
+
+    /// Labels modules with the length of the shortest path from them to any of the `to_modules`,
+    /// via a backwards BFS. The search stops once the nearest of the `from_modules` have been
+    /// labelled. Returns `None` if none of them can be reached.
+    fn start_phase(&self, graph: &Graph) -> Option<ShortestPathsPhase> {
+        let mut distances = SecondaryMap::default();
+        let mut queue = VecDeque::new();
+        for module in self.to_modules.iter() {
+            distances.insert(*module, 0);
+            queue.push_back(*module);
+        }
+
+        let mut shortest_distance = None;
+        while let Some(module) = queue.pop_front() {
+            let distance = distances[module] + 1;
+            if shortest_distance.is_some_and(|shortest_distance| distance > shortest_distance) {
+                break;
+            }
+            for importer in graph.modules_that_directly_import(module) {
+                if distances.contains_key(importer) || self.import_is_excluded(importer, module) {
+                    continue;
+                }
+                distances.insert(importer, distance);
+                queue.push_back(importer);
+                if self.from_modules.contains(&importer) {
+                    shortest_distance.get_or_insert(distance);
+                }
+            }
+        }
+
+        let shortest_distance = shortest_distance?;
+        let remaining_from_modules = self
+            .from_modules
+            .iter()
+            .copied()
+            .filter(|module| distances.get(*module) == Some(&shortest_distance))
+            .collect();
+        Some(ShortestPathsPhase {
+            distances,
+            remaining_from_modules,
+            next_modules: SecondaryMap::default(),
+            dead_ends: FxHashSet::default(),
+        })
+    }
+}
+
+/// Finds paths that are as short as possible, given the distances found at the start of a phase.
+#[derive(Debug)]
+struct ShortestPathsPhase {
+    distances: SecondaryMap<ModuleToken, u32>,
+    // The nearest `from_modules` that paths may still be found from.
+    remaining_from_modules: Vec<ModuleToken>,
+    // For each module visited, the modules it imports that are one step closer to the
+    // `to_modules`, and how many of those have been ruled out so far.
+    next_modules: SecondaryMap<ModuleToken, (Vec<ModuleToken>, usize)>,
+    // Modules with no remaining path of the right length.
+    dead_ends: FxHashSet<ModuleToken>,
+}
+
+impl ShortestPathsPhase {
+    fn find_path(
+        &mut self,
+        graph: &Graph,
+        search: &PathSearch,
+        from_module: ModuleToken,
+    ) -> Option<Vec<ModuleToken>> {
+        let mut path = vec![from_module];
+        while let Some(module) = path.last().copied() {
+            if self.distances[module] == 0 {
+                return Some(path);
+            }
+            match self.next_module(graph, search, module) {
+                Some(next_module) => path.push(next_module),
+                None => {
+                    self.dead_ends.insert(module);
+                    path.pop();
+                }
+            }
+        }
+        None
+    }
+
+    fn next_module(
+        &mut self,
+        graph: &Graph,
+        search: &PathSearch,
+        module: ModuleToken,
+    ) -> Option<ModuleToken> {
+        let distances = &self.distances;
+        let next_distance = distances[module] - 1;
+        let (next_modules, ruled_out) =
+            self.next_modules.entry(module).unwrap().or_insert_with(|| {
+                let next_modules = graph
+                    .modules_directly_imported_by(module)
+                    .filter(|next_module| distances.get(*next_module) == Some(&next_distance))
+                    .collect();
+                (next_modules, 0)
+            });
+
+        // Modules and imports are only ever ruled out, so there's no need to check them again.
+        while let Some(next_module) = next_modules.get(*ruled_out).copied() {
+            if !self.dead_ends.contains(&next_module)
+                && !search.import_is_excluded(module, next_module)
+            {
+                return Some(next_module);
+            }
+            *ruled_out += 1;
+        }
+        None
+    }
+}
+
 fn import_is_excluded(
     from_module: &ModuleToken,
     to_module: &ModuleToken,
@@ -124,3 +344,71 @@ fn import_is_excluded(
             .contains(to_module)
     }
 }
+
+/// Finds the strongly connected components of the graph, using an iterative version of
+/// Tarjan's algorithm. `imports_of` returns the modules directly imported by a module.
+///
+/// Components are returned in reverse topological order: each component comes after all the
+/// components that it imports.
+pub fn find_strongly_connected_components<I: Iterator<Item = ModuleToken>>(
+    modules: impl IntoIterator<Item = ModuleToken>,
+    imports_of: impl Fn(ModuleToken) -> I,
+) -> Vec<Vec<ModuleToken>> {
+    let mut indices: SecondaryMap<ModuleToken, u32> = SecondaryMap::default();
+    let mut lowlinks: SecondaryMap<ModuleToken, u32> = SecondaryMap::default();
+    let mut stack = vec![];
+    let mut on_stack = FxHashSet::default();
+    let mut components = vec![];
+
+    for root in modules {
+        if indices.contains_key(root) {
+            continue;
+        }
+        // The modules being visited, along with the imports that are still to be followed.
+        let mut call_stack = vec![(root, imports_of(root))];
+        let index = indices.len() as u32;
+        indices.insert(root, index);
+        lowlinks.insert(root, index);
+        stack.push(root);
+        on_stack.insert(root);
+
+        while let Some((module, next_modules)) = call_stack.last_mut() {
+            let module = *module;
+            match next_modules.next() {
+                Some(next_module) if !indices.contains_key(next_module) => {
+                    let index = indices.len() as u32;
+                    indices.insert(next_module, index);
+                    lowlinks.insert(next_module, index);
+                    stack.push(next_module);
+                    on_stack.insert(next_module);
+                    call_stack.push((next_module, imports_of(next_module)));
+                }
+                Some(next_module) => {
+                    if on_stack.contains(&next_module) {
+                        lowlinks[module] = lowlinks[module].min(indices[next_module]);
+                    }
+                }
+                None => {
+                    call_stack.pop();
+                    if let Some((parent, _)) = call_stack.last() {
+                        lowlinks[*parent] = lowlinks[*parent].min(lowlinks[module]);
+                    }
+                    if lowlinks[module] == indices[module] {
+                        let mut component = vec![];
+                        loop {
+                            let member = stack.pop().unwrap();
+                            on_stack.remove(&member);
+                            component.push(member);
+                            if member == module {
+                                break;
+                            }
+                        }
+                        components.push(component);
+                    }
+                }
+            }
+        }
+    }
+
+    components
+}
@@ -0,0 +1,281 @@
+//! A precomputed index of which modules import which, even indirectly.
+//!
+//! Modules that import each other (even indirectly) are grouped into strongly connected
+//! components. The graph of components has no cycles, so the components reachable from each
+//! component can be found in a single pass over them in reverse topological order. These are
+//! stored as a bitset per component, so each reachability query only needs to look up and combine
+//! a few bitsets rather than search the graph.
+//!
+//! The index takes space quadratic in the number of components, so it is only built on request.
+//! Any change to the graph discards it.
+use crate::graph::pathfinding::find_strongly_connected_components;
+use crate::graph::{Graph, ModuleToken};
+use rustc_hash::FxHashSet;
+use slotmap::SecondaryMap;
+use std::sync::Arc;
+
+const BITS_PER_WORD: usize = u64::BITS as usize;
+
+#[derive(Debug)]
+pub struct ReachabilityIndex {
+    components_by_module: SecondaryMap<ModuleToken, u32>,
+    component_members: Vec<Vec<ModuleToken>>,
+    words_per_component: usize,
+    // The components reachable from each component (including itself), as consecutive bitsets.
+    reachable_components: Vec<u64>,
+}
+
+impl ReachabilityIndex {
+    pub fn build(graph: &Graph) -> Self {
+        let component_members =
+            find_strongly_connected_components(graph.modules.keys(), |module| {
+                graph.modules_directly_imported_by(module)
+            });
+
+        let mut components_by_module = SecondaryMap::default();
+        for (component, members) in component_members.iter().enumerate() {
+            for module in members {
+                components_by_module.insert(*module, component as u32);
+            }
+        }
+
+        let words_per_component = component_members.len().div_ceil(BITS_PER_WORD);
+        let mut reachable_components = vec![0; component_members.len() * words_per_component];
+        // The component that last merged in each component's bitset, to avoid doing so twice.
+        let mut last_merged_by = vec![u32::MAX; component_members.len()];
+        for (component, members) in component_members.iter().enumerate() {
+            // Components come after the components they import, so those are already complete.
+            let (complete, remaining) =
+                reachable_components.split_at_mut(component * words_per_component);
+            let reachable = &mut remaining[..words_per_component];
+            set_bit(reachable, component);
+            for module in members {
+                for imported in graph.modules_directly_imported_by(*module) {
+                    let imported_component = components_by_module[imported] as usize;
+                    if imported_component == component
+                        || last_merged_by[imported_component] == component as u32
+                    {
+                        continue;
+                    }
+                    last_merged_by[imported_component] = component as u32;
+                    let start = imported_component * words_per_component;
+                    for (word, imported_word) in reachable
+                        .iter_mut()
+                        .zip(&complete[start..start + words_per_component])
+                    {
+                        *word |= imported_word;
+                    }
+                }
+            }
+        }
+
+        ReachabilityIndex {
+            components_by_module,
+            component_members,
+            words_per_component,
+            reachable_components,
+        }
+    }
+
+    /// Whether any of the `from_modules` import any of the `to_modules`, even indirectly.
+    ///
+    /// Returns `None` if any of the modules aren't in the index.
+    pub fn chain_exists(
+        &self,
+        from_modules: &FxHashSet<ModuleToken>,
+        to_modules: &FxHashSet<ModuleToken>,
+    ) -> Option<bool> {
+        let reachable = self.reachable_from(from_modules)?;
+        for module in to_modules {
+            if get_bit(&reachable, self.component(*module)?) {
+                return Some(true);
+            }
+        }
+        Some(false)
+    }
+
+    /// The modules imported by any of the `from_modules`, even indirectly, excluding themselves.
+    ///
+    /// Returns `None` if any of the modules aren't in the index.
+    pub fn find_upstream_modules(
+        &self,
+        from_modules: &FxHashSet<ModuleToken>,
+    ) -> Option<FxHashSet<ModuleToken>> {
+        let reachable = self.reachable_from(from_modules)?;
+        Some(self.members_of_components(from_modules, |component| get_bit(&reachable, component)))
+    }
+
+    /// The modules that import any of the `from_modules`, even indirectly, excluding themselves.
+    ///
+    /// Returns `None` if any of the modules aren't in the index.
+    pub fn find_downstream_modules(
+        &self,
+        from_modules: &FxHashSet<ModuleToken>,
+    ) -> Option<FxHashSet<ModuleToken>> {
+        let mut targets = vec![0; self.words_per_component];
+        for module in from_modules {
+            set_bit(&mut targets, self.component(*module)?);
+        }
+        Some(self.members_of_components(from_modules, |component| {
+            self.reachable_components_of(component)
+                .iter()
+                .zip(&targets)
+                .any(|(word, target)| word & target != 0)
+        }))
+    }
+
+    fn component(&self, module: ModuleToken) -> Option<usize> {
+        self.components_by_module
+            .get(module)
+            .map(|component| *component as usize)
+    }
+
+    fn reachable_components_of(&self, component: usize) -> &[u64] {
+        let start = component * self.words_per_component;
+        &self.reachable_components[start..start + self.words_per_component]
+    }
+
+    fn reachable_from(&self, from_modules: &FxHashSet<ModuleToken>) -> Option<Vec<u64>> {
+        let mut reachable = vec![0; self.words_per_component];
+        for module in from_modules {
+            let component = self.component(*module)?;
+            for (word, component_word) in reachable
+                .iter_mut()
+                .zip(self.reachable_components_of(component))
+            {
+                *word |= component_word;
+            }
+        }
+        Some(reachable)
+    }
+
+    fn members_of_components(
+        &self,
+        excluded_modules: &FxHashSet<ModuleToken>,
+        include_component: impl Fn(usize) -> bool,
+    ) -> FxHashSet<ModuleToken> {
+        self.component_members
+            .iter()
+            .enumerate()
+            .filter(|(component, _)| include_component(*component))
+            .flat_map(|(_, members)| members.iter().copied())
+            .filter(|module| !excluded_modules.contains(module))
+            .collect()
+    }
+}
+
+fn set_bit(bitset: &mut [u64], i: usize) {
+    bitset[i / BITS_PER_WORD] |= 1u64 << (i % BITS_PER_WORD);
+}
+
+fn get_bit(bitset: &[u64], i: usize) -> bool {
+    bitset[i / BITS_PER_WORD] & (1u64 << (i % BITS_PER_WORD)) != 0
+}
+
+impl Graph {
+    /// Build an index for answering reachability queries without searching the graph.
+    ///
+    /// The index is used until the graph is next changed.
+    pub fn build_reachability_index(&mut self) {
+        self.set_reachability_index(ReachabilityIndex::build(self));
+    }
+
+    /// Use an index built from the graph as it is now, until the graph is next changed.
+    pub fn set_reachability_index(&mut self, index: ReachabilityIndex) {
+        self.reachability_index = Some(Arc::new(index));
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::graph::test_utils::{build_graph, tokens};
+
+    #[test]
+    fn test_index_matches_search() {
+        // A cycle (b, c, d) between an importer and an imported module, plus an unrelated import.
+        let graph = build_graph(&[
+            ("pkg.a", "pkg.b"),
+            ("pkg.b", "pkg.c"),
+            ("pkg.c", "pkg.d"),
+            ("pkg.d", "pkg.b"),
+            ("pkg.d", "pkg.e"),
+            ("pkg.f", "pkg.g"),
+        ]);
+        let index = ReachabilityIndex::build(&graph);
+
+        for from in graph.modules.keys() {
+            let from_modules = FxHashSet::from_iter([from]);
+            assert_eq!(
+                index.find_upstream_modules(&from_modules).unwrap(),
+                graph.find_upstream_modules(from, false),
+            );
+            assert_eq!(
+                index.find_downstream_modules(&from_modules).unwrap(),
+                graph.find_downstream_modules(from, false),
+            );
+            for to in graph.modules.keys().filter(|to| *to != from) {
+                assert_eq!(
+                    index
+                        .chain_exists(&from_modules, &FxHashSet::from_iter([to]))
+                        .unwrap(),
+                    graph
+                        .find_shortest_chain(from, to, false)
+                        .unwrap()
+                        .is_some(),
+                );
+            }
+        }
+    }
+
+    #[test]
+    fn test_chain_exists_between_sets_of_modules() {
+        let graph = build_graph(&[("pkg.a", "pkg.b"), ("pkg.b", "pkg.c")]);
+        let index = ReachabilityIndex::build(&graph);
+
+        assert_eq!(
+            index.chain_exists(
+                &tokens(&graph, &["pkg.c", "pkg.a"]),
+                &tokens(&graph, &["pkg.b"])
+            ),
+            Some(true)
+        );
+        assert_eq!(
+            index.chain_exists(
+                &tokens(&graph, &["pkg.c", "pkg.b"]),
+                &tokens(&graph, &["pkg.a"])
+            ),
+            Some(false)
+        );
+    }
+
+    #[test]
+    fn test_changing_graph_discards_index() {
+        let mut graph = build_graph(&[("pkg.a", "pkg.b")]);
+        graph.build_reachability_index();
+        assert!(graph.reachability_index.is_some());
+
+        let b = graph.get_module_by_name("pkg.b").unwrap().token();
+        let c = graph.get_or_add_module("pkg.c").token();
+        graph.add_import(b, c);
+
+        assert!(graph.reachability_index.is_none());
+    }
+
+    #[test]
+    fn test_adding_existing_import_or_removing_missing_import_keeps_index() {
+        let mut graph = build_graph(&[("pkg.a", "pkg.b")]);
+        graph.build_reachability_index();
+        let clone = graph.clone();
+        let a = graph.get_module_by_name("pkg.a").unwrap().token();
+        let b = graph.get_module_by_name("pkg.b").unwrap().token();
+
+        graph.add_import(a, b);
+        graph.remove_import(b, a);
+
+        assert!(graph.reachability_index.is_some());
+        assert_eq!(graph.generation, clone.generation);
+        assert!(Arc::ptr_eq(&graph.imports, &clone.imports));
+        assert!(Arc::ptr_eq(&graph.import_details, &clone.import_details));
+    }
+}
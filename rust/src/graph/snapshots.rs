@@ -0,0 +1,379 @@
+//! Snapshots of graphs, for saving a graph and loading it again without rebuilding it.
+//!
+//! Snapshot format
+//! ===============
+//!
+//! A snapshot holds everything in a graph apart from its indexes, which can be rebuilt. All
+//! integers are little-endian u32s.
+//!
+//! - Header:         magic bytes, format version, string count, module count, import count,
+//!                   import details count.
+//! - String table:   as in cache data files: (string count + 1) offsets into the string data,
+//!                   followed by the string data itself. Holds the module names and the contents
+//!                   of import lines, each stored once.
+//! - Modules:        a (name, parent, flags) record for each module. Parents come before their
+//!                   children, and are referred to by the index of their record, or by `NO_PARENT`
+//!                   for top level modules. The flags say whether the module is invisible or
+//!                   squashed.
+//! - Imports:        an (importer, imported) record for each import, referring to module records.
+//! - Import details: an (importer, imported, line number, line contents) record for each import
+//!                   detail.
+//!
+//! The format version must be incremented whenever the format changes.
+use crate::caching::{StringTableBuilder, read_u32};
+use crate::errors::{GrimpError, GrimpResult};
+use crate::graph::{Graph, Module, ModuleToken, PyImportDetails};
+use bimap::BiMap;
+use rustc_hash::{FxHashMap, FxHashSet};
+use slotmap::{SecondaryMap, SlotMap};
+use std::sync::Arc;
+use string_interner::StringInterner;
+use string_interner::backend::StringBackend;
+
+const MAGIC: &[u8; 8] = b"GRIMPGRF";
+const FORMAT_VERSION: u32 = 1;
+const HEADER_SIZE: usize = 28;
+const U32_SIZE: usize = 4;
+const NO_PARENT: u32 = u32::MAX;
+const IS_INVISIBLE: u32 = 1;
+const IS_SQUASHED: u32 = 2;
+
+impl Graph {
+    /// Encodes the graph as a snapshot, which `from_snapshot` can load.
+    pub fn to_snapshot(&self) -> Vec<u8> {
+        // Parents are found before their children.
+        let mut modules = Vec::with_capacity(self.modules.len());
+        let mut stack: Vec<ModuleToken> = self
+            .module_parents
+            .iter()
+            .filter(|(_, parent)| parent.is_none())
+            .map(|(module, _)| module)
+            .collect();
+        while let Some(module) = stack.pop() {
+            modules.push(module);
+            stack.extend(self.module_children[module].iter().copied());
+        }
+        let mut indices_by_module = SecondaryMap::default();
+        for (index, module) in modules.iter().enumerate() {
+            indices_by_module.insert(*module, index as u32);
+        }
+
+        let mut string_table = StringTableBuilder::default();
+        let mut module_records: Vec<[u32; 3]> = Vec::with_capacity(modules.len());
+        let mut import_records: Vec<[u32; 2]> = vec![];
+        for module in &modules {
+            let module = &self.modules[*module];
+            module_records.push([
+                string_table.intern(self.module_name(module.token())),
+                self.module_parents[module.token()]
+                    .map_or(NO_PARENT, |parent| indices_by_module[parent]),
+                module.is_invisible() as u32 * IS_INVISIBLE
+                    | module.is_squashed() as u32 * IS_SQUASHED,
+            ]);
+            for imported in self.modules_directly_imported_by(module.token()) {
+                import_records.push([
+                    indices_by_module[module.token()],
+                    indices_by_module[imported],
+                ]);
+            }
+        }
+        let mut import_details_records: Vec<[u32; 4]> = vec![];
+        for ((importer, imported), import_details) in self.import_details.iter() {
+            for import_detail in import_details {
+                import_details_records.push([
+                    indices_by_module[*importer],
+                    indices_by_module[*imported],
+                    import_detail.line_number(),
+                    string_table.intern(self.import_line_contents(import_detail)),
+                ]);
+            }
+        }
+
+        let mut bytes = MAGIC.to_vec();
+        for value in [
+            FORMAT_VERSION,
+            string_table.len() as u32,
+            module_records.len() as u32,
+            import_records.len() as u32,
+            import_details_records.len() as u32,
+        ] {
+            bytes.extend_from_slice(&value.to_le_bytes());
+        }
+        string_table.write(&mut bytes);
+        for value in module_records.iter().flatten() {
+            bytes.extend_from_slice(&value.to_le_bytes());
+        }
+        for value in import_records.iter().flatten() {
+            bytes.extend_from_slice(&value.to_le_bytes());
+        }
+        for value in import_details_records.iter().flatten() {
+            bytes.extend_from_slice(&value.to_le_bytes());
+        }
+        bytes
+    }
+
+    /// Loads a graph from a snapshot made by `to_snapshot`.
+    pub fn from_snapshot(bytes: &[u8]) -> GrimpResult<Graph> {
+        let mut reader = SnapshotReader::new(bytes)?;
+        let [
+            string_count,
+            module_count,
+            import_count,
+            import_details_count,
+        ] = reader.record()?;
+        let strings = reader.strings(string_count as usize)?;
+        // Checked before anything is allocated for the records, in case the counts are corrupt.
+        let records_len = module_count as usize * 3 * U32_SIZE
+            + import_count as usize * 2 * U32_SIZE
+            + import_details_count as usize * 4 * U32_SIZE;
+        if reader.remaining_len() != records_len {
+            return Err(GrimpError::CorruptSnapshot);
+        }
+        let string = |index: u32| {
+            strings
+                .get(index as usize)
+                .copied()
+                .ok_or(GrimpError::CorruptSnapshot)
+        };
+
+        let module_count = module_count as usize;
+        let mut module_names = StringInterner::<StringBackend>::default();
+        let mut modules = SlotMap::with_capacity_and_key(module_count);
+        let mut modules_by_name = BiMap::new();
+        let mut module_parents = SecondaryMap::default();
+        let mut module_children = SecondaryMap::default();
+        let mut imports = SecondaryMap::default();
+        let mut reverse_imports = SecondaryMap::default();
+        let mut tokens: Vec<ModuleToken> = Vec::with_capacity(module_count);
+        for _ in 0..module_count {
+            let [name, parent, flags] = reader.record()?;
+            let name = module_names.get_or_intern(string(name)?);
+            if modules_by_name.contains_left(&name) {
+                return Err(GrimpError::CorruptSnapshot);
+            }
+            // Only modules that have already been loaded can be parents.
+            let parent = match parent {
+                NO_PARENT => None,
+                parent => Some(
+                    *tokens
+                        .get(parent as usize)
+                        .ok_or(GrimpError::CorruptSnapshot)?,
+                ),
+            };
+            let module = modules.insert_with_key(|token| Module {
+                token,
+                interned_name: name,
+                is_invisible: flags & IS_INVISIBLE != 0,
+                is_squashed: flags & IS_SQUASHED != 0,
+            });
+            modules_by_name.insert(name, module);
+            module_parents.insert(module, parent);
+            module_children.insert(module, FxHashSet::default());
+            if let Some(parent) = parent {
+                module_children[parent].insert(module);
+            }
+            imports.insert(module, FxHashSet::default());
+            reverse_imports.insert(module, FxHashSet::default());
+            tokens.push(module);
+        }
+        let module = |index: u32| {
+            tokens
+                .get(index as usize)
+                .copied()
+                .ok_or(GrimpError::CorruptSnapshot)
+        };
+
+        for _ in 0..import_count {
+            let [importer, imported] = reader.record()?;
+            let (importer, imported) = (module(importer)?, module(imported)?);
+            imports[importer].insert(imported);
+            reverse_imports[imported].insert(importer);
+        }
+
+        let mut import_line_contents = StringInterner::<StringBackend>::default();
+        let mut import_details: FxHashMap<_, FxHashSet<_>> = FxHashMap::default();
+        for _ in 0..import_details_count {
+            let [importer, imported, line_number, line_contents] = reader.record()?;
+            let line_contents = import_line_contents.get_or_intern(string(line_contents)?);
+            import_details
+                .entry((module(importer)?, module(imported)?))
+                .or_default()
+                .insert(PyImportDetails::new(line_number, line_contents));
+        }
+
+        Ok(Graph {
+            module_names: Arc::new(module_names),
+            import_line_contents: Arc::new(import_line_contents),
+            modules_by_name: Arc::new(modules_by_name),
+            modules: Arc::new(modules),
+            module_parents: Arc::new(module_parents),
+            module_children: Arc::new(module_children),
+            imports: Arc::new(imports),
+            reverse_imports: Arc::new(reverse_imports),
+            import_details: Arc::new(import_details),
+            ..Graph::default()
+        })
+    }
+}
+
+/// Reads a snapshot from start to finish, checking the bounds of everything it reads.
+struct SnapshotReader<'a> {
+    bytes: &'a [u8],
+    position: usize,
+}
+
+impl<'a> SnapshotReader<'a> {
+    fn new(bytes: &'a [u8]) -> GrimpResult<Self> {
+        if bytes.len() < HEADER_SIZE || &bytes[..MAGIC.len()] != MAGIC {
+            return Err(GrimpError::CorruptSnapshot);
+        }
+        let mut reader = SnapshotReader {
+            bytes,
+            position: MAGIC.len(),
+        };
+        let [format_version] = reader.record()?;
+        if format_version != FORMAT_VERSION {
+            return Err(GrimpError::CorruptSnapshot);
+        }
+        Ok(reader)
+    }
+
+    fn record<const N: usize>(&mut self) -> GrimpResult<[u32; N]> {
+        let mut record = [0; N];
+        for value in record.iter_mut() {
+            *value = read_u32(self.bytes, self.position).ok_or(GrimpError::CorruptSnapshot)?;
+            self.position += U32_SIZE;
+        }
+        Ok(record)
+    }
+
+    /// Reads the string table.
+    fn strings(&mut self, string_count: usize) -> GrimpResult<Vec<&'a str>> {
+        if (string_count + 1) * U32_SIZE > self.remaining_len() {
+            return Err(GrimpError::CorruptSnapshot);
+        }
+        let mut offsets = Vec::with_capacity(string_count + 1);
+        for _ in 0..string_count + 1 {
+            let [offset] = self.record()?;
+            offsets.push(offset as usize);
+        }
+        let string_data_end = self.position + offsets[string_count];
+        let string_data = self
+            .bytes
+            .get(self.position..string_data_end)
+            .ok_or(GrimpError::CorruptSnapshot)?;
+        let string_data =
+            std::str::from_utf8(string_data).map_err(|_| GrimpError::CorruptSnapshot)?;
+        self.position = string_data_end;
+        offsets
+            .windows(2)
+            .map(|offsets| {
+                string_data
+                    .get(offsets[0]..offsets[1])
+                    .ok_or(GrimpError::CorruptSnapshot)
+            })
+            .collect()
+    }
+
+    fn remaining_len(&self) -> usize {
+        self.bytes.len() - self.position
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn build_graph() -> Graph {
+        let mut graph = Graph::default();
+        let blue = graph.get_or_add_module("pkg.blue").token();
+        let green = graph.get_or_add_module("pkg.green.one").token();
+        let django = graph.get_or_add_squashed_module("django").token();
+        graph.add_import(green, blue);
+        graph.add_detailed_imports([
+            (blue, green, 1, "from pkg.green import one"),
+            (blue, django, 2, "import django"),
+            (blue, django, 5, "import django"),
+        ]);
+        graph
+    }
+
+    fn describe(graph: &Graph) -> Vec<String> {
+        let mut descriptions: Vec<_> = graph
+            .all_modules()
+            .map(|module| {
+                format!(
+                    "{} parent={:?} invisible={} squashed={} imports={:?}",
+                    graph.module_name(module.token()),
+                    graph
+                        .get_module_parent(module.token())
+                        .map(|parent| graph.module_name(parent.token())),
+                    module.is_invisible(),
+                    module.is_squashed(),
+                    graph
+                        .modules_directly_imported_by(module.token())
+                        .map(|imported| {
+                            let mut line_numbers: Vec<_> = graph
+                                .get_import_details(module.token(), imported)
+                                .iter()
+                                .map(|import_details| {
+                                    format!(
+                                        "{}: {}",
+                                        import_details.line_number(),
+                                        graph.import_line_contents(import_details)
+                                    )
+                                })
+                                .collect();
+                            line_numbers.sort();
+                            (graph.module_name(imported), line_numbers)
+                        })
+                        .collect::<std::collections::BTreeMap<_, _>>(),
+                )
+            })
+            .collect();
+        descriptions.sort();
+        descriptions
+    }
+
+    #[test]
+    fn test_round_trip() {
+        let graph = build_graph();
+
+        let loaded_graph = Graph::from_snapshot(&graph.to_snapshot()).unwrap();
+
+        assert_eq!(describe(&loaded_graph), describe(&graph));
+        assert_eq!(loaded_graph.count_imports(), 3);
+    }
+
+    #[test]
+    fn test_round_trip_of_frozen_graph() {
+        let graph = build_graph();
+
+        let loaded_graph = Graph::from_snapshot(&graph.freeze().to_snapshot()).unwrap();
+
+        assert!(!loaded_graph.is_frozen());
+        assert_eq!(describe(&loaded_graph), describe(&graph));
+    }
+
+    #[test]
+    fn test_rejects_truncated_snapshot() {
+        let mut bytes = build_graph().to_snapshot();
+        bytes.pop();
+
+        assert!(matches!(
+            Graph::from_snapshot(&bytes),
+            Err(GrimpError::CorruptSnapshot)
+        ));
+    }
+
+    #[test]
+    fn test_rejects_other_format_version() {
+        let mut bytes = build_graph().to_snapshot();
+        bytes[8..12].copy_from_slice(&(FORMAT_VERSION + 1).to_le_bytes());
+
+        assert!(matches!(
+            Graph::from_snapshot(&bytes),
+            Err(GrimpError::CorruptSnapshot)
+        ));
+    }
+}
@@ -0,0 +1,22 @@
+//! Helpers shared by the graph's tests.
+use crate::graph::{Graph, ModuleToken};
+use rustc_hash::FxHashSet;
+
+/// Builds a graph from (importer, imported) pairs of module names, adding the modules as needed.
+pub(crate) fn build_graph(imports: &[(&str, &str)]) -> Graph {
+    let mut graph = Graph::default();
+    for (importer, imported) in imports {
+        let importer = graph.get_or_add_module(importer).token();
+        let imported = graph.get_or_add_module(imported).token();
+        graph.add_import(importer, imported);
+    }
+    graph
+}
+
+/// Returns the tokens of the named modules, which must be in the graph.
+pub(crate) fn tokens(graph: &Graph, names: &[&str]) -> FxHashSet<ModuleToken> {
+    names
+        .iter()
+        .map(|name| graph.get_module_by_name(name).unwrap().token())
+        .collect()
+}
@@ -1,16 +1,18 @@
 use crate::errors::{GrimpError, GrimpResult};
 use crate::filesystem::{FileSystem, get_file_system_boxed};
+use crate::import_parsing::ImportedObject;
 use crate::module_finding::{FoundPackage, Module};
-use crate::{import_parsing, module_finding};
+use crate::{import_parsing, module_finding, parse_caching};
 use itertools::Itertools;
+use pyo3::exceptions::PyKeyError;
 use pyo3::prelude::*;
-use pyo3::types::{PyDict, PySet};
+use pyo3::types::{PyDict, PyIterator, PyList, PySet};
 /// Statically analyses some Python modules for import statements within their shared package.
 use rayon::prelude::*;
 use std::collections::{HashMap, HashSet};
 use std::io::{self, ErrorKind};
 
-#[derive(Debug, Hash, Eq, PartialEq)]
+#[derive(Debug, Clone, Hash, Eq, PartialEq)]
 pub struct DirectImport {
     pub importer: String,
     pub imported: String,
@@ -34,7 +36,9 @@ impl<'py> FromPyObject<'py> for DirectImport {
     }
 }
 
-fn py_found_packages_to_rust(py_found_packages: &Bound<'_, PyAny>) -> HashSet<FoundPackage> {
+pub(crate) fn py_found_packages_to_rust(
+    py_found_packages: &Bound<'_, PyAny>,
+) -> HashSet<FoundPackage> {
     let py_set = py_found_packages
         .downcast::<PySet>()
         .expect("Expected py_found_packages to be a Python set.");
@@ -52,7 +56,9 @@ fn py_found_packages_to_rust(py_found_packages: &Bound<'_, PyAny>) -> HashSet<Fo
     rust_found_packages
 }
 
-fn get_modules_from_found_packages(found_packages: &HashSet<FoundPackage>) -> HashSet<Module> {
+pub(crate) fn get_modules_from_found_packages(
+    found_packages: &HashSet<FoundPackage>,
+) -> HashSet<Module> {
     let mut modules = HashSet::new();
     for package in found_packages {
         for module_file in &package.module_files {
@@ -70,8 +76,18 @@ fn module_is_descendant(module_name: &str, potential_ancestor: &str) -> bool {
     module_name.starts_with(&format!("{potential_ancestor}."))
 }
 
-/// Statically analyses the given module and returns a set of Modules that
-/// it imports.
+/// The results of parsing a module, before its imports are resolved.
+///
+/// Unlike resolved imports, these don't depend on which packages are being analysed, or on the
+/// scanning options, so they can be cached and reused across different builds.
+#[derive(Debug, Clone, PartialEq, Eq)]
+pub struct ParsedModule {
+    pub is_package: bool,
+    pub imported_objects: Vec<ImportedObject>,
+}
+
+/// Statically analyses the given modules and returns the parse results and resolved imports
+/// of each one.
 #[allow(clippy::borrowed_box)]
 fn scan_for_imports_no_py(
     file_system: &Box<dyn FileSystem + Send + Sync>,
@@ -79,7 +95,7 @@ fn scan_for_imports_no_py(
     include_external_packages: bool,
     modules: &HashSet<Module>,
     exclude_type_checking_imports: bool,
-) -> GrimpResult<HashMap<Module, HashSet<DirectImport>>> {
+) -> GrimpResult<ImportsByModule> {
     let module_packages = get_modules_from_found_packages(found_packages);
 
     // Assemble a lookup table so we only need to do this once.
@@ -89,54 +105,95 @@ fn scan_for_imports_no_py(
             found_packages_by_module.insert(&module_file.module, found_package);
         }
     }
-    let results: GrimpResult<Vec<(Module, HashSet<DirectImport>)>> = modules
+    let parsed_modules: HashMap<Module, ParsedModule> = modules
         .par_iter()
         .map(|module| {
-            let imports = scan_for_imports_no_py_single_module(
+            let parsed_module =
+                parse_module(module, file_system, found_packages_by_module[module])?;
+            Ok((module.clone(), parsed_module))
+        })
+        .collect::<GrimpResult<_>>()?;
+
+    let imports_by_module = resolve_parsed_modules(
+        &parsed_modules,
+        found_packages,
+        &module_packages,
+        include_external_packages,
+        exclude_type_checking_imports,
+    );
+
+    Ok(ImportsByModule {
+        imports_by_module,
+        parsed_modules,
+    })
+}
+
+#[allow(clippy::borrowed_box)]
+fn parse_module(
+    module: &Module,
+    file_system: &Box<dyn FileSystem + Send + Sync>,
+    found_package: &FoundPackage,
+) -> GrimpResult<ParsedModule> {
+    let module_filename = _determine_module_filename(module, found_package, file_system).unwrap();
+    parse_caching::get_or_parse(&module_filename, file_system, || {
+        let module_contents = file_system.read(&module_filename).unwrap();
+        let imported_objects =
+            import_parsing::parse_imports_from_code(&module_contents, &module_filename)?;
+
+        Ok(ParsedModule {
+            is_package: _module_is_package(&module_filename, file_system),
+            imported_objects,
+        })
+    })
+}
+
+/// Resolves the imports of some parsed modules, in parallel.
+pub(crate) fn resolve_parsed_modules(
+    parsed_modules: &HashMap<Module, ParsedModule>,
+    found_packages: &HashSet<FoundPackage>,
+    all_modules: &HashSet<Module>,
+    include_external_packages: bool,
+    exclude_type_checking_imports: bool,
+) -> HashMap<Module, HashSet<DirectImport>> {
+    parsed_modules
+        .par_iter()
+        .map(|(module, parsed_module)| {
+            let imports = resolve_imports(
                 module,
-                file_system,
-                &found_packages_by_module,
+                parsed_module,
                 found_packages,
-                &module_packages,
+                all_modules,
                 include_external_packages,
                 exclude_type_checking_imports,
-            )?;
-            Ok((module.clone(), imports))
+            );
+            (module.clone(), imports)
         })
-        .collect();
-
-    results.map(|vec| vec.into_iter().collect())
+        .collect()
 }
 
-#[allow(clippy::borrowed_box)]
-fn scan_for_imports_no_py_single_module(
+/// Resolves the imported objects of a parsed module into the modules they import.
+fn resolve_imports(
     module: &Module,
-    file_system: &Box<dyn FileSystem + Send + Sync>,
-    found_packages_by_module: &HashMap<&Module, &FoundPackage>,
+    parsed_module: &ParsedModule,
     found_packages: &HashSet<FoundPackage>,
     all_modules: &HashSet<Module>,
     include_external_packages: bool,
     exclude_type_checking_imports: bool,
-) -> GrimpResult<HashSet<DirectImport>> {
+) -> HashSet<DirectImport> {
     let mut imports: HashSet<DirectImport> = HashSet::new();
-    let found_package_for_module = found_packages_by_module[module];
-    let module_filename =
-        _determine_module_filename(module, found_package_for_module, file_system).unwrap();
-    let module_contents = file_system.read(&module_filename).unwrap();
-    let imported_objects =
-        import_parsing::parse_imports_from_code(&module_contents, &module_filename)?;
-
-    let is_package = _module_is_package(&module_filename, file_system);
 
-    for imported_object in imported_objects {
+    for imported_object in &parsed_module.imported_objects {
         // Don't include type checking imports, if specified.
         if exclude_type_checking_imports && imported_object.typechecking_only {
             continue;
         }
 
         // Resolve relative imports.
-        let imported_object_name =
-            _get_absolute_imported_object_name(module, is_package, &imported_object.name);
+        let imported_object_name = _get_absolute_imported_object_name(
+            module,
+            parsed_module.is_package,
+            &imported_object.name,
+        );
 
         // Resolve imported module.
         match _get_internal_module(&imported_object_name, all_modules) {
@@ -146,7 +203,7 @@ fn scan_for_imports_no_py_single_module(
                     importer: module.name.to_string(),
                     imported: imported_module.name.to_string(),
                     line_number: imported_object.line_number,
-                    line_contents: imported_object.line_contents,
+                    line_contents: imported_object.line_contents.clone(),
                 });
             }
             None => {
@@ -159,17 +216,17 @@ fn scan_for_imports_no_py_single_module(
                         importer: module.name.to_string(),
                         imported: imported_module,
                         line_number: imported_object.line_number,
-                        line_contents: imported_object.line_contents,
+                        line_contents: imported_object.line_contents.clone(),
                     });
                 }
             }
         }
     }
 
-    Ok(imports)
+    imports
 }
 
-fn to_py_direct_imports<'a>(
+pub fn to_py_direct_imports<'a>(
     py: Python<'a>,
     rust_imports: &HashSet<DirectImport>,
 ) -> Bound<'a, PySet> {
@@ -199,7 +256,7 @@ fn to_py_direct_imports<'a>(
 }
 
 #[allow(clippy::borrowed_box)]
-fn _determine_module_filename(
+pub(crate) fn _determine_module_filename(
     module: &Module,
     found_package: &FoundPackage,
     file_system: &Box<dyn FileSystem + Send + Sync>,
@@ -348,23 +405,215 @@ fn _distill_external_module(
     }
 }
 
-/// Convert the rust data structure into a Python dict[Module, set[DirectImport]].
-pub fn imports_by_module_to_py(
-    py: Python,
-    imports_by_module: HashMap<module_finding::Module, HashSet<DirectImport>>,
-) -> Bound<PyDict> {
-    let valueobjects_pymodule = PyModule::import(py, "grimp.domain.valueobjects").unwrap();
-    let py_module_class = valueobjects_pymodule.getattr("Module").unwrap();
+/// The direct imports of some modules, keyed by importer.
+///
+/// The imports are held in Rust, so they can be passed between scanning, caching and graph
+/// assembly without being converted to Python objects. It behaves like a read-only
+/// dict[Module, set[DirectImport]], building the Python objects when they are accessed.
+///
+/// Imports that were scanned, or read from the cache, also keep the parse results they were
+/// resolved from, so that these can be written to the cache.
+#[pyclass]
+#[derive(Default)]
+pub struct ImportsByModule {
+    pub imports_by_module: HashMap<Module, HashSet<DirectImport>>,
+    pub parsed_modules: HashMap<Module, ParsedModule>,
+}
 
-    let imports_by_module_py = PyDict::new(py);
-    for (module, imports) in imports_by_module.iter() {
-        let py_module_instance = py_module_class.call1((module.name.clone(),)).unwrap();
-        let py_imports = to_py_direct_imports(py, imports);
-        imports_by_module_py
-            .set_item(py_module_instance, py_imports)
-            .unwrap();
+impl ImportsByModule {
+    /// Extract the imports from an ImportsByModule or a dict[Module, set[DirectImport]].
+    pub fn extract_map(ob: &Bound<'_, PyAny>) -> PyResult<HashMap<Module, HashSet<DirectImport>>> {
+        if let Ok(imports_by_module) = ob.downcast::<ImportsByModule>() {
+            return Ok(imports_by_module.try_borrow()?.imports_by_module.clone());
+        }
+        let py_dict = ob.downcast::<PyDict>()?;
+        let mut imports_by_module = HashMap::new();
+        for (py_key, py_value) in py_dict.iter() {
+            let module: Module = py_key.extract()?;
+            let py_set = py_value.downcast::<PySet>()?;
+            let mut imports: HashSet<DirectImport> = HashSet::new();
+            for element in py_set.iter() {
+                imports.insert(element.extract()?);
+            }
+            imports_by_module.insert(module, imports);
+        }
+        Ok(imports_by_module)
+    }
+
+    /// The imported objects of each parsed module that are within the packages, but didn't
+    /// resolve to a module of the same name.
+    fn unresolved_names_by_importer(
+        &self,
+        package_names: &HashSet<String>,
+        exclude_type_checking_imports: bool,
+    ) -> HashMap<String, Vec<String>> {
+        let mut unresolved_names_by_importer = HashMap::new();
+        for (module, parsed_module) in &self.parsed_modules {
+            let resolved_names: HashSet<&str> = self
+                .imports_by_module
+                .get(module)
+                .into_iter()
+                .flatten()
+                .map(|import| import.imported.as_str())
+                .collect();
+            let unresolved_names: Vec<String> = parsed_module
+                .imported_objects
+                .iter()
+                .filter(|imported_object| {
+                    !(exclude_type_checking_imports && imported_object.typechecking_only)
+                })
+                .map(|imported_object| {
+                    _get_absolute_imported_object_name(
+                        module,
+                        parsed_module.is_package,
+                        &imported_object.name,
+                    )
+                })
+                .filter(|name| {
+                    !resolved_names.contains(name.as_str())
+                        && package_names.iter().any(|package_name| {
+                            name == package_name || module_is_descendant(name, package_name)
+                        })
+                })
+                .unique()
+                .collect();
+            if !unresolved_names.is_empty() {
+                unresolved_names_by_importer.insert(module.name.clone(), unresolved_names);
+            }
+        }
+        unresolved_names_by_importer
+    }
+}
+
+#[pymethods]
+impl ImportsByModule {
+    #[new]
+    fn new() -> Self {
+        ImportsByModule::default()
+    }
+
+    fn __len__(&self) -> usize {
+        self.imports_by_module.len()
+    }
+
+    fn __contains__(&self, module: Module) -> bool {
+        self.imports_by_module.contains_key(&module)
+    }
+
+    fn __getitem__<'py>(&self, py: Python<'py>, module: Module) -> PyResult<Bound<'py, PySet>> {
+        match self.imports_by_module.get(&module) {
+            Some(imports) => Ok(to_py_direct_imports(py, imports)),
+            None => Err(PyKeyError::new_err(module.name)),
+        }
+    }
+
+    fn __iter__<'py>(&self, py: Python<'py>) -> PyResult<Bound<'py, PyIterator>> {
+        let py_module_class =
+            PyModule::import(py, "grimp.domain.valueobjects")?.getattr("Module")?;
+        let py_modules = self
+            .imports_by_module
+            .keys()
+            .map(|module| py_module_class.call1((&module.name,)))
+            .collect::<PyResult<Vec<_>>>()?;
+        PyList::new(py, py_modules)?.try_iter()
+    }
+
+    /// Add the imports from an ImportsByModule or a dict[Module, set[DirectImport]],
+    /// replacing the imports of any modules that are already present.
+    fn update(&mut self, other: &Bound<'_, PyAny>) -> PyResult<()> {
+        if let Ok(other) = other.downcast::<ImportsByModule>() {
+            let other = other.try_borrow()?;
+            for (module, imports) in &other.imports_by_module {
+                self.imports_by_module
+                    .insert(module.clone(), imports.clone());
+                match other.parsed_modules.get(module) {
+                    Some(parsed_module) => self
+                        .parsed_modules
+                        .insert(module.clone(), parsed_module.clone()),
+                    None => self.parsed_modules.remove(module),
+                };
+            }
+            return Ok(());
+        }
+        for (module, imports) in ImportsByModule::extract_map(other)? {
+            // The parse results no longer correspond to the imports.
+            self.parsed_modules.remove(&module);
+            self.imports_by_module.insert(module, imports);
+        }
+        Ok(())
+    }
+}
+
+/// The imports within the packages that don't resolve to a module of the same name, keyed by
+/// importer.
+///
+/// An import of a module that doesn't exist resolves to the module's parent, or to nothing, so
+/// these are the imports that may resolve differently once more modules are added. Only modules
+/// with parse results are included: the imports of any others are unknown.
+#[pyclass(frozen)]
+#[derive(Default)]
+pub struct UnresolvedImports {
+    names_by_importer: HashMap<String, Vec<String>>,
+}
+
+#[pymethods]
+impl UnresolvedImports {
+    #[new]
+    #[pyo3(signature = (names_by_importer=HashMap::new()))]
+    fn new(names_by_importer: HashMap<String, Vec<String>>) -> Self {
+        UnresolvedImports { names_by_importer }
+    }
+
+    fn __getnewargs__(&self) -> (HashMap<String, Vec<String>>,) {
+        (self.names_by_importer.clone(),)
+    }
+
+    /// Return a copy with the unresolved imports of the modules in imports_by_module replaced,
+    /// and those of the removed modules left out.
+    #[pyo3(signature = (imports_by_module, *, removed_modules, package_names, exclude_type_checking_imports))]
+    fn updated(
+        &self,
+        imports_by_module: PyRef<'_, ImportsByModule>,
+        removed_modules: HashSet<String>,
+        package_names: HashSet<String>,
+        exclude_type_checking_imports: bool,
+    ) -> Self {
+        let mut names_by_importer = self.names_by_importer.clone();
+        for module in imports_by_module.imports_by_module.keys() {
+            names_by_importer.remove(&module.name);
+        }
+        for module_name in &removed_modules {
+            names_by_importer.remove(module_name);
+        }
+        names_by_importer.extend(
+            imports_by_module
+                .unresolved_names_by_importer(&package_names, exclude_type_checking_imports),
+        );
+        UnresolvedImports { names_by_importer }
+    }
+
+    /// Find the modules with an unresolved import of one of the given modules, or of something
+    /// within one of them.
+    fn find_importers_of(&self, module_names: HashSet<String>) -> HashSet<String> {
+        self.names_by_importer
+            .iter()
+            .filter(|(_, names)| {
+                names.iter().any(|name| {
+                    let mut candidate = name.as_str();
+                    loop {
+                        if module_names.contains(candidate) {
+                            return true;
+                        }
+                        match candidate.rsplit_once('.') {
+                            Some((parent, _)) => candidate = parent,
+                            None => return false,
+                        }
+                    }
+                })
+            })
+            .map(|(importer, _)| importer.clone())
+            .collect()
     }
-    imports_by_module_py
 }
 
 /// Statically analyses the given module and returns a set of Modules that
@@ -380,7 +629,7 @@ pub fn imports_by_module_to_py(
 /// - exclude_type_checking_imports: If True, don't include imports behind TYPE_CHECKING guards.
 /// - file_system:                   The file system interface to use. (A BasicFileSystem.)
 ///
-/// Returns dict[Module, set[DirectImport]].
+/// Returns ImportsByModule.
 #[pyfunction]
 pub fn scan_for_imports<'py>(
     py: Python<'py>,
@@ -389,7 +638,7 @@ pub fn scan_for_imports<'py>(
     include_external_packages: bool,
     exclude_type_checking_imports: bool,
     file_system: Bound<'py, PyAny>,
-) -> PyResult<Bound<'py, PyDict>> {
+) -> PyResult<ImportsByModule> {
     let file_system_boxed = get_file_system_boxed(&file_system)?;
     let found_packages_rust = py_found_packages_to_rust(&found_packages);
     let modules_rust: HashSet<module_finding::Module> = module_files
@@ -433,9 +682,5 @@ pub fn scan_for_imports<'py>(
         }
         _ => (),
     }
-    let imports_by_module = imports_by_module_result.unwrap();
-
-    let imports_by_module_py = imports_by_module_to_py(py, imports_by_module);
-
-    Ok(imports_by_module_py)
+    Ok(imports_by_module_result.unwrap())
 }
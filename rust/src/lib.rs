@@ -7,25 +7,32 @@ pub mod import_parsing;
 mod import_scanning;
 pub mod module_expressions;
 mod module_finding;
+mod parse_caching;
 
 use pyo3::prelude::*;
 
 #[pymodule]
 mod _rustgrimp {
     #[pymodule_export]
-    use crate::import_scanning::scan_for_imports;
+    use crate::import_scanning::{ImportsByModule, UnresolvedImports, scan_for_imports};
 
     #[pymodule_export]
-    use crate::caching::read_cache_data_map_file;
+    use crate::module_finding::find_package;
 
     #[pymodule_export]
-    use crate::caching::write_cache_data_map_file;
+    use crate::caching::{
+        CacheDataFile, append_to_cache_log_file, hash_module_contents, read_cache_data_file,
+        read_cached_imports, write_cache_data_file,
+    };
+
+    #[pymodule_export]
+    use crate::parse_caching::{clear_parse_cache, set_parse_cache_size};
 
     #[pymodule_export]
-    use crate::graph::GraphWrapper;
+    use crate::graph::{GraphWrapper, ShortestChainsIterator};
 
     #[pymodule_export]
-    use crate::filesystem::{PyFakeBasicFileSystem, PyRealBasicFileSystem};
+    use crate::filesystem::{PyFakeBasicFileSystem, PyFileLock, PyRealBasicFileSystem};
 
     #[pymodule_export]
     use crate::exceptions::{
@@ -1,4 +1,6 @@
+use crate::filesystem::{FileSystem, get_file_system_boxed};
 use pyo3::{prelude::*, types::PyFrozenSet};
+use rayon::prelude::*;
 use std::collections::BTreeSet;
 use std::fmt;
 
@@ -58,3 +60,127 @@ impl<'py> FromPyObject<'py> for FoundPackage {
         })
     }
 }
+
+/// A Python file found within a package, before conversion to a Python ModuleFile.
+struct FoundModuleFile {
+    module_name: String,
+    mtime: f64,
+}
+
+/// The results of walking (part of) a package directory.
+#[derive(Default)]
+struct PackageWalk {
+    module_files: Vec<FoundModuleFile>,
+    // Python files that were skipped because there are too many dots in the name.
+    skipped_filenames: Vec<String>,
+}
+
+impl PackageWalk {
+    fn merge(mut self, other: PackageWalk) -> PackageWalk {
+        self.module_files.extend(other.module_files);
+        self.skipped_filenames.extend(other.skipped_filenames);
+        self
+    }
+}
+
+/// Recursively find the Python modules within a directory, walking subdirectories in parallel.
+///
+/// Directories that aren't Python packages (i.e. have no __init__.py) are not included, nor
+/// are their subdirectories. Hidden directories and files are ignored.
+#[allow(clippy::borrowed_box)]
+fn walk_package_directory(
+    directory: &str,
+    module_name: &str,
+    file_system: &Box<dyn FileSystem + Send + Sync>,
+) -> PyResult<PackageWalk> {
+    let (subdirectories, file_names) = file_system.list_directory(directory);
+    if !file_names
+        .iter()
+        .any(|file_name| file_name == "__init__.py")
+    {
+        return Ok(PackageWalk::default());
+    }
+
+    let mut walk = PackageWalk::default();
+    for file_name in file_names {
+        if file_name.starts_with('.') {
+            continue;
+        }
+        let Some(stem) = file_name.strip_suffix(".py") else {
+            continue;
+        };
+        // Ignore files like some.module.py.
+        if stem.contains('.') {
+            walk.skipped_filenames
+                .push(format!("{directory}{}{file_name}", file_system.sep()));
+            continue;
+        }
+        let module_filename = file_system.join(vec![directory.to_string(), file_name.clone()]);
+        walk.module_files.push(FoundModuleFile {
+            module_name: if stem == "__init__" {
+                module_name.to_string()
+            } else {
+                format!("{module_name}.{stem}")
+            },
+            mtime: file_system.get_mtime(&module_filename)?,
+        });
+    }
+
+    subdirectories
+        .into_par_iter()
+        .filter(|subdirectory| !subdirectory.starts_with('.'))
+        .map(|subdirectory| {
+            walk_package_directory(
+                &file_system.join(vec![directory.to_string(), subdirectory.clone()]),
+                &format!("{module_name}.{subdirectory}"),
+                file_system,
+            )
+        })
+        .try_reduce(PackageWalk::default, |a, b| Ok(a.merge(b)))
+        .map(|subdirectory_walk| walk.merge(subdirectory_walk))
+}
+
+/// Finds the Python modules within a package directory.
+///
+/// Python args:
+///
+/// - package_name:      The importable name of the package, e.g. "mypackage". Could be namespaced.
+/// - package_directory: The full path of the package directory.
+/// - file_system:       The file system interface to use. (A BasicFileSystem.)
+///
+/// Returns a tuple of (FoundPackage, list of filenames that were skipped because they have too
+/// many dots in the name).
+#[pyfunction]
+pub fn find_package<'py>(
+    py: Python<'py>,
+    package_name: &str,
+    package_directory: &str,
+    file_system: Bound<'py, PyAny>,
+) -> PyResult<(Bound<'py, PyAny>, Vec<String>)> {
+    let file_system_boxed = get_file_system_boxed(&file_system)?;
+
+    let walk =
+        py.detach(|| walk_package_directory(package_directory, package_name, &file_system_boxed))?;
+
+    let modulefinder_pymodule = PyModule::import(py, "grimp.application.ports.modulefinder")?;
+    let py_found_package_class = modulefinder_pymodule.getattr("FoundPackage")?;
+    let py_module_file_class = modulefinder_pymodule.getattr("ModuleFile")?;
+    let py_module_class = PyModule::import(py, "grimp.domain.valueobjects")?.getattr("Module")?;
+
+    let py_module_files = walk
+        .module_files
+        .into_iter()
+        .map(|module_file| {
+            let py_module = py_module_class.call1((module_file.module_name,))?;
+            py_module_file_class.call1((py_module, module_file.mtime))
+        })
+        .collect::<PyResult<Vec<_>>>()?;
+
+    let py_found_package = py_found_package_class.call1((
+        package_name,
+        package_directory,
+        PyFrozenSet::new(py, &py_module_files)?,
+    ))?;
+
+    Ok((py_found_package, walk.skipped_filenames))
+}
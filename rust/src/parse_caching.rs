@@ -0,0 +1,173 @@
+//! An optional, in-process cache of the results of parsing modules.
+//!
+//! This allows processes that build graphs repeatedly (e.g. editor integrations, or test suites)
+//! to avoid parsing unchanged modules each time, without using the file-based cache. Modules are
+//! identified by their filename, size and mtime.
+
+use crate::errors::GrimpResult;
+use crate::filesystem::FileSystem;
+use crate::import_scanning::ParsedModule;
+use pyo3::prelude::*;
+use std::collections::HashMap;
+use std::sync::atomic::{AtomicUsize, Ordering};
+use std::sync::{LazyLock, Mutex};
+
+// The maximum number of modules to cache. Zero (the default) disables the cache.
+static MAX_SIZE: AtomicUsize = AtomicUsize::new(0);
+static PARSE_CACHE: LazyLock<Mutex<ParseCache>> = LazyLock::new(Default::default);
+
+/// Sets the maximum number of parsed modules to keep in memory between scans.
+///
+/// Once the cache is full, the least recently used modules are evicted. Passing 0 disables the
+/// cache and frees its contents.
+#[pyfunction]
+pub fn set_parse_cache_size(max_size: usize) {
+    MAX_SIZE.store(max_size, Ordering::Relaxed);
+    PARSE_CACHE.lock().unwrap().evict(max_size);
+}
+
+/// Empties the parse cache, without changing its size.
+#[pyfunction]
+pub fn clear_parse_cache() {
+    PARSE_CACHE.lock().unwrap().evict(0);
+}
+
+/// Returns the parse results of the module in the file, from the cache if possible, otherwise
+/// by calling `parse` (outside the cache's lock) and caching the result.
+#[allow(clippy::borrowed_box)]
+pub(crate) fn get_or_parse(
+    module_filename: &str,
+    file_system: &Box<dyn FileSystem + Send + Sync>,
+    parse: impl FnOnce() -> GrimpResult<ParsedModule>,
+) -> GrimpResult<ParsedModule> {
+    let max_size = MAX_SIZE.load(Ordering::Relaxed);
+    if max_size == 0 {
+        return parse();
+    }
+    let (Ok(size), Ok(mtime)) = (
+        file_system.get_size(module_filename),
+        file_system.get_mtime(module_filename),
+    ) else {
+        return parse();
+    };
+    let key = ParseCacheKey {
+        filename: module_filename.to_string(),
+        size,
+        mtime_bits: mtime.to_bits(),
+    };
+
+    if let Some(parsed_module) = PARSE_CACHE.lock().unwrap().get(&key) {
+        return Ok(parsed_module);
+    }
+    let parsed_module = parse()?;
+    PARSE_CACHE
+        .lock()
+        .unwrap()
+        .insert(key, parsed_module.clone(), max_size);
+    Ok(parsed_module)
+}
+
+#[derive(Debug, Clone, PartialEq, Eq, Hash)]
+struct ParseCacheKey {
+    filename: String,
+    size: u64,
+    mtime_bits: u64,
+}
+
+/// A least recently used cache of parse results.
+#[derive(Default)]
+struct ParseCache {
+    // Each parsed module, with when it was last used.
+    entries: HashMap<ParseCacheKey, (ParsedModule, u64)>,
+    clock: u64,
+}
+
+impl ParseCache {
+    fn get(&mut self, key: &ParseCacheKey) -> Option<ParsedModule> {
+        self.clock += 1;
+        let (parsed_module, last_used) = self.entries.get_mut(key)?;
+        *last_used = self.clock;
+        Some(parsed_module.clone())
+    }
+
+    fn insert(&mut self, key: ParseCacheKey, parsed_module: ParsedModule, max_size: usize) {
+        self.clock += 1;
+        self.entries.insert(key, (parsed_module, self.clock));
+        if self.entries.len() > max_size {
+            // Evict down to three quarters full, so that the cost of finding the least recently
+            // used entries is spread across many insertions.
+            self.evict(max_size - max_size / 4);
+        }
+    }
+
+    /// Evict the least recently used entries, until at most `size` remain.
+    fn evict(&mut self, size: usize) {
+        if self.entries.len() <= size {
+            return;
+        }
+        if size == 0 {
+            self.entries = HashMap::new();
+            return;
+        }
+        let mut last_used_times: Vec<u64> = self
+            .entries
+            .values()
+            .map(|(_, last_used)| *last_used)
+            .collect();
+        let evict_count = self.entries.len() - size;
+        let (_, oldest_kept, _) = last_used_times.select_nth_unstable(evict_count);
+        let oldest_kept = *oldest_kept;
+        self.entries
+            .retain(|_, (_, last_used)| *last_used >= oldest_kept);
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn key(filename: &str) -> ParseCacheKey {
+        ParseCacheKey {
+            filename: filename.to_string(),
+            size: 10,
+            mtime_bits: 1.5_f64.to_bits(),
+        }
+    }
+
+    fn parsed_module() -> ParsedModule {
+        ParsedModule {
+            is_package: false,
+            imported_objects: vec![],
+        }
+    }
+
+    #[test]
+    fn test_evicts_least_recently_used_modules() {
+        let mut cache = ParseCache::default();
+        for filename in ["a.py", "b.py", "c.py", "d.py"] {
+            cache.insert(key(filename), parsed_module(), 4);
+        }
+        cache.get(&key("a.py"));
+
+        // Overfill the cache, evicting down to three modules.
+        cache.insert(key("e.py"), parsed_module(), 4);
+
+        assert_eq!(cache.entries.len(), 3);
+        for filename in ["a.py", "d.py", "e.py"] {
+            assert!(cache.get(&key(filename)).is_some());
+        }
+    }
+
+    #[test]
+    fn test_misses_module_with_different_size() {
+        let mut cache = ParseCache::default();
+        cache.insert(key("a.py"), parsed_module(), 4);
+
+        let resized_key = ParseCacheKey {
+            size: 11,
+            ..key("a.py")
+        };
+
+        assert_eq!(cache.get(&resized_key), None);
+    }
+}
@@ -3,7 +3,7 @@ __version__ = "3.13"
 from .application.graph import DetailedImport, ImportGraph, Import
 from .domain.analysis import PackageDependency, Route
 from .domain.valueobjects import DirectImport, Module, Layer
-from .main import build_graph
+from .main import build_graph, clear_parse_cache, set_parse_cache_size, update_graph
 
 __all__ = [
     "Module",
@@ -14,5 +14,8 @@ __all__ = [
     "PackageDependency",
     "Route",
     "build_graph",
+    "clear_parse_cache",
+    "set_parse_cache_size",
+    "update_graph",
     "Layer",
 ]
@@ -1,77 +1,40 @@
-import hashlib
-
-import json
 import logging
-from typing import Optional
+from collections.abc import Iterable, Mapping
 
 from grimp.application.ports.filesystem import BasicFileSystem
 from grimp.application.ports.modulefinder import FoundPackage, ModuleFile
 from grimp.domain.valueobjects import DirectImport, Module
 
 from ..application.ports.caching import Cache as AbstractCache
-from ..application.ports.caching import CacheMiss
+from ..application.ports.caching import CacheInvalidation, CacheMiss
 from grimp import _rustgrimp as rust  # type: ignore[attr-defined]
 
 logger = logging.getLogger(__name__)
-PrimitiveFormat = dict[str, list[tuple[str, Optional[int], str]]]
 
 
 class CacheFileNamer:
     @classmethod
-    def make_meta_file_name(cls, found_package: FoundPackage) -> str:
-        return f"{found_package.name}.meta.json"
+    def make_data_file_name(cls, found_package: FoundPackage) -> str:
+        return f"{found_package.name}.data.bin"
 
     @classmethod
-    def make_data_file_name(
-        cls,
-        found_packages: set[FoundPackage],
-        include_external_packages: bool,
-        exclude_type_checking_imports: bool,
-    ) -> str:
-        identifier = cls.make_data_file_unique_string(
-            found_packages, include_external_packages, exclude_type_checking_imports
-        )
-
-        bytes_identifier = identifier.encode()
-        # Use a hash algorithm with a limited size to avoid cache filenames that are too long
-        # the filesystem, which can happen if there are more than a few root packages
-        # being analyzed.
-        safe_unicode_identifier = hashlib.blake2b(bytes_identifier, digest_size=20).hexdigest()
-        return f"{safe_unicode_identifier}.data.json"
-
-    @classmethod
-    def make_data_file_unique_string(
-        cls,
-        found_packages: set[FoundPackage],
-        include_external_packages: bool,
-        exclude_type_checking_imports: bool,
-    ) -> str:
-        """
-        Construct a unique string that identifies the analysis parameters.
-
-        Doesn't need to be safe to use for a filename.
-        """
-        package_names = (p.name for p in found_packages)
-        csv_packages = ",".join(sorted(package_names))
-        include_external_packages_option = ":external" if include_external_packages else ""
-        exclude_type_checking_imports_option = (
-            ":no_type_checking" if exclude_type_checking_imports else ""
-        )
-        return (
-            csv_packages + include_external_packages_option + exclude_type_checking_imports_option
-        )
+    def make_log_file_name(cls, found_package: FoundPackage) -> str:
+        return f"{found_package.name}.log.bin"
 
 
 class Cache(AbstractCache):
     DEFAULT_CACHE_DIR = ".grimp_cache"
+    LOCK_FILE_NAME = "write.lock"
 
     def __init__(self, *args, namer: type[CacheFileNamer], **kwargs) -> None:
         """
         Don't instantiate Cache directly; use Cache.setup().
         """
         super().__init__(*args, **kwargs)
-        self._mtime_map: dict[str, float] = {}
-        self._data_map: dict[Module, set[DirectImport]] = {}
+        # The content hashes of the modules now, if invalidating by content.
+        self._content_hashes: dict[str, str] = {}
+        # The data files of the packages that have a usable one, keyed by package name.
+        self._data_files: dict[str, rust.CacheDataFile] = {}
         self._namer = namer
 
     @classmethod
@@ -82,6 +45,7 @@ class Cache(AbstractCache):
         include_external_packages: bool,
         exclude_type_checking_imports: bool = False,
         cache_dir: str | None = None,
+        cache_invalidation: CacheInvalidation = "mtime",
         namer: type[CacheFileNamer] = CacheFileNamer,
     ) -> "Cache":
         cache = cls(
@@ -90,10 +54,12 @@ class Cache(AbstractCache):
             include_external_packages=include_external_packages,
             exclude_type_checking_imports=exclude_type_checking_imports,
             cache_dir=cls.cache_dir_or_default(cache_dir),
+            cache_invalidation=cache_invalidation,
             namer=namer,
         )
-        cache._build_mtime_map()
-        cache._build_data_map()
+        cache._build_data_files()
+        if cache_invalidation == "content":
+            cache._content_hashes = rust.hash_module_contents(found_packages, file_system)
         assert cache.cache_dir
         return cache
 
@@ -102,109 +68,129 @@ class Cache(AbstractCache):
         return cache_dir or cls.DEFAULT_CACHE_DIR
 
     def read_imports(self, module_file: ModuleFile) -> set[DirectImport]:
-        try:
-            cached_mtime = self._mtime_map[module_file.module.name]
-        except KeyError:
-            raise CacheMiss
-        if cached_mtime != module_file.mtime:
+        imports_by_module = self.read_imports_by_module([module_file])
+        if module_file.module not in imports_by_module:
             raise CacheMiss
+        return imports_by_module[module_file.module]
 
+    def read_imports_by_module(self, module_files: Iterable[ModuleFile]) -> rust.ImportsByModule:
+        if not self._data_files:
+            return rust.ImportsByModule()
         try:
-            return self._data_map[module_file.module]
-        except KeyError:
-            # While we would expect the module to be in here,
-            # there's no point in crashing if, for some reason, it's not.
-            raise CacheMiss
+            return rust.read_cached_imports(
+                data_files=list(self._data_files.values()),
+                module_keys=self._make_module_keys(module_files),
+                found_packages=self.found_packages,
+                include_external_packages=self.include_external_packages,
+                exclude_type_checking_imports=self.exclude_type_checking_imports,
+            )
+        except rust.CorruptCache as e:
+            logger.warning(str(e))
+            return rust.ImportsByModule()
 
     def write(
         self,
-        imports_by_module: dict[Module, set[DirectImport]],
+        imports_by_module: Mapping[Module, set[DirectImport]],
     ) -> None:
-        self._write_marker_files_if_not_already_there()
-        # Write data file.
-        data_cache_filename = self.file_system.join(
-            self.cache_dir,
-            self._namer.make_data_file_name(
-                found_packages=self.found_packages,
-                include_external_packages=self.include_external_packages,
-                exclude_type_checking_imports=self.exclude_type_checking_imports,
-            ),
-        )
-        rust.write_cache_data_map_file(
-            filename=data_cache_filename,
-            imports_by_module=imports_by_module,
-            file_system=self.file_system,
-        )
+        if not isinstance(imports_by_module, rust.ImportsByModule):
+            # Only the parse results are cached, and a plain mapping doesn't hold them.
+            raise TypeError(
+                "Cache.write requires an ImportsByModule, got "
+                f"{imports_by_module.__class__.__name__}."
+            )
+        # Hold a lock while writing, so that the files written by concurrent processes aren't
+        # interleaved. Data files are replaced atomically, and partly written log segments are
+        # ignored, so reading doesn't need the lock.
+        with self.file_system.lock(self.file_system.join(self.cache_dir, self.LOCK_FILE_NAME)):
+            self._write_marker_files_if_not_already_there()
+            for found_package in self.found_packages:
+                self._write_package(found_package, imports_by_module)
+
+    def _write_package(
+        self, found_package: FoundPackage, imports_by_module: rust.ImportsByModule
+    ) -> None:
+        data_cache_filename = self._make_data_file_name(found_package)
+        log_cache_filename = self._make_log_file_name(found_package)
+        module_keys = self._make_module_keys(found_package.module_files)
+        # Only the modules that have changed since the cache was read are written, by appending
+        # them to the log, unless the data file needs rewriting.
+        data_file = self._data_files.pop(found_package.name, None)
+        if data_file is not None:
+            appended = rust.append_to_cache_log_file(
+                log_filename=log_cache_filename,
+                imports_by_module=imports_by_module,
+                module_keys=module_keys,
+                file_system=self.file_system,
+                data_file=data_file,
+            )
+            if appended == "unchanged":
+                return
+            if appended == "appended":
+                logger.info(f"Appended to log cache file {log_cache_filename}.")
+                return
+            # The data file is memory-mapped until the last reference to it is dropped, and
+            # Windows doesn't allow a mapped file to be replaced.
+            del data_file
 
+        try:
+            rust.write_cache_data_file(
+                filename=data_cache_filename,
+                log_filename=log_cache_filename,
+                imports_by_module=imports_by_module,
+                module_keys=module_keys,
+                file_system=self.file_system,
+            )
+        except OSError as e:
+            # On Windows, the data file can't be replaced while another process has it mapped.
+            # The existing data and log files are left as they are, so the cache is still valid,
+            # just less up to date.
+            logger.warning(f"Could not write data cache file {data_cache_filename}: {e}")
+            return
         logger.info(f"Wrote data cache file {data_cache_filename}.")
 
-        # Write meta files.
-        for found_package in self.found_packages:
-            meta_filename = self.file_system.join(
-                self.cache_dir, self._namer.make_meta_file_name(found_package)
-            )
-            mtime_map = {
-                module_file.module.name: module_file.mtime
-                for module_file in found_package.module_files
-            }
-            serialized_meta = json.dumps(mtime_map)
-            self.file_system.write(meta_filename, serialized_meta)
-            logger.info(f"Wrote meta cache file {meta_filename}.")
-
-    def _build_mtime_map(self) -> None:
-        self._mtime_map = self._read_mtime_map_files()
-
-    def _read_mtime_map_files(self) -> dict[str, float]:
-        all_mtimes: dict[str, float] = {}
-        for found_package in self.found_packages:
-            all_mtimes.update(self._read_mtime_map_file(found_package))
-        return all_mtimes
-
-    def _read_mtime_map_file(self, found_package: FoundPackage) -> dict[str, float]:
-        meta_cache_filename = self.file_system.join(
-            self.cache_dir, self._namer.make_meta_file_name(found_package)
-        )
-        try:
-            serialized = self.file_system.read(meta_cache_filename)
-        except FileNotFoundError:
-            logger.info(f"No cache file: {meta_cache_filename}.")
-            return {}
-        try:
-            deserialized = json.loads(serialized)
-            logger.info(f"Used cache meta file {meta_cache_filename}.")
-            return deserialized
-        except json.JSONDecodeError:
-            logger.warning(f"Could not use corrupt cache file {meta_cache_filename}.")
-            return {}
-
-    def _build_data_map(self) -> None:
-        self._data_map = self._read_data_map_file()
-
-    def _read_data_map_file(self) -> dict[Module, set[DirectImport]]:
-        data_cache_filename = self.file_system.join(
-            self.cache_dir,
-            self._namer.make_data_file_name(
-                found_packages=self.found_packages,
-                include_external_packages=self.include_external_packages,
-                exclude_type_checking_imports=self.exclude_type_checking_imports,
-            ),
+    def _make_module_keys(self, module_files: Iterable[ModuleFile]) -> dict[str, str]:
+        return {
+            module_file.module.name: self._make_key(module_file) for module_file in module_files
+        }
+
+    def _make_key(self, module_file: ModuleFile) -> str:
+        """
+        Return the value, stored in the data files, that changes whenever the module changes.
+        """
+        if self.cache_invalidation == "content":
+            return self._content_hashes[module_file.module.name]
+        return repr(module_file.mtime)
+
+    def _make_data_file_name(self, found_package: FoundPackage) -> str:
+        return self.file_system.join(
+            self.cache_dir, self._namer.make_data_file_name(found_package)
         )
+
+    def _make_log_file_name(self, found_package: FoundPackage) -> str:
+        return self.file_system.join(self.cache_dir, self._namer.make_log_file_name(found_package))
+
+    def _build_data_files(self) -> None:
+        self._data_files = {
+            found_package.name: data_file
+            for found_package in self.found_packages
+            if (data_file := self._read_data_file(found_package)) is not None
+        }
+
+    def _read_data_file(self, found_package: FoundPackage) -> rust.CacheDataFile | None:
+        data_cache_filename = self._make_data_file_name(found_package)
         try:
-            imports_by_module = rust.read_cache_data_map_file(
-                data_cache_filename, self.file_system
+            data_file = rust.read_cache_data_file(
+                data_cache_filename, self._make_log_file_name(found_package), self.file_system
             )
         except FileNotFoundError:
             logger.info(f"No cache file: {data_cache_filename}.")
-            return {}
+            return None
         except rust.CorruptCache:
             logger.warning(f"Could not use corrupt cache file {data_cache_filename}.")
-            return {}
+            return None
 
         logger.info(f"Used cache data file {data_cache_filename}.")
-        return imports_by_module
-
-    def _build_data_cache_filename(self, found_package: FoundPackage) -> str:
-        return self.file_system.join(self.cache_dir, f"{found_package.name}.data.json")
+        return data_file
 
     def _write_marker_files_if_not_already_there(self) -> None:
         marker_files_info = (
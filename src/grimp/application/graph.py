@@ -1,6 +1,7 @@
 from __future__ import annotations
-from typing import TypedDict
-from collections.abc import Sequence
+import os
+from typing import TYPE_CHECKING, TypedDict
+from collections.abc import Iterable, Iterator, Sequence
 from grimp.domain.analysis import PackageDependency, Route
 from grimp.domain.valueobjects import Layer
 from grimp import _rustgrimp as rust  # type: ignore[attr-defined]
@@ -11,6 +12,9 @@ from grimp.exceptions import (
     InvalidImportExpression,
 )
 
+if TYPE_CHECKING:
+    from .usecases import BuildContext
+
 
 class Import(TypedDict):
     importer: str
@@ -27,6 +31,10 @@ class DetailedImport(Import):
     line_contents: str
 
 
+# Corresponds to importer, imported, line_number, line_contents.
+DetailedImportTuple = tuple[str, str, int, str]
+
+
 class ImportGraph:
     """
     A Directed Graph of imports between Python modules.
@@ -36,6 +44,8 @@ class ImportGraph:
         super().__init__()
         self._cached_modules: set[str] | None = None
         self._rustgraph = rust.Graph()
+        # How the graph was built, if it was built by build_graph, so that it can be updated.
+        self._build_context: BuildContext | None = None
 
     # Mechanics
     # ---------
@@ -98,6 +108,16 @@ class ImportGraph:
         self._cached_modules = None
         self._rustgraph.add_module(module, is_squashed)
 
+    def add_modules(self, modules: Iterable[str], is_squashed: bool = False) -> None:
+        """
+        Add many modules to the graph.
+
+        This is equivalent to calling add_module for each module, but much faster for large
+        numbers of modules.
+        """
+        self._cached_modules = None
+        self._rustgraph.add_modules(modules, is_squashed)
+
     def remove_module(self, module: str) -> None:
         """
         Remove a module from the graph, if it exists.
@@ -151,6 +171,46 @@ class ImportGraph:
             line_contents=line_contents,
         )
 
+    def add_imports(self, imports: Iterable[ImportTuple | DetailedImportTuple]) -> None:
+        """
+        Add many direct imports to the graph.
+
+        Each import should be either an (importer, imported) tuple, or an
+        (importer, imported, line_number, line_contents) tuple. This is equivalent to calling
+        add_import for each import, but much faster for large numbers of imports.
+        """
+        self._cached_modules = None
+        self._rustgraph.add_imports(imports)
+
+    def _add_imports_by_module(
+        self, imports_by_module: rust.ImportsByModule, *, package_names: set[str]
+    ) -> None:
+        """
+        Add the modules and imports found by scanning some packages, without creating Python
+        objects for them.
+
+        Imported modules that aren't within any of the packages are added as squashed modules.
+        """
+        self._cached_modules = None
+        self._rustgraph.add_imports_by_module(imports_by_module, package_names=package_names)
+
+    def _update_imports_by_module(
+        self,
+        imports_by_module: rust.ImportsByModule,
+        *,
+        removed_modules: set[str],
+        package_names: set[str],
+    ) -> None:
+        """
+        Replace the imports of the rescanned modules, and remove the modules that no longer exist.
+
+        External modules that are no longer imported are removed too.
+        """
+        self._cached_modules = None
+        self._rustgraph.update_imports_by_module(
+            imports_by_module, removed_modules=removed_modules, package_names=package_names
+        )
+
     def remove_import(self, *, importer: str, imported: str) -> None:
         """
         Remove a direct import between two modules. Does not remove the modules themselves.
@@ -164,6 +224,49 @@ class ImportGraph:
         """
         return self._rustgraph.count_imports()
 
+    def freeze(self) -> ImportGraph:
+        """
+        Return an immutable copy of the graph, which stores its imports more compactly.
+
+        All the query methods work on the copy, and are usually quicker, but any attempt to
+        change it will raise a ValueError.
+        """
+        frozen_graph = ImportGraph()
+        frozen_graph._rustgraph = self._rustgraph.freeze()
+        frozen_graph._build_context = self._build_context
+        return frozen_graph
+
+    @property
+    def is_frozen(self) -> bool:
+        """
+        Whether the graph was returned by freeze, and so can't be changed.
+        """
+        return self._rustgraph.is_frozen()
+
+    def dump(self, path: str | os.PathLike[str]) -> None:
+        """
+        Save the graph to a file, in a compact binary format, so that it can be loaded again with
+        ImportGraph.load.
+        """
+        with open(path, "wb") as file:
+            file.write(self._rustgraph.to_snapshot())
+
+    @classmethod
+    def load(cls, path: str | os.PathLike[str]) -> ImportGraph:
+        """
+        Load a graph saved with ImportGraph.dump.
+
+        The loaded graph can be changed, even if the saved graph was frozen, but can't be updated
+        with update_graph.
+
+        Raises ValueError if the file does not hold a graph saved by this version of Grimp.
+        """
+        with open(path, "rb") as file:
+            snapshot = file.read()
+        graph = cls()
+        graph._rustgraph = rust.Graph.from_snapshot(snapshot)
+        return graph
+
     # Descendants
     # -----------
 
@@ -288,6 +391,37 @@ class ImportGraph:
                 f"{import_expression} is not a valid import expression."
             ) from e
 
+    def collapse_imports(
+        self, *, depth: int | None = None, packages: Iterable[str] | None = None
+    ) -> dict[ImportTuple, int]:
+        """
+        Count the imports between packages, with each module collapsed into a package.
+
+        Exactly one of depth and packages must be passed. Modules that aren't collapsed into a
+        package stand for themselves.
+
+        Args:
+            depth: Collapse each module into its ancestor at this depth, where top level modules
+                have a depth of 1.
+            packages: Collapse each module into the closest of these packages that contains it.
+        Returns:
+            A dictionary of the number of imports from each package to each other package.
+            Imports within a package are left out. The graph is not changed or copied.
+        Raises:
+            ValueError if not exactly one of depth and packages is passed, or depth is less than 1.
+            ModuleNotPresent if any of the packages are not in the graph.
+        """
+        if (depth is None) == (packages is None):
+            raise ValueError("Exactly one of depth and packages must be passed.")
+        if depth is not None and depth < 1:
+            raise ValueError("depth must be at least 1.")
+        if packages is not None:
+            packages = set(packages)
+            for package in packages:
+                if not self._rustgraph.contains_module(package):
+                    raise ModuleNotPresent(f'"{package}" not present in the graph.')
+        return self._rustgraph.collapse_imports(depth=depth, packages=packages)
+
     # Indirect imports
     # ----------------
 
@@ -381,6 +515,65 @@ class ImportGraph:
         """
         return self._rustgraph.chain_exists(importer, imported, as_packages)
 
+    def iter_shortest_chains(
+        self,
+        importer: str,
+        imported: str,
+        as_packages: bool = True,
+        limit: int | None = None,
+    ) -> Iterator[tuple[str, ...]]:
+        """
+        Yield the chains that find_shortest_chains would return, one at a time, as they are found.
+
+        Shorter chains are yielded first. The graph must not be changed while iterating over the
+        chains: if it is, the next step of the iteration will raise a RuntimeError.
+
+        Optional args:
+            as_packages: As in find_shortest_chains.
+            limit:       The maximum number of chains to yield.
+        """
+        return self._rustgraph.iter_shortest_chains(importer, imported, as_packages, limit)
+
+    def find_shortest_chains_many(
+        self, queries: Iterable[tuple[str, str, bool]]
+    ) -> list[set[tuple[str, ...]]]:
+        """
+        Find the shortest chains for each of several (importer, imported, as_packages) queries,
+        in parallel.
+
+        Equivalent to calling find_shortest_chains once per query, but quicker when there are
+        many queries.
+
+        Returns:
+            A list of the results of each query, in the same order as the queries.
+        """
+        return self._rustgraph.find_shortest_chains_many(list(queries))
+
+    def chain_exists_many(self, queries: Iterable[tuple[str, str, bool]]) -> list[bool]:
+        """
+        Return whether a chain exists for each of several (importer, imported, as_packages)
+        queries, in parallel.
+
+        Equivalent to calling chain_exists once per query, but quicker when there are many
+        queries.
+
+        Returns:
+            A list of the results of each query, in the same order as the queries.
+        """
+        return self._rustgraph.chain_exists_many(list(queries))
+
+    def build_reachability_index(self) -> None:
+        """
+        Precompute which modules import which, even indirectly, so that later calls to
+        chain_exists, find_upstream_modules and find_downstream_modules don't need to search
+        the graph.
+
+        The index is discarded as soon as the graph is changed. It takes memory quadratic in the
+        number of modules that aren't in import cycles, so is best suited to graphs that are
+        queried many times without being changed.
+        """
+        self._rustgraph.build_reachability_index()
+
     # High level analysis
     # -------------------
 
@@ -388,6 +581,9 @@ class ImportGraph:
         self,
         layers: Sequence[Layer | str | set[str]],
         containers: set[str] | None = None,
+        *,
+        max_routes_per_dependency: int | None = None,
+        timeout: float | None = None,
     ) -> set[PackageDependency]:
         """
         Find dependencies that don't conform to the supplied layered architecture.
@@ -419,14 +615,25 @@ class ImportGraph:
                       exist in the graph will be ignored.
         - containers: The parent modules of the layers, as absolute names that you could import,
                       such as "mypackage.foo". (Optional.)
+        - max_routes_per_dependency: The most routes to find for each package dependency.
+                      (Optional.)
+        - timeout:    The number of seconds after which to stop looking for more routes. Each
+                      remaining package dependency will then only include a single route.
+                      (Optional.)
 
         Returns the illegal dependencies in the form of a set of PackageDependency objects.
         Each package dependency is for a different permutation of two layers for which there
         is a violation, and contains information about the illegal chains of imports from the
-        lower layer (the 'upstream') to the higher layer (the 'downstream').
+        lower layer (the 'upstream') to the higher layer (the 'downstream'). Package
+        dependencies for which routes were left out, due to the maximum, are marked as
+        truncated, as are those found after the timeout, whether or not they had more routes.
 
         Raises NoSuchContainer if the container is not a module in the graph.
         """
+        if max_routes_per_dependency is not None and max_routes_per_dependency < 1:
+            raise ValueError("max_routes_per_dependency must be at least 1.")
+        if timeout is not None and timeout < 0:
+            raise ValueError("timeout must not be negative.")
         layers = _parse_layers(layers)
         try:
             result = self._rustgraph.find_illegal_dependencies_for_layers(
@@ -439,6 +646,8 @@ class ImportGraph:
                     for layer in layers
                 ),
                 containers=set(containers) if containers else set(),
+                max_routes_per_dependency=max_routes_per_dependency,
+                timeout=timeout,
             )
         except rust.NoSuchContainer as e:
             raise NoSuchContainer(str(e))
@@ -453,6 +662,48 @@ class ImportGraph:
             raise ModuleNotPresent(f'"{package}" not present in the graph.')
         return self._rustgraph.nominate_cycle_breakers(package)
 
+    def nominate_cycle_breakers_by_package(
+        self, packages: Iterable[str] | None = None
+    ) -> dict[str, set[ImportTuple]]:
+        """
+        Identify cycle breakers for each of the packages, or for every package in the graph.
+
+        Returns a dictionary of the cycle breakers of each package, as nominate_cycle_breakers
+        would return them. Packages with no cycle breakers are left out.
+        """
+        if packages is not None:
+            packages = set(packages)
+            for package in packages:
+                if not self._rustgraph.contains_module(package):
+                    raise ModuleNotPresent(f'"{package}" not present in the graph.')
+        return self._rustgraph.nominate_cycle_breakers_by_package(packages)
+
+    def find_strongly_connected_components(
+        self, package: str | None = None
+    ) -> set[frozenset[str]]:
+        """
+        Find the groups of modules that import each other, even indirectly.
+
+        If a package is passed, only the groups of its (squashed) children are found. Modules
+        that aren't part of any cycle are not included, but a module that imports itself is a
+        group of its own.
+        """
+        if package is not None and not self._rustgraph.contains_module(package):
+            raise ModuleNotPresent(f'"{package}" not present in the graph.')
+        return self._rustgraph.find_strongly_connected_components(package)
+
+    def find_cycles(self, package: str | None = None) -> set[tuple[str, ...]]:
+        """
+        Find a cycle of imports in each group of modules that import each other.
+
+        Each cycle is a tuple of modules, each importing the next, with the last importing the
+        first, so a module that imports itself is a cycle of one module. If a package is passed,
+        only cycles between its (squashed) children are found.
+        """
+        if package is not None and not self._rustgraph.contains_module(package):
+            raise ModuleNotPresent(f'"{package}" not present in the graph.')
+        return self._rustgraph.find_cycles(package)
+
     # Dunder methods
     # --------------
 
@@ -478,8 +729,20 @@ class ImportGraph:
     def __deepcopy__(self, memodict: dict) -> ImportGraph:
         new_graph = ImportGraph()
         new_graph._rustgraph = self._rustgraph.clone()
+        new_graph._build_context = self._build_context
         return new_graph
 
+    def __getstate__(self) -> dict:
+        return {
+            "snapshot": self._rustgraph.to_snapshot(),
+            "build_context": self._build_context,
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        self._cached_modules = None
+        self._rustgraph = rust.Graph.from_snapshot(state["snapshot"])
+        self._build_context = state["build_context"]
+
 
 class _RustRoute(TypedDict):
     heads: frozenset[str]
@@ -491,6 +754,7 @@ class _RustPackageDependency(TypedDict):
     importer: str
     imported: str
     routes: tuple[_RustRoute, ...]
+    truncated: bool
 
 
 def _parse_layers(layers: Sequence[Layer | str | set[str]]) -> tuple[Layer, ...]:
@@ -525,6 +789,7 @@ def _dependencies_from_tuple(
                     for route_dict in dep_dict["routes"]
                 }
             ),
+            truncated=dep_dict["truncated"],
         )
         for dep_dict in rust_package_dependency_tuple
     }
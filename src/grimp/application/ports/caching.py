@@ -1,9 +1,17 @@
+from collections.abc import Iterable, Mapping
+from typing import Literal
+
 from grimp.application.ports.modulefinder import FoundPackage, ModuleFile
 from grimp.domain.valueobjects import DirectImport, Module
 
 from .filesystem import BasicFileSystem
 
 
+# How to tell whether a cached module has changed: by its last modified time, or by a hash of
+# its contents.
+CacheInvalidation = Literal["mtime", "content"]
+
+
 class CacheMiss(Exception):
     pass
 
@@ -16,6 +24,7 @@ class Cache:
         exclude_type_checking_imports: bool,
         found_packages: set[FoundPackage],
         cache_dir: str,
+        cache_invalidation: CacheInvalidation = "mtime",
     ) -> None:
         """
         Don't instantiate Cache directly; use Cache.setup().
@@ -25,6 +34,7 @@ class Cache:
         self.include_external_packages = include_external_packages
         self.exclude_type_checking_imports = exclude_type_checking_imports
         self.cache_dir = cache_dir
+        self.cache_invalidation = cache_invalidation
 
     @classmethod
     def setup(
@@ -35,6 +45,7 @@ class Cache:
         include_external_packages: bool,
         exclude_type_checking_imports: bool = False,
         cache_dir: str | None = None,
+        cache_invalidation: CacheInvalidation = "mtime",
     ) -> "Cache":
         cache = cls(
             file_system=file_system,
@@ -42,16 +53,42 @@ class Cache:
             include_external_packages=include_external_packages,
             exclude_type_checking_imports=exclude_type_checking_imports,
             cache_dir=cls.cache_dir_or_default(cache_dir),
+            cache_invalidation=cache_invalidation,
         )
         return cache
 
     def read_imports(self, module_file: ModuleFile) -> set[DirectImport]:
         raise NotImplementedError
 
+    def read_imports_by_module(
+        self, module_files: Iterable[ModuleFile]
+    ) -> Mapping[Module, set[DirectImport]]:
+        """
+        Read the imports of all the supplied module files that are in the cache.
+
+        Module files that aren't in the cache are left out. Subclasses may override this to
+        read the imports without creating Python objects for each one.
+        """
+        imports_by_module: dict[Module, set[DirectImport]] = {}
+        for module_file in module_files:
+            try:
+                imports_by_module[module_file.module] = self.read_imports(module_file)
+            except CacheMiss:
+                continue
+        return imports_by_module
+
     def write(
         self,
-        imports_by_module: dict[Module, set[DirectImport]],
+        imports_by_module: Mapping[Module, set[DirectImport]],
     ) -> None:
+        """
+        Write the imports of the modules in the found packages to the cache.
+
+        Implementations may cache the results of parsing each module, rather than its imports,
+        in which case they may require an ImportsByModule (as returned by scanning, or by
+        reading from the cache), and only modules whose parse results are available will be
+        written.
+        """
         raise NotImplementedError
 
     @classmethod
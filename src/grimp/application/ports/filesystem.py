@@ -1,6 +1,7 @@
 from __future__ import annotations
 import abc
 from collections.abc import Iterator
+from contextlib import AbstractContextManager
 from typing import Protocol
 
 
@@ -112,3 +113,13 @@ class BasicFileSystem(Protocol):
     def write(self, file_name: str, contents: str) -> None: ...
 
     def exists(self, file_name: str) -> bool: ...
+
+    def get_mtime(self, file_name: str) -> float: ...
+
+    def lock(self, file_name: str) -> AbstractContextManager[object]:
+        """
+        Take an exclusive advisory lock on the file, for the duration of the context manager.
+
+        The file is created if it doesn't exist, and the call blocks until the lock is available.
+        """
+        ...
@@ -1,7 +1,7 @@
 from collections.abc import Collection
 
 from grimp import _rustgrimp as rust  # type: ignore[attr-defined]
-from grimp.domain.valueobjects import DirectImport, Module
+from grimp.domain.valueobjects import DirectImport
 from grimp.application.config import settings
 from grimp.application.ports.filesystem import AbstractFileSystem
 from grimp.application.ports.modulefinder import ModuleFile, FoundPackage
@@ -14,9 +14,28 @@ def scan_imports(
     include_external_packages: bool,
     exclude_type_checking_imports: bool,
 ) -> dict[ModuleFile, set[DirectImport]]:
+    imports_by_module = scan_imports_by_module(
+        module_files,
+        found_packages=found_packages,
+        include_external_packages=include_external_packages,
+        exclude_type_checking_imports=exclude_type_checking_imports,
+    )
+    return {module_file: imports_by_module[module_file.module] for module_file in module_files}
+
+
+def scan_imports_by_module(
+    module_files: Collection[ModuleFile],
+    *,
+    found_packages: set[FoundPackage],
+    include_external_packages: bool,
+    exclude_type_checking_imports: bool,
+) -> rust.ImportsByModule:
+    """
+    Scan the supplied module files for imports, keeping the results in Rust.
+    """
     file_system: AbstractFileSystem = settings.FILE_SYSTEM
     basic_file_system = file_system.convert_to_basic()
-    imports_by_module: dict[Module, set[DirectImport]] = rust.scan_for_imports(
+    return rust.scan_for_imports(
         module_files=tuple(module_files),
         found_packages=found_packages,
         # Ensure that the passed exclude_type_checking_imports is definitely a boolean,
@@ -25,4 +44,3 @@ def scan_imports(
         exclude_type_checking_imports=exclude_type_checking_imports,
         file_system=basic_file_system,
     )
-    return {module_file: imports_by_module[module_file.module] for module_file in module_files}
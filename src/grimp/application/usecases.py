@@ -2,16 +2,18 @@
 Use cases handle application logic.
 """
 
-from typing import cast
-from collections.abc import Sequence, Iterable
+from dataclasses import dataclass, replace
+from typing import cast, get_args
+from collections.abc import Iterable, Sequence
 
-from .scanning import scan_imports
+from grimp import _rustgrimp as rust  # type: ignore[attr-defined]
+from .scanning import scan_imports_by_module
 from ..application.ports import caching
 from ..application.ports.filesystem import AbstractFileSystem, BasicFileSystem
 from ..application.graph import ImportGraph
 from ..application.ports.modulefinder import AbstractModuleFinder, FoundPackage, ModuleFile
 from ..application.ports.packagefinder import AbstractPackageFinder
-from ..domain.valueobjects import DirectImport, Module
+from ..domain.valueobjects import Module
 from .config import settings
 
 
@@ -19,12 +21,26 @@ class NotSupplied:
     pass
 
 
+@dataclass(frozen=True)
+class BuildContext:
+    """
+    How a graph was built, so that it can be updated when its packages change.
+    """
+
+    found_packages: frozenset[FoundPackage]
+    include_external_packages: bool
+    exclude_type_checking_imports: bool
+    # The imports that may resolve differently once more modules are added.
+    unresolved_imports: rust.UnresolvedImports
+
+
 def build_graph(
     package_name,
     *additional_package_names,
     include_external_packages: bool = False,
     exclude_type_checking_imports: bool = False,
     cache_dir: str | type[NotSupplied] | None = NotSupplied,
+    cache_invalidation: caching.CacheInvalidation = "mtime",
 ) -> ImportGraph:
     """
     Build and return an import graph for the supplied package name(s).
@@ -35,6 +51,8 @@ def build_graph(
         - include_external_packages: whether to include any external packages in the graph.
         - exclude_type_checking_imports: whether to exclude imports made in type checking guards.
         - cache_dir: The directory to use for caching the graph.
+        - cache_invalidation: How to tell whether a cached module has changed: "mtime" (by its
+            last modified time) or "content" (by a hash of its contents).
     Examples:
 
         # Single package.
@@ -48,6 +66,9 @@ def build_graph(
             "mypackage", "anotherpackage", "onemore", include_external_packages=True,
         )
     """
+    if cache_invalidation not in get_args(caching.CacheInvalidation):
+        raise ValueError(f"Unknown cache_invalidation {cache_invalidation!r}.")
+
     file_system: AbstractFileSystem = settings.FILE_SYSTEM
 
     found_packages = _find_packages(
@@ -61,13 +82,188 @@ def build_graph(
         include_external_packages=include_external_packages,
         exclude_type_checking_imports=exclude_type_checking_imports,
         cache_dir=cache_dir,
+        cache_invalidation=cache_invalidation,
     )
 
     graph = _assemble_graph(found_packages, imports_by_module)
+    graph._build_context = BuildContext(
+        found_packages=frozenset(found_packages),
+        include_external_packages=include_external_packages,
+        exclude_type_checking_imports=exclude_type_checking_imports,
+        unresolved_imports=rust.UnresolvedImports().updated(
+            imports_by_module,
+            removed_modules=set(),
+            package_names={found_package.name for found_package in found_packages},
+            exclude_type_checking_imports=exclude_type_checking_imports,
+        ),
+    )
 
     return graph
 
 
+def update_graph(graph: ImportGraph, changed_paths: Iterable[str]) -> None:
+    """
+    Update a graph returned by build_graph, after some of the files in its packages have changed.
+
+    Only the changed modules, and the modules whose imports of them may now be resolved
+    differently, are rescanned. The graph is updated in place.
+
+    Args:
+        - graph: the graph to update. It must have been returned by build_graph (or be a copy
+            of one).
+        - changed_paths: the paths of the Python files that have been changed, added or deleted.
+            Paths that aren't modules in the graph's packages are ignored.
+    """
+    context = graph._build_context
+    if context is None:
+        raise ValueError("Only graphs returned by build_graph can be updated.")
+    file_system: AbstractFileSystem = settings.FILE_SYSTEM
+
+    module_files_by_package = {
+        found_package.name: {
+            module_file.module: module_file for module_file in found_package.module_files
+        }
+        for found_package in context.found_packages
+    }
+    changed_modules: set[Module] = set()
+    removed_modules: set[Module] = set()
+    # Handle shallower paths first, so that new packages are added before their modules.
+    for path in sorted(set(changed_paths), key=lambda path: path.count(file_system.sep)):
+        found_module = _find_module_for_path(path, context.found_packages, file_system)
+        if found_module is None:
+            continue
+        found_package, module = found_module
+        module_files = module_files_by_package[found_package.name]
+        is_in_package = module.name == found_package.name or module.parent in module_files
+        if file_system.exists(path) and is_in_package:
+            module_files[module] = ModuleFile(module=module, mtime=file_system.get_mtime(path))
+            changed_modules.add(module)
+            removed_modules.discard(module)
+        elif module in module_files:
+            # Removing a package's __init__.py removes the whole package.
+            is_package = file_system.split(path)[1] == "__init__.py"
+            for other_module in list(module_files):
+                is_descendant = is_package and other_module.is_descendant_of(module)
+                if other_module == module or is_descendant:
+                    del module_files[other_module]
+                    removed_modules.add(other_module)
+                    changed_modules.discard(other_module)
+
+    found_packages = frozenset(
+        FoundPackage(
+            name=found_package.name,
+            directory=found_package.directory,
+            module_files=frozenset(module_files_by_package[found_package.name].values()),
+        )
+        for found_package in context.found_packages
+    )
+    all_module_files = {
+        module: module_file
+        for module_files in module_files_by_package.values()
+        for module, module_file in module_files.items()
+    }
+
+    modules_to_rescan = changed_modules | {
+        Module(importer)
+        for importer in _find_importers_of_moved_imports(
+            graph, context, changed_modules, removed_modules
+        )
+        if Module(importer) in all_module_files
+    }
+    imports_by_module = scan_imports_by_module(
+        [all_module_files[module] for module in modules_to_rescan],
+        found_packages=set(found_packages),
+        include_external_packages=context.include_external_packages,
+        exclude_type_checking_imports=context.exclude_type_checking_imports,
+    )
+    package_names = {found_package.name for found_package in found_packages}
+    removed_module_names = {module.name for module in removed_modules}
+    graph._update_imports_by_module(
+        imports_by_module, removed_modules=removed_module_names, package_names=package_names
+    )
+    graph._build_context = replace(
+        context,
+        found_packages=found_packages,
+        unresolved_imports=context.unresolved_imports.updated(
+            imports_by_module,
+            removed_modules=removed_module_names,
+            package_names=package_names,
+            exclude_type_checking_imports=context.exclude_type_checking_imports,
+        ),
+    )
+
+
+def set_parse_cache_size(max_size: int) -> None:
+    """
+    Keep the results of parsing up to max_size modules in memory, to be reused by later calls to
+    build_graph in the same process.
+
+    Modules are reparsed if their filename, size or mtime change. Pass 0 (the default) to disable
+    the cache.
+    """
+    if max_size < 0:
+        raise ValueError("max_size must not be negative.")
+    rust.set_parse_cache_size(max_size)
+
+
+def clear_parse_cache() -> None:
+    """
+    Discard the parse results kept in memory by set_parse_cache_size, without changing its size.
+    """
+    rust.clear_parse_cache()
+
+
+def _find_module_for_path(
+    path: str, found_packages: Iterable[FoundPackage], file_system: AbstractFileSystem
+) -> tuple[FoundPackage, Module] | None:
+    """
+    Return the module that the path would be, and the package it would be in, if it's a
+    Python file within one of the packages.
+    """
+    for found_package in found_packages:
+        directory = found_package.directory.rstrip(file_system.sep) + file_system.sep
+        if not path.startswith(directory):
+            continue
+        *subdirectories, filename = path[len(directory) :].split(file_system.sep)
+        stem = filename.removesuffix(".py")
+        if stem == filename or "." in stem:
+            return None
+        if any(component.startswith(".") for component in [*subdirectories, filename]):
+            return None
+        components = [found_package.name, *subdirectories]
+        if stem != "__init__":
+            components.append(stem)
+        return found_package, Module(".".join(components))
+    return None
+
+
+def _find_importers_of_moved_imports(
+    graph: ImportGraph,
+    context: BuildContext,
+    changed_modules: set[Module],
+    removed_modules: set[Module],
+) -> set[str]:
+    """
+    Find the modules whose imports may resolve to a different module, now that some modules
+    have been added or removed.
+
+    An import of a missing module resolves to the module's parent, if the parent is there, and
+    otherwise to nothing. So imports of removed modules will now resolve to their parents, or to
+    nothing, and the imports that didn't resolve to a module of the same name may now resolve to
+    an added module, or to a module within it.
+    """
+    importers: set[str] = set()
+    for module in removed_modules:
+        if module.name in graph.modules:
+            importers |= graph.find_modules_that_directly_import(module.name)
+    added_module_names = {
+        module.name for module in changed_modules if module.name not in graph.modules
+    }
+    if added_module_names:
+        importers |= context.unresolved_imports.find_importers_of(added_module_names)
+    return importers
+
+
 def _find_packages(
     file_system: AbstractFileSystem, package_names: Sequence[object]
 ) -> set[FoundPackage]:
@@ -106,7 +302,8 @@ def _scan_packages(
     include_external_packages: bool,
     exclude_type_checking_imports: bool,
     cache_dir: str | type[NotSupplied] | None,
-) -> dict[Module, set[DirectImport]]:
+    cache_invalidation: caching.CacheInvalidation,
+) -> rust.ImportsByModule:
     if cache_dir is not None:
         cache_dir_if_supplied = cache_dir if cache_dir != NotSupplied else None
         cache: caching.Cache = settings.CACHE_CLASS.setup(
@@ -115,6 +312,7 @@ def _scan_packages(
             include_external_packages=include_external_packages,
             exclude_type_checking_imports=exclude_type_checking_imports,
             cache_dir=cache_dir_if_supplied,
+            cache_invalidation=cache_invalidation,
         )
 
     module_files_to_scan = {
@@ -123,15 +321,20 @@ def _scan_packages(
         for module_file in found_package.module_files
     }
 
-    imports_by_module_file: dict[ModuleFile, set[DirectImport]] = {}
+    # Keep the imports in Rust: Python objects are only created if something asks for them.
+    imports_by_module = rust.ImportsByModule()
 
     if cache_dir is not None:
-        imports_by_module_file.update(_read_imports_from_cache(module_files_to_scan, cache=cache))
+        imports_by_module.update(cache.read_imports_by_module(module_files_to_scan))
 
-    remaining_module_files_to_scan = module_files_to_scan.difference(imports_by_module_file)
+    remaining_module_files_to_scan = {
+        module_file
+        for module_file in module_files_to_scan
+        if module_file.module not in imports_by_module
+    }
     if remaining_module_files_to_scan:
-        imports_by_module_file.update(
-            scan_imports(
+        imports_by_module.update(
+            scan_imports_by_module(
                 remaining_module_files_to_scan,
                 found_packages=found_packages,
                 include_external_packages=include_external_packages,
@@ -139,10 +342,6 @@ def _scan_packages(
             )
         )
 
-    imports_by_module: dict[Module, set[DirectImport]] = {
-        k.module: v for k, v in imports_by_module_file.items()
-    }
-
     if cache_dir is not None:
         cache.write(imports_by_module)
 
@@ -151,47 +350,11 @@ def _scan_packages(
 
 def _assemble_graph(
     found_packages: set[FoundPackage],
-    imports_by_module: dict[Module, set[DirectImport]],
+    imports_by_module: rust.ImportsByModule,
 ) -> ImportGraph:
     graph: ImportGraph = settings.IMPORT_GRAPH_CLASS()
-
-    package_modules = {Module(found_package.name) for found_package in found_packages}
-
-    for module, direct_imports in imports_by_module.items():
-        graph.add_module(module.name)
-        for direct_import in direct_imports:
-            # Before we add the import, check to see if the imported module is in fact an
-            # external module, and if so, tell the graph that it is a squashed module.
-            graph.add_module(
-                direct_import.imported.name,
-                is_squashed=_is_external(direct_import.imported, package_modules),
-            )
-
-            graph.add_import(
-                importer=direct_import.importer.name,
-                imported=direct_import.imported.name,
-                line_number=direct_import.line_number,
-                line_contents=direct_import.line_contents,
-            )
-    return graph
-
-
-def _is_external(module: Module, package_modules: set[Module]) -> bool:
-    return not any(
-        module.is_descendant_of(package_module) or module == package_module
-        for package_module in package_modules
+    graph._add_imports_by_module(
+        imports_by_module,
+        package_names={found_package.name for found_package in found_packages},
     )
-
-
-def _read_imports_from_cache(
-    module_files: Iterable[ModuleFile], *, cache: caching.Cache
-) -> dict[ModuleFile, set[DirectImport]]:
-    imports_by_module_file: dict[ModuleFile, set[DirectImport]] = {}
-    for module_file in module_files:
-        try:
-            direct_imports = cache.read_imports(module_file)
-        except caching.CacheMiss:
-            continue
-        else:
-            imports_by_module_file[module_file] = direct_imports
-    return imports_by_module_file
+    return graph
@@ -78,12 +78,16 @@ class PackageDependency:
 
     routes: frozenset[Route]
 
+    # Whether the search was cut short, so that there may be more routes than those included.
+    truncated: bool = False
+
     @classmethod
     def new(
         cls,
         importer: str,
         imported: str,
         routes: Iterable[Route],
+        truncated: bool = False,
     ) -> PackageDependency:
         """
         Optional constructor for a PackageDependency with more permissive input types.
@@ -97,4 +101,9 @@ class PackageDependency:
             )
 
         """
-        return cls(importer=importer, imported=imported, routes=frozenset(routes))
+        return cls(
+            importer=importer,
+            imported=imported,
+            routes=frozenset(routes),
+            truncated=truncated,
+        )
@@ -1,4 +1,4 @@
-__all__ = ["build_graph"]
+__all__ = ["build_graph", "clear_parse_cache", "set_parse_cache_size", "update_graph"]
 
 from .adaptors.caching import Cache
 from .adaptors.filesystem import FileSystem
@@ -7,7 +7,12 @@ from .adaptors.modulefinder import ModuleFinder
 from .adaptors.packagefinder import ImportLibPackageFinder
 from .adaptors.timing import SystemClockTimer
 from .application.config import settings
-from .application.usecases import build_graph
+from .application.usecases import (
+    build_graph,
+    clear_parse_cache,
+    set_parse_cache_size,
+    update_graph,
+)
 
 settings.configure(
     MODULE_FINDER=ModuleFinder(),
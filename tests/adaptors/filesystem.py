@@ -1,3 +1,4 @@
+from contextlib import AbstractContextManager, nullcontext
 from typing import Any
 from collections.abc import Generator
 
@@ -194,6 +195,10 @@ class FakeFileSystem(AbstractFileSystem):
         self.content_map[file_name] = contents
         self.mtime_map[file_name] = DEFAULT_MTIME
 
+    def lock(self, file_name: str) -> AbstractContextManager[object]:
+        # There's only ever one user of a fake file system, so there's nothing to lock.
+        return nullcontext()
+
     def convert_to_basic(self) -> BasicFileSystem:
         """
         Convert this file system to a BasicFileSystem.
@@ -201,4 +206,5 @@ class FakeFileSystem(AbstractFileSystem):
         return rust.FakeBasicFileSystem(
             contents=self._raw_contents,
             content_map=self.content_map,
+            mtime_map=self.mtime_map,
         )
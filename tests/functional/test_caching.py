@@ -1,10 +1,14 @@
+import logging
+import os
 import shutil
 import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
 import pytest  # type: ignore
 
-from grimp import build_graph
+from grimp import build_graph, clear_parse_cache, set_parse_cache_size
+from grimp.adaptors.caching import Cache
 
 """
 For ease of reference, these are the imports of all the files:
@@ -61,16 +65,13 @@ def test_build_graph_uses_cache(copied_cachingpackage):
             == real_import_details
         )
 
-        meta_file = Path(cache_dir) / "cachingpackage.meta.json"
-        # Blake2B 20-character hash of "cachingpackage".
-        data_file = Path(cache_dir) / "27aa562ad2a4745eb20ecf156430dbfeb0e90610.data.json"
+        data_file = Path(cache_dir) / "cachingpackage.data.bin"
 
-        assert meta_file.exists()
         assert data_file.exists()
 
         # Edit the contents of the cache.
         snippet = "from ..one import alpha"
-        replacement = snippet + "  # Inserted by test"
+        replacement = "from ..one import ALPHA"
         _manipulate_data_file(data_file, snippet, replacement)
 
         graph = build_graph("cachingpackage", cache_dir=cache_dir)
@@ -106,11 +107,197 @@ def test_build_graph_uses_cache(copied_cachingpackage):
         )
 
 
+def test_build_graph_with_content_invalidation_ignores_mtimes(copied_cachingpackage):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        build_graph("cachingpackage", cache_dir=cache_dir, cache_invalidation="content")
+
+        data_file = Path(cache_dir) / "cachingpackage.data.bin"
+        snippet = "from ..one import alpha"
+        replacement = "from ..one import ALPHA"
+        _manipulate_data_file(data_file, snippet, replacement)
+        module_path = PACKAGE_COPY_DESTINATION / "two" / "alpha.py"
+
+        # Touching the file shouldn't stop the cache being used.
+        module_path.touch()
+        graph = build_graph("cachingpackage", cache_dir=cache_dir, cache_invalidation="content")
+        [import_details] = graph.get_import_details(
+            importer="cachingpackage.two.alpha",
+            imported="cachingpackage.one.alpha",
+        )
+        assert import_details["line_contents"] == replacement
+
+        # Changing its contents should.
+        module_path.write_text(module_path.read_text() + "\n# A comment.\n")
+        graph = build_graph("cachingpackage", cache_dir=cache_dir, cache_invalidation="content")
+        [import_details] = graph.get_import_details(
+            importer="cachingpackage.two.alpha",
+            imported="cachingpackage.one.alpha",
+        )
+        assert import_details["line_contents"] == snippet
+
+
+@pytest.mark.parametrize(
+    "options",
+    (
+        dict(include_external_packages=True),
+        dict(exclude_type_checking_imports=True),
+    ),
+)
+def test_build_graph_shares_cache_between_options(copied_cachingpackage, options):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        build_graph("cachingpackage", cache_dir=cache_dir)
+
+        snippet = "from ..one import alpha"
+        replacement = "from ..one import ALPHA"
+        _manipulate_data_file(Path(cache_dir) / "cachingpackage.data.bin", snippet, replacement)
+
+        # The cache was written without these options, but should still be used.
+        graph = build_graph("cachingpackage", cache_dir=cache_dir, **options)
+        [import_details] = graph.get_import_details(
+            importer="cachingpackage.two.alpha",
+            imported="cachingpackage.one.alpha",
+        )
+        assert import_details["line_contents"] == replacement
+
+
+def test_build_graph_concurrently_with_shared_cache(copied_cachingpackage, caplog):
+    number_of_builds = 8
+    with tempfile.TemporaryDirectory() as cache_dir:
+        with ThreadPoolExecutor(max_workers=number_of_builds) as executor:
+            graphs = list(
+                executor.map(
+                    lambda _: build_graph("cachingpackage", cache_dir=cache_dir),
+                    range(number_of_builds),
+                )
+            )
+
+        caplog.set_level(logging.INFO, logger=Cache.__module__)
+        graph_from_cache = build_graph("cachingpackage", cache_dir=cache_dir)
+
+    assert "Could not use corrupt cache file" not in caplog.text
+    assert "Used cache data file" in caplog.text
+    for graph in graphs:
+        assert graph.modules == graph_from_cache.modules
+        assert graph.count_imports() == graph_from_cache.count_imports()
+
+
+def test_build_graph_in_several_processes_with_shared_cache(copied_cachingpackage, caplog):
+    number_of_builds = 4
+    with tempfile.TemporaryDirectory() as cache_dir:
+        build_graph("cachingpackage", cache_dir=cache_dir)
+        # Changing every module means that each process rewrites the data file, while the
+        # others may have it mapped into memory.
+        for module_path in PACKAGE_COPY_DESTINATION.rglob("*.py"):
+            mtime = module_path.stat().st_mtime + 10
+            os.utime(module_path, (mtime, mtime))
+
+        with ProcessPoolExecutor(max_workers=number_of_builds) as executor:
+            summaries = list(executor.map(_summarize_graph, [cache_dir] * number_of_builds))
+
+        caplog.set_level(logging.INFO, logger=Cache.__module__)
+        graph_from_cache = build_graph("cachingpackage", cache_dir=cache_dir)
+
+    assert "Could not use corrupt cache file" not in caplog.text
+    assert "Used cache data file" in caplog.text
+    for modules, number_of_imports in summaries:
+        assert modules == graph_from_cache.modules
+        assert number_of_imports == graph_from_cache.count_imports()
+
+
+def _summarize_graph(cache_dir: str) -> tuple[set[str], int]:
+    graph = build_graph("cachingpackage", cache_dir=cache_dir)
+    return graph.modules, graph.count_imports()
+
+
+def test_build_graph_rewrites_data_file_it_has_read(copied_cachingpackage, caplog):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        build_graph("cachingpackage", cache_dir=cache_dir)
+        # Changing every module means that the data file, which has been read (and so mapped
+        # into memory) by the next build, is rewritten rather than the changes logged.
+        for module_path in PACKAGE_COPY_DESTINATION.rglob("*.py"):
+            mtime = module_path.stat().st_mtime + 10
+            os.utime(module_path, (mtime, mtime))
+
+        caplog.set_level(logging.INFO, logger=Cache.__module__)
+        graph = build_graph("cachingpackage", cache_dir=cache_dir)
+        assert "Used cache data file" in caplog.text
+        assert "Wrote data cache file" in caplog.text
+
+        caplog.clear()
+        graph_from_cache = build_graph("cachingpackage", cache_dir=cache_dir)
+        assert "Used cache data file" in caplog.text
+        assert "Wrote data cache file" not in caplog.text
+
+    assert graph_from_cache.modules == graph.modules
+    assert graph_from_cache.count_imports() == graph.count_imports()
+
+
+@pytest.fixture
+def parse_cache():
+    set_parse_cache_size(1000)
+    yield
+    set_parse_cache_size(0)
+
+
+def test_build_graph_reuses_parse_cache(copied_cachingpackage, parse_cache):
+    build_graph("cachingpackage", cache_dir=None)
+    module_path = PACKAGE_COPY_DESTINATION / "two" / "alpha.py"
+    contents = module_path.read_text()
+    mtimes = os.stat(module_path)
+
+    # Change the file without changing its size or mtime, so it isn't parsed again.
+    snippet = "from ..one import alpha"
+    replacement = "from ..one import ALPHA"
+    module_path.write_text(contents.replace(snippet, replacement))
+    os.utime(module_path, ns=(mtimes.st_atime_ns, mtimes.st_mtime_ns))
+    graph = build_graph("cachingpackage", cache_dir=None)
+    [import_details] = graph.get_import_details(
+        importer="cachingpackage.two.alpha",
+        imported="cachingpackage.one.alpha",
+    )
+    assert import_details["line_contents"] == snippet
+
+    # Changing its size means it's parsed again.
+    module_path.write_text(contents.replace(snippet, replacement) + "\n# A comment.\n")
+    os.utime(module_path, ns=(mtimes.st_atime_ns, mtimes.st_mtime_ns))
+    graph = build_graph("cachingpackage", cache_dir=None)
+    assert not graph.direct_import_exists(
+        importer="cachingpackage.two.alpha",
+        imported="cachingpackage.one.alpha",
+    )
+
+
+def test_clear_parse_cache_discards_parse_results(copied_cachingpackage, parse_cache):
+    build_graph("cachingpackage", cache_dir=None)
+    module_path = PACKAGE_COPY_DESTINATION / "two" / "alpha.py"
+    mtimes = os.stat(module_path)
+
+    # Change the file without changing its size or mtime, which the parse cache wouldn't notice.
+    snippet = "from ..one import alpha"
+    replacement = "from ..one import ALPHA"
+    module_path.write_text(module_path.read_text().replace(snippet, replacement))
+    os.utime(module_path, ns=(mtimes.st_atime_ns, mtimes.st_mtime_ns))
+    clear_parse_cache()
+    graph = build_graph("cachingpackage", cache_dir=None)
+
+    assert not graph.direct_import_exists(
+        importer="cachingpackage.two.alpha",
+        imported="cachingpackage.one.alpha",
+    )
+
+
+def test_set_parse_cache_size_rejects_negative_size():
+    with pytest.raises(ValueError, match="max_size must not be negative."):
+        set_parse_cache_size(-1)
+
+
 def _manipulate_data_file(data_file: Path, snippet: str, replacement: str) -> None:
-    with open(data_file) as file:
-        filedata = file.read()
+    # The data file is binary, so the replacement needs to be the same length as the snippet
+    # to avoid invalidating the offsets in the file.
+    assert len(snippet) == len(replacement)
+
+    filedata = data_file.read_bytes()
 
-    filedata = filedata.replace(snippet, replacement)
+    filedata = filedata.replace(snippet.encode(), replacement.encode())
 
-    with open(data_file, "w") as file:
-        file.write(filedata)
+    data_file.write_bytes(filedata)
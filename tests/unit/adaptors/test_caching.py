@@ -1,5 +1,5 @@
-import json
 import logging
+from collections.abc import Iterable
 
 import pytest  # type: ignore
 
@@ -10,199 +10,98 @@ from grimp.domain.valueobjects import DirectImport, Module
 from grimp import _rustgrimp as rust  # type: ignore[attr-defined]
 
 
-class SimplisticFileNamer(CacheFileNamer):
-    """
-    Simplistic version of the file namer that makes testing easier.
+# Data file contents that can't be read.
+CORRUPT_DATA_FILE_CONTENTS = (
+    "INVALID DATA",
+    "GRIMPIMP, followed by something that isn't the rest of a data file.",
+)
+
 
-    Does not base64 encode the data filenames.
+def _scan(
+    file_system: rust.FakeBasicFileSystem,
+    found_packages: set[FoundPackage],
+    module_files: Iterable[ModuleFile] | None = None,
+) -> rust.ImportsByModule:
+    """
+    Scan the supplied modules (by default, all the modules in the packages), keeping their
+    parse results.
     """
+    if module_files is None:
+        module_files = _all_module_files(found_packages)
+    return rust.scan_for_imports(
+        module_files=tuple(module_files),
+        found_packages=found_packages,
+        include_external_packages=False,
+        exclude_type_checking_imports=False,
+        file_system=file_system,
+    )
 
-    @classmethod
-    def make_data_file_name(
-        cls,
-        found_packages: set[FoundPackage],
-        include_external_packages: bool,
-        exclude_type_checking_imports: bool,
-    ) -> str:
-        unsafe_name = cls.make_data_file_unique_string(
-            found_packages, include_external_packages, exclude_type_checking_imports
-        )
-        return f"{unsafe_name}.data.json"
+
+def _all_module_files(found_packages: set[FoundPackage]) -> list[ModuleFile]:
+    return [
+        module_file
+        for found_package in found_packages
+        for module_file in found_package.module_files
+    ]
+
+
+def _write_cache(
+    file_system: rust.FakeBasicFileSystem, found_packages: set[FoundPackage], **kwargs
+) -> None:
+    """
+    Scan the supplied packages and write the results to the cache.
+    """
+    cache = Cache.setup(
+        file_system=file_system,
+        found_packages=found_packages,
+        include_external_packages=False,
+        **kwargs,
+    )
+    cache.write(_scan(file_system, found_packages))
 
 
 class TestCacheFileNamer:
-    def test_names_meta_cache_per_package(self):
-        result = CacheFileNamer.make_meta_file_name(
+    def test_names_data_file_per_package(self):
+        result = CacheFileNamer.make_data_file_name(
             FoundPackage(
                 name="some-package",
                 directory="whatever",
-                module_files=set(),
+                module_files=frozenset(),
             )
         )
 
-        assert result == "some-package.meta.json"
-
-    @pytest.mark.parametrize(
-        "include_external_packages, exclude_type_checking_imports, expected",
-        (
-            # Blake2B 20-character hash of "hyphenated-package,underscore_package".
-            (False, False, "a857d066514de048b7f94fa8d385e8bd7b048406.data.json"),
-            # Blake2B 20-character hash "hyphenated-package,underscore_package:external".
-            (
-                True,
-                False,
-                "021977b6de56b09810ae52f5c9d067622c1ea30f.data.json",
-            ),
-            # Blake2B 20-character hash
-            # "hyphenated-package,underscore_package:external:no_type_checking".
-            (
-                True,
-                True,
-                "4c2deb1d787161187915e159b5a17ea8b27cd0d4.data.json",
-            ),
-            # Blake2B 20-character hash "hyphenated-package,underscore_package:no_type_checking".
-            (
-                False,
-                True,
-                "815e7686179e2f3f817c130eec1121d53e62ff1c.data.json",
-            ),
-        ),
-    )
-    def test_make_data_file_name(
-        self, include_external_packages, exclude_type_checking_imports, expected
-    ):
-        result = CacheFileNamer.make_data_file_name(
-            found_packages={
-                FoundPackage(
-                    name="hyphenated-package",
-                    directory="whatever",
-                    module_files=frozenset(),
-                ),
-                FoundPackage(
-                    name="underscore_package",
-                    directory="whatever",
-                    module_files=frozenset(),
-                ),
-            },
-            include_external_packages=include_external_packages,
-            exclude_type_checking_imports=exclude_type_checking_imports,
-        )
-
-        assert result == expected
+        assert result == "some-package.data.bin"
 
-    @pytest.mark.parametrize(
-        "include_external_packages, exclude_type_checking_imports, expected",
-        (
-            (False, False, "hyphenated-package,underscore_package"),
-            (True, False, "hyphenated-package,underscore_package:external"),
-            (True, True, "hyphenated-package,underscore_package:external:no_type_checking"),
-            (False, True, "hyphenated-package,underscore_package:no_type_checking"),
-        ),
-    )
-    def test_make_data_file_unique_string(
-        self, include_external_packages, exclude_type_checking_imports, expected
-    ):
-        result = CacheFileNamer.make_data_file_unique_string(
-            found_packages={
-                FoundPackage(
-                    name="hyphenated-package",
-                    directory="whatever",
-                    module_files=frozenset(),
-                ),
-                FoundPackage(
-                    name="underscore_package",
-                    directory="whatever",
-                    module_files=frozenset(),
-                ),
-            },
-            include_external_packages=include_external_packages,
-            exclude_type_checking_imports=exclude_type_checking_imports,
+    def test_names_log_file_per_package(self):
+        result = CacheFileNamer.make_log_file_name(
+            FoundPackage(
+                name="some-package",
+                directory="whatever",
+                module_files=frozenset(),
+            )
         )
 
-        assert result == expected
+        assert result == "some-package.log.bin"
 
 
 class TestCache:
     SOME_MTIME = 1676645081.4935088
-    FILE_SYSTEM = rust.FakeBasicFileSystem(
-        contents="""
-            .grimp_cache/
-                mypackage.meta.json
-                mypackage.data.json
-            /path/to/mypackage/
-                __init__.py
-                foo/
-                    __init__.py
-                    new.py
-                    unmodified.py
-                    modified.py
-            /path/to/anotherpackage/
-                __init__.py
-                new.py
-                unmodified.py
-                modified.py
+    SOURCE_FILE_CONTENTS = {
+        "/path/to/mypackage/__init__.py": "",
+        "/path/to/mypackage/foo/__init__.py": "",
+        "/path/to/mypackage/foo/new.py": "",
+        "/path/to/mypackage/foo/unmodified.py": """
+            import mypackage.foo.modified
+            import external
+            from typing import TYPE_CHECKING
+
+            if TYPE_CHECKING:
+                from . import new
         """,
-        content_map={
-            ".grimp_cache/mypackage.meta.json": f"""{{
-                "mypackage.foo.unmodified": {SOME_MTIME},
-                "mypackage.foo.modified": {SOME_MTIME}
-            }}""",
-            ".grimp_cache/anotherpackage.meta.json": f"""{{
-                "anotherpackage.unmodified": {SOME_MTIME},
-                "anotherpackage.modified": {SOME_MTIME}
-            }}""",
-            ".grimp_cache/mypackage.data.json": """{
-                "mypackage.foo.unmodified": [
-                    ["yellow", 11, "import yellow"], ["brown", 22, "import brown"]
-                ],
-                "mypackage.foo.modified": [
-                    ["stale", 33, "We should not use this cached value."]
-                ]
-            }""",
-            ".grimp_cache/mypackage:external.data.json": """{
-                "mypackage.foo.unmodified": [
-                    ["yellow", 11, "import yellow"],
-                    ["brown", 22, "import brown"],
-                    ["external", 100, "import external"]
-                ],
-                "mypackage.foo.modified": [
-                    ["stale", 33, "We should not use this cached value."]
-                ]
-            }""",
-            ".grimp_cache/anotherpackage,mypackage.data.json": """{
-                "mypackage.foo.unmodified": [
-                    ["yellow", 11, "import yellow"], ["brown", 22, "import brown"]
-                ],
-                "mypackage.foo.modified": [
-                    ["stale", 33, "We should not use this cached value."]
-                ],
-                "anotherpackage.unmodified": [
-                    ["purple", 11, "import purple"], ["green", 22, "import green"]
-                ],
-                "anotherpackage.modified": [
-                    ["stale", 33, "We should not use this cached value."]
-                ]
-            }""",
-            ".grimp_cache/anotherpackage,mypackage:external.data.json": """{
-                "mypackage.foo.unmodified": [
-                    ["yellow", 11, "import yellow"],
-                    ["brown", 22, "import brown"],
-                    ["external", 100, "import external"]
-                ],
-                "mypackage.foo.modified": [
-                    ["stale", 33, "We should not use this cached value."]
-                ],
-                "anotherpackage.unmodified": [
-                    ["purple", 11, "import purple"],
-                    ["green", 22, "import green"],
-                    ["anotherexternal", 100, "import anotherexternal"]
-                ],
-                "anotherpackage.modified": [
-                    ["stale", 33, "We should not use this cached value."]
-                ]
-            }""",
-        },
-    )
+        "/path/to/mypackage/foo/modified.py": "from . import new",
+        "/path/to/anotherpackage/__init__.py": "",
+        "/path/to/anotherpackage/unmodified.py": "import mypackage.foo.unmodified",
+    }
     MODULE_FILE_UNMODIFIED = ModuleFile(
         module=Module("mypackage.foo.unmodified"), mtime=SOME_MTIME
     )
@@ -210,135 +109,109 @@ class TestCache:
         module=Module("mypackage.foo.modified"), mtime=SOME_MTIME + 100.0
     )
     MODULE_FILE_NEW = ModuleFile(module=Module("mypackage.foo.new"), mtime=SOME_MTIME)
+    ANOTHERPACKAGE_MODULE_FILE = ModuleFile(
+        module=Module("anotherpackage.unmodified"), mtime=SOME_MTIME
+    )
 
     FOUND_PACKAGES = {
         FoundPackage(
             name="mypackage",
-            directory="/path/to/mypackage/",
+            directory="/path/to/mypackage",
             module_files=frozenset(
                 {MODULE_FILE_MODIFIED, MODULE_FILE_UNMODIFIED, MODULE_FILE_NEW}
             ),
         ),
     }
-
-    @pytest.mark.parametrize(
-        "include_external_packages, expected_data_file",
-        (
-            (True, ".grimp_cache/mypackage:external.data.json"),
-            (False, ".grimp_cache/mypackage.data.json"),
-        ),
+    ANOTHERPACKAGE = FoundPackage(
+        name="anotherpackage",
+        directory="/path/to/anotherpackage",
+        module_files=frozenset({ANOTHERPACKAGE_MODULE_FILE}),
     )
-    def test_logs_successful_cache_file_reading(
-        self, include_external_packages: bool, expected_data_file: str, caplog
-    ):
-        caplog.set_level(logging.INFO, logger=Cache.__module__)
-
-        Cache.setup(
-            file_system=self.FILE_SYSTEM,
-            found_packages=self.FOUND_PACKAGES,
-            include_external_packages=include_external_packages,
-            namer=SimplisticFileNamer,
-        )
+    # The packages as they were when the cache was written: the modified module had an
+    # earlier mtime, and the new module didn't exist.
+    CACHED_FOUND_PACKAGES = {
+        FoundPackage(
+            name="mypackage",
+            directory="/path/to/mypackage",
+            module_files=frozenset(
+                {
+                    MODULE_FILE_UNMODIFIED,
+                    ModuleFile(module=MODULE_FILE_MODIFIED.module, mtime=SOME_MTIME),
+                }
+            ),
+        ),
+        ANOTHERPACKAGE,
+    }
 
-        assert caplog.messages == [
-            "Used cache meta file .grimp_cache/mypackage.meta.json.",
-            f"Used cache data file {expected_data_file}.",
-        ]
+    @pytest.fixture
+    def file_system(self) -> rust.FakeBasicFileSystem:
+        file_system = rust.FakeBasicFileSystem(content_map=self.SOURCE_FILE_CONTENTS)
+        _write_cache(file_system, self.CACHED_FOUND_PACKAGES)
+        return file_system
 
-    def test_logs_missing_cache_files(self, caplog):
+    def test_logs_successful_cache_file_reading(self, file_system, caplog):
         caplog.set_level(logging.INFO, logger=Cache.__module__)
 
         Cache.setup(
-            file_system=rust.FakeBasicFileSystem(),  # No cache files.
+            file_system=file_system,
             found_packages=self.FOUND_PACKAGES,
-            namer=SimplisticFileNamer,
             include_external_packages=False,
         )
 
         assert caplog.messages == [
-            "No cache file: .grimp_cache/mypackage.meta.json.",
-            "No cache file: .grimp_cache/mypackage.data.json.",
+            "Used cache data file .grimp_cache/mypackage.data.bin.",
         ]
 
-    @pytest.mark.parametrize("serialized_mtime", ("INVALID_JSON", '["wrong", "type"]'))
-    def test_logs_corrupt_cache_meta_file_reading(self, serialized_mtime: str, caplog):
-        caplog.set_level(logging.WARNING, logger=Cache.__module__)
+    def test_logs_missing_cache_files(self, caplog):
+        caplog.set_level(logging.INFO, logger=Cache.__module__)
 
-        file_system = rust.FakeBasicFileSystem(
-            contents="""
-                .grimp_cache/
-                    mypackage.meta.json
-                    mypackage.data.json
-                /path/to/mypackage.py
-            """,
-            content_map={
-                ".grimp_cache/mypackage.meta.json": f"""{{
-                    "mypackage.foo.modified": {serialized_mtime},
-                }}""",
-                ".grimp_cache/mypackage.data.json": "{}",
-            },
-        )
         Cache.setup(
-            file_system=file_system,
+            file_system=rust.FakeBasicFileSystem(),  # No cache files.
             found_packages=self.FOUND_PACKAGES,
-            namer=SimplisticFileNamer,
             include_external_packages=False,
         )
 
         assert caplog.messages == [
-            "Could not use corrupt cache file .grimp_cache/mypackage.meta.json.",
+            "No cache file: .grimp_cache/mypackage.data.bin.",
         ]
 
-    def test_logs_corrupt_cache_data_file_reading(self, caplog):
+    @pytest.mark.parametrize("serialized_data", CORRUPT_DATA_FILE_CONTENTS)
+    def test_logs_corrupt_cache_data_file_reading(self, serialized_data: str, caplog):
         caplog.set_level(logging.WARNING, logger=Cache.__module__)
 
         file_system = rust.FakeBasicFileSystem(
-            contents="""
-                    .grimp_cache/
-                        mypackage.meta.json
-                        mypackage.data.json
-                    /path/to/mypackage.py
-                """,
-            content_map={
-                ".grimp_cache/mypackage.meta.json": f"""{{
-                    "mypackage.foo.modified": {self.SOME_MTIME - 1}
-                }}""",
-                ".grimp_cache/mypackage.data.json": "INVALID JSON",
-            },
+            content_map={".grimp_cache/mypackage.data.bin": serialized_data},
         )
 
         Cache.setup(
             file_system=file_system,
             found_packages=self.FOUND_PACKAGES,
-            namer=SimplisticFileNamer,
             include_external_packages=False,
         )
 
         assert caplog.messages == [
-            "Could not use corrupt cache file .grimp_cache/mypackage.data.json.",
+            "Could not use corrupt cache file .grimp_cache/mypackage.data.bin.",
         ]
 
     @pytest.mark.parametrize("include_external_packages", (True, False))
     def test_raises_cache_miss_for_module_with_different_mtime(
-        self, include_external_packages: bool
+        self, file_system, include_external_packages: bool
     ):
         cache = Cache.setup(
-            file_system=self.FILE_SYSTEM,
+            file_system=file_system,
             found_packages=self.FOUND_PACKAGES,
             include_external_packages=include_external_packages,
-            namer=SimplisticFileNamer,
         )
         with pytest.raises(CacheMiss):
             cache.read_imports(self.MODULE_FILE_MODIFIED)
 
     @pytest.mark.parametrize("include_external_packages", (True, False))
-    def test_raises_cache_miss_for_module_with_no_cached_mtime(
-        self, include_external_packages: bool
+    def test_raises_cache_miss_for_module_not_in_cache(
+        self, file_system, include_external_packages: bool
     ):
         cache = Cache.setup(
-            file_system=self.FILE_SYSTEM,
+            file_system=file_system,
             found_packages=self.FOUND_PACKAGES,
-            namer=SimplisticFileNamer,
             include_external_packages=include_external_packages,
         )
 
@@ -346,212 +219,115 @@ class TestCache:
             cache.read_imports(self.MODULE_FILE_NEW)
 
     @pytest.mark.parametrize(
-        "include_external_packages, expected_additional_imports",
+        "include_external_packages, exclude_type_checking_imports, expected_imported",
         (
-            (False, set()),
+            (False, False, {("mypackage.foo.modified", 1), ("mypackage.foo.new", 6)}),
+            (False, True, {("mypackage.foo.modified", 1)}),
             (
                 True,
+                False,
                 {
-                    DirectImport(
-                        importer=MODULE_FILE_UNMODIFIED.module,
-                        imported=Module("external"),
-                        line_number=100,
-                        line_contents="import external",
-                    ),
+                    ("mypackage.foo.modified", 1),
+                    ("external", 2),
+                    ("typing", 3),
+                    ("mypackage.foo.new", 6),
                 },
             ),
+            (True, True, {("mypackage.foo.modified", 1), ("external", 2), ("typing", 3)}),
         ),
     )
     def test_uses_cache_for_module_with_same_mtime(
-        self, include_external_packages, expected_additional_imports
+        self,
+        file_system,
+        include_external_packages,
+        exclude_type_checking_imports,
+        expected_imported,
     ):
+        # The cache was written without any of these options, but should be usable with them.
         cache = Cache.setup(
-            file_system=self.FILE_SYSTEM,
+            file_system=file_system,
             found_packages=self.FOUND_PACKAGES,
-            namer=SimplisticFileNamer,
             include_external_packages=include_external_packages,
+            exclude_type_checking_imports=exclude_type_checking_imports,
         )
 
-        assert (
-            cache.read_imports(self.MODULE_FILE_UNMODIFIED)
-            == {
-                DirectImport(
-                    importer=self.MODULE_FILE_UNMODIFIED.module,
-                    imported=Module("yellow"),
-                    line_number=11,
-                    line_contents="import yellow",
-                ),
-                DirectImport(
-                    importer=self.MODULE_FILE_UNMODIFIED.module,
-                    imported=Module("brown"),
-                    line_number=22,
-                    line_contents="import brown",
-                ),
-            }
-            | expected_additional_imports
-        )
+        result = cache.read_imports(self.MODULE_FILE_UNMODIFIED)
 
-    def test_raises_cache_miss_for_missing_module_from_data(self):
-        file_system = rust.FakeBasicFileSystem(
-            contents="""
-                .grimp_cache/
-                    mypackage.meta.json
-                    mypackage.data.json
-                /path/to/mypackage/
-                    __init__.py
-                    somemodule.py
-            """,
-            content_map={
-                ".grimp_cache/mypackage.meta.json": f"""{{
-                    "mypackage.somemodule": {self.SOME_MTIME}
-                }}""",
-                ".grimp_cache/mypackage.data.json": """{}""",
-            },
-        )
-        module_file = ModuleFile(module=Module("mypackage.somemodule"), mtime=self.SOME_MTIME)
-        cache = Cache.setup(
-            file_system=file_system,
-            found_packages={
-                FoundPackage(
-                    name="mypackage",
-                    directory="/path/to/mypackage/",
-                    module_files=frozenset({module_file}),
-                ),
-            },
-            namer=SimplisticFileNamer,
-            include_external_packages=False,
-        )
-
-        with pytest.raises(CacheMiss):
-            cache.read_imports(module_file)
+        assert {
+            (direct_import.imported.name, direct_import.line_number) for direct_import in result
+        } == expected_imported
 
-    @pytest.mark.parametrize("serialized_mtime", ("INVALID_JSON", '["wrong", "type"]'))
-    def test_raises_cache_miss_for_corrupt_meta_file(self, serialized_mtime):
-        file_system = rust.FakeBasicFileSystem(
-            contents="""
-                .grimp_cache/
-                    mypackage.meta.json
-                    mypackage.data.json
-                /path/to/mypackage/
-                    __init__.py
-                    foo/
-                        __init__.py
-                        new.py
-                        unmodified.py
-                        modified.py
-            """,
-            content_map={
-                ".grimp_cache/mypackage.meta.json": f"""{{
-                    "mypackage.foo.modified": {serialized_mtime}
-                }}""",
-                ".grimp_cache/mypackage.data.json": """{
-                    "mypackage.foo.modified": [
-                        ["stale", 33, "We should not use this cached value."]
-                    ]
-                }""",
-            },
-        )
+    def test_read_imports_by_module_only_includes_modules_with_same_mtime(self, file_system):
         cache = Cache.setup(
             file_system=file_system,
             found_packages=self.FOUND_PACKAGES,
-            namer=SimplisticFileNamer,
             include_external_packages=False,
         )
 
-        with pytest.raises(CacheMiss):
-            cache.read_imports(self.MODULE_FILE_MODIFIED)
+        result = cache.read_imports_by_module(
+            {self.MODULE_FILE_UNMODIFIED, self.MODULE_FILE_MODIFIED, self.MODULE_FILE_NEW}
+        )
+
+        assert len(result) == 1
+        assert self.MODULE_FILE_MODIFIED.module not in result
+        assert result[self.MODULE_FILE_UNMODIFIED.module] == {
+            DirectImport(
+                importer=self.MODULE_FILE_UNMODIFIED.module,
+                imported=Module("mypackage.foo.modified"),
+                line_number=1,
+                line_contents="import mypackage.foo.modified",
+            ),
+            DirectImport(
+                importer=self.MODULE_FILE_UNMODIFIED.module,
+                imported=Module("mypackage.foo.new"),
+                line_number=6,
+                line_contents="from . import new",
+            ),
+        }
 
-    @pytest.mark.parametrize("serialized_import", ("INVALID_JSON", '["wrong", "type"]'))
-    def test_raises_cache_miss_for_corrupt_data_file(self, serialized_import):
+    @pytest.mark.parametrize("serialized_data", CORRUPT_DATA_FILE_CONTENTS)
+    def test_raises_cache_miss_for_corrupt_data_file(self, serialized_data):
         file_system = rust.FakeBasicFileSystem(
-            contents="""
-                .grimp_cache/
-                    mypackage.meta.json
-                    mypackage.data.json
-                /path/to/mypackage/
-                    __init__.py
-                    foo/
-                        __init__.py
-                        new.py
-                        unmodified.py
-                        modified.py
-            """,
             content_map={
-                ".grimp_cache/mypackage.meta.json": f"""{{
-                    "mypackage.foo.modified": {self.SOME_MTIME - 1}
-                }}""",
-                ".grimp_cache/mypackage.data.json": f"""{{
-                    "mypackage.foo.modified": [
-                        {serialized_import}
-                    ]
-                }}""",
+                **self.SOURCE_FILE_CONTENTS,
+                ".grimp_cache/mypackage.data.bin": serialized_data,
             },
         )
         cache = Cache.setup(
             file_system=file_system,
             found_packages=self.FOUND_PACKAGES,
-            namer=SimplisticFileNamer,
             include_external_packages=False,
         )
 
         with pytest.raises(CacheMiss):
-            cache.read_imports(self.MODULE_FILE_MODIFIED)
+            cache.read_imports(self.MODULE_FILE_UNMODIFIED)
 
     @pytest.mark.parametrize(
-        "include_external_packages, expected_additional_imports",
+        "found_packages, expected_imported",
         (
-            (False, set()),
-            (
-                True,
-                {
-                    DirectImport(
-                        importer=Module("anotherpackage.unmodified"),
-                        imported=Module("anotherexternal"),
-                        line_number=100,
-                        line_contents="import anotherexternal",
-                    ),
-                },
-            ),
+            ({ANOTHERPACKAGE}, "mypackage"),
+            (FOUND_PACKAGES | {ANOTHERPACKAGE}, "mypackage.foo.unmodified"),
         ),
     )
-    def test_uses_cache_multiple_packages(
-        self, include_external_packages, expected_additional_imports
+    def test_resolves_cached_imports_against_packages_being_analyzed(
+        self, file_system, found_packages, expected_imported
     ):
-        module_file = ModuleFile(module=Module("anotherpackage.unmodified"), mtime=self.SOME_MTIME)
         cache = Cache.setup(
-            file_system=self.FILE_SYSTEM,
-            found_packages=self.FOUND_PACKAGES
-            | {
-                FoundPackage(
-                    name="anotherpackage",
-                    directory="/path/to/anotherpackage/",
-                    module_files=frozenset({module_file}),
-                ),
-            },
-            namer=SimplisticFileNamer,
-            include_external_packages=include_external_packages,
+            file_system=file_system,
+            found_packages=found_packages,
+            include_external_packages=True,
         )
 
-        result = cache.read_imports(module_file)
+        result = cache.read_imports(self.ANOTHERPACKAGE_MODULE_FILE)
 
-        assert (
-            result
-            == {
-                DirectImport(
-                    importer=module_file.module,
-                    imported=Module("purple"),
-                    line_number=11,
-                    line_contents="import purple",
-                ),
-                DirectImport(
-                    importer=module_file.module,
-                    imported=Module("green"),
-                    line_number=22,
-                    line_contents="import green",
-                ),
-            }
-            | expected_additional_imports
-        )
+        assert result == {
+            DirectImport(
+                importer=self.ANOTHERPACKAGE_MODULE_FILE.module,
+                imported=Module(expected_imported),
+                line_number=1,
+                line_contents="import mypackage.foo.unmodified",
+            ),
+        }
 
     @pytest.mark.parametrize(
         "cache_dir",
@@ -561,121 +337,231 @@ class TestCache:
             None,
         ),
     )
-    @pytest.mark.parametrize(
-        "include_external_packages, expected_data_file_name",
-        (
-            (False, "blue,green.data.json"),
-            (True, "blue,green:external.data.json"),
-        ),
-    )
-    def test_write_to_cache(
-        self, include_external_packages, expected_data_file_name, cache_dir, caplog
-    ):
+    @pytest.mark.parametrize("include_external_packages", (True, False))
+    def test_write_to_cache(self, include_external_packages, cache_dir, caplog):
         caplog.set_level(logging.INFO, logger=Cache.__module__)
-        file_system = rust.FakeBasicFileSystem()
-        blue_one = Module(name="blue.one")
-        blue_two = Module(name="blue.two")
-        green_one = Module(name="green.one")
-        green_two = Module(name="green.two")
-        mtimes = {
-            blue_one: 10000.1,
-            blue_two: 20000.2,
-            green_one: 30000.3,
-            green_two: 40000.4,
+        file_system = rust.FakeBasicFileSystem(
+            content_map={
+                "/path/to/blue/__init__.py": "",
+                "/path/to/blue/one.py": "from . import two\nimport externalpackage",
+                "/path/to/blue/two.py": "",
+                "/path/to/green/__init__.py": "",
+                "/path/to/green/one.py": "",
+                "/path/to/green/two.py": "import green.one",
+            }
+        )
+        found_packages = {
+            FoundPackage(
+                name=name,
+                module_files=frozenset(
+                    ModuleFile(module=Module(module_name), mtime=mtime)
+                    for module_name, mtime in module_mtimes.items()
+                ),
+                directory=f"/path/to/{name}",
+            )
+            for name, module_mtimes in (
+                ("blue", {"blue": 1.1, "blue.one": 10000.1, "blue.two": 20000.2}),
+                ("green", {"green": 2.2, "green.one": 30000.3, "green.two": 40000.4}),
+            )
         }
         cache = Cache.setup(
             file_system=file_system,
             cache_dir=cache_dir,
-            found_packages={
-                FoundPackage(
-                    name="blue",
-                    module_files=frozenset(
-                        {
-                            ModuleFile(module=blue_one, mtime=mtimes[blue_one]),
-                            ModuleFile(module=blue_two, mtime=mtimes[blue_two]),
-                        }
-                    ),
-                    directory="-",
-                ),
-                FoundPackage(
-                    name="green",
-                    module_files=frozenset(
-                        {
-                            ModuleFile(module=green_one, mtime=mtimes[green_one]),
-                            ModuleFile(module=green_two, mtime=mtimes[green_two]),
-                        }
-                    ),
-                    directory="-",
-                ),
-            },
+            found_packages=found_packages,
             include_external_packages=include_external_packages,
-            namer=SimplisticFileNamer,
         )
+        imports_by_module = _scan(file_system, found_packages)
 
-        cache.write(
-            imports_by_module={
-                blue_one: {
-                    DirectImport(
-                        importer=blue_one,
-                        imported=blue_two,
-                        line_number=11,
-                        line_contents="from . import two",
-                    ),
-                    DirectImport(
-                        importer=blue_one,
-                        imported=Module("externalpackage"),
-                        line_number=22,
-                        line_contents="import externalpackage",
-                    ),
-                },
-                blue_two: set(),
-                green_one: set(),
-                green_two: {
-                    DirectImport(
-                        importer=green_two,
-                        imported=green_one,
-                        line_number=33,
-                        line_contents="from . import one",
-                    ),
-                },
-            },
-        )
+        cache.write(imports_by_module)
 
         # Assert the cache is written afterwards.
         expected_cache_dir = cache_dir.rstrip(file_system.sep) if cache_dir else ".grimp_cache"
         assert set(caplog.messages) == {
-            f"No cache file: {expected_cache_dir}/{expected_data_file_name}.",
-            f"No cache file: {expected_cache_dir}/blue.meta.json.",
-            f"No cache file: {expected_cache_dir}/green.meta.json.",
-            f"Wrote data cache file {expected_cache_dir}/{expected_data_file_name}.",
-            f"Wrote meta cache file {expected_cache_dir}/blue.meta.json.",
-            f"Wrote meta cache file {expected_cache_dir}/green.meta.json.",
+            f"No cache file: {expected_cache_dir}/blue.data.bin.",
+            f"No cache file: {expected_cache_dir}/green.data.bin.",
+            f"Wrote data cache file {expected_cache_dir}/blue.data.bin.",
+            f"Wrote data cache file {expected_cache_dir}/green.data.bin.",
         }
-        expected = {
-            f"{expected_cache_dir}/blue.meta.json": {
-                blue_one.name: mtimes[blue_one],
-                blue_two.name: mtimes[blue_two],
-            },
-            f"{expected_cache_dir}/green.meta.json": {
-                green_one.name: mtimes[green_one],
-                green_two.name: mtimes[green_two],
-            },
-            f"{expected_cache_dir}/{expected_data_file_name}": {
-                blue_one.name: {
-                    (blue_two.name, 11, "from . import two"),
-                    ("externalpackage", 22, "import externalpackage"),
-                },
-                blue_two.name: set(),
-                green_one.name: set(),
-                green_two.name: {
-                    (green_one.name, 33, "from . import one"),
+        for name, expected_modules in (
+            ("blue", {"blue", "blue.one", "blue.two"}),
+            ("green", {"green", "green.one", "green.two"}),
+        ):
+            data_file = rust.read_cache_data_file(
+                f"{expected_cache_dir}/{name}.data.bin",
+                f"{expected_cache_dir}/{name}.log.bin",
+                file_system,
+            )
+            assert len(data_file) == len(expected_modules)
+            assert all(module_name in data_file for module_name in expected_modules)
+        module_files = _all_module_files(found_packages)
+        read_imports = Cache.setup(
+            file_system=file_system,
+            cache_dir=cache_dir,
+            found_packages=found_packages,
+            include_external_packages=include_external_packages,
+        ).read_imports_by_module(module_files)
+        scanned_imports = rust.scan_for_imports(
+            module_files=tuple(module_files),
+            found_packages=found_packages,
+            include_external_packages=include_external_packages,
+            exclude_type_checking_imports=False,
+            file_system=file_system,
+        )
+        assert len(read_imports) == len(module_files)
+        for module_file in module_files:
+            assert read_imports[module_file.module] == scanned_imports[module_file.module]
+
+    def test_write_to_cache_skips_modules_without_parse_results(self):
+        file_system = rust.FakeBasicFileSystem()
+        cache = Cache.setup(
+            file_system=file_system,
+            found_packages=self.FOUND_PACKAGES,
+            include_external_packages=False,
+        )
+
+        # Imports added from a plain dict don't come with the parse results they were
+        # resolved from.
+        imports_by_module = rust.ImportsByModule()
+        imports_by_module.update({self.MODULE_FILE_UNMODIFIED.module: set()})
+        cache.write(imports_by_module)
+
+        data_file = rust.read_cache_data_file(
+            ".grimp_cache/mypackage.data.bin", ".grimp_cache/mypackage.log.bin", file_system
+        )
+        assert len(data_file) == 0
+
+    def test_write_to_cache_raises_type_error_when_passed_plain_dict(self):
+        file_system = rust.FakeBasicFileSystem()
+        cache = Cache.setup(
+            file_system=file_system,
+            found_packages=self.FOUND_PACKAGES,
+            include_external_packages=False,
+        )
+
+        with pytest.raises(TypeError, match="Cache.write requires an ImportsByModule, got dict."):
+            cache.write({self.MODULE_FILE_UNMODIFIED.module: set()})
+
+        assert not file_system.exists(".grimp_cache/mypackage.data.bin")
+
+    def test_write_to_cache_skips_unchanged_package(self, caplog):
+        file_system = self._make_file_system_for_many_modules()
+        found_packages = self._found_packages_for_many_modules()
+        _write_cache(file_system, found_packages)
+        caplog.set_level(logging.INFO, logger=Cache.__module__)
+        cache = Cache.setup(
+            file_system=file_system,
+            found_packages=found_packages,
+            include_external_packages=False,
+        )
+
+        cache.write(cache.read_imports_by_module(_all_module_files(found_packages)))
+
+        assert caplog.messages == ["Used cache data file .grimp_cache/mypackage.data.bin."]
+
+    def test_write_to_cache_appends_changed_modules_to_log(self, caplog):
+        file_system = self._make_file_system_for_many_modules()
+        _write_cache(file_system, self._found_packages_for_many_modules())
+        file_system.write("/path/to/mypackage/module_3.py", "import mypackage.module_9")
+        changed_module_file = ModuleFile(
+            module=Module("mypackage.module_3"), mtime=self.SOME_MTIME + 100.0
+        )
+        found_packages = self._found_packages_for_many_modules(changed_module_file)
+
+        caplog.set_level(logging.INFO, logger=Cache.__module__)
+        self._write_changes(file_system, found_packages, [changed_module_file])
+
+        assert caplog.messages[-1] == "Appended to log cache file .grimp_cache/mypackage.log.bin."
+        cache = Cache.setup(
+            file_system=file_system,
+            found_packages=found_packages,
+            include_external_packages=False,
+        )
+        assert cache.read_imports(changed_module_file) == {
+            DirectImport(
+                importer=changed_module_file.module,
+                imported=Module("mypackage.module_9"),
+                line_number=1,
+                line_contents="import mypackage.module_9",
+            ),
+        }
+        assert len(cache.read_imports_by_module(_all_module_files(found_packages))) == 11
+
+    def test_write_to_cache_compacts_log_once_it_grows(self, caplog):
+        file_system = self._make_file_system_for_many_modules()
+        _write_cache(file_system, self._found_packages_for_many_modules())
+        changed_module_file = ModuleFile(
+            module=Module("mypackage.module_3"), mtime=self.SOME_MTIME + 100.0
+        )
+        self._write_changes(
+            file_system,
+            self._found_packages_for_many_modules(changed_module_file),
+            [changed_module_file],
+        )
+        # Change all the modules, so that the log would grow larger than the data file.
+        found_packages = self._found_packages_for_many_modules(mtime=self.SOME_MTIME + 200.0)
+
+        caplog.set_level(logging.INFO, logger=Cache.__module__)
+        self._write_changes(file_system, found_packages, _all_module_files(found_packages))
+
+        assert caplog.messages[-1] == "Wrote data cache file .grimp_cache/mypackage.data.bin."
+        assert file_system.read(".grimp_cache/mypackage.log.bin") == ""
+        cache = Cache.setup(
+            file_system=file_system,
+            found_packages=found_packages,
+            include_external_packages=False,
+        )
+        assert len(cache.read_imports_by_module(_all_module_files(found_packages))) == 11
+
+    def _make_file_system_for_many_modules(self) -> rust.FakeBasicFileSystem:
+        return rust.FakeBasicFileSystem(
+            content_map={
+                "/path/to/mypackage/__init__.py": "",
+                **{
+                    f"/path/to/mypackage/module_{i}.py": f"import mypackage.module_{i + 1}"
+                    for i in range(10)
                 },
-            },
+            }
+        )
+
+    def _found_packages_for_many_modules(
+        self, *changed_module_files: ModuleFile, mtime: float = SOME_MTIME
+    ) -> set[FoundPackage]:
+        module_files = {
+            module_file.module: module_file
+            for module_file in (
+                ModuleFile(module=Module(name), mtime=mtime)
+                for name in ["mypackage"] + [f"mypackage.module_{i}" for i in range(10)]
+            )
+        }
+        module_files.update(
+            (module_file.module, module_file) for module_file in changed_module_files
+        )
+        return {
+            FoundPackage(
+                name="mypackage",
+                directory="/path/to/mypackage",
+                module_files=frozenset(module_files.values()),
+            )
         }
-        for filename, expected_deserialized in expected.items():
-            serialized = file_system.read(filename)
-            deserialized = _unflake(json.loads(serialized))
-            assert deserialized == expected_deserialized
+
+    def _write_changes(
+        self,
+        file_system: rust.FakeBasicFileSystem,
+        found_packages: set[FoundPackage],
+        changed_module_files: list[ModuleFile],
+    ) -> None:
+        """
+        Write the cache as build_graph would: reading what it can from the cache, and scanning
+        the rest.
+        """
+        cache = Cache.setup(
+            file_system=file_system,
+            found_packages=found_packages,
+            include_external_packages=False,
+        )
+        imports_by_module = cache.read_imports_by_module(_all_module_files(found_packages))
+        imports_by_module.update(_scan(file_system, found_packages, changed_module_files))
+        cache.write(imports_by_module)
 
     def test_write_to_cache_adds_marker_files(self):
         some_cache_dir = "/tmp/some-cache-dir"
@@ -685,7 +571,6 @@ class TestCache:
             cache_dir=some_cache_dir,
             found_packages=set(),
             include_external_packages=False,  # Value shouldn't matter.
-            namer=SimplisticFileNamer,
         )
 
         cache.write(
@@ -701,15 +586,77 @@ class TestCache:
             "# For information about cache directory tags see https://bford.info/cachedir/"
         )
 
+    def test_content_invalidation_uses_cache_for_module_with_same_contents(self):
+        file_system = rust.FakeBasicFileSystem(
+            contents="""
+                /path/to/mypackage/
+                    __init__.py
+                    foo.py
+            """,
+            content_map={"/path/to/mypackage/foo.py": "import yellow"},
+        )
+        _write_cache(
+            file_system,
+            self._content_invalidated_found_packages(self.SOME_MTIME),
+            cache_invalidation="content",
+        )
+
+        # A different mtime, as if the package had been checked out again.
+        cache = self._setup_content_invalidated_cache(file_system, mtime=self.SOME_MTIME + 100.0)
 
-def _unflake(flakey_data):
-    # Takes the deserialized data that could come in any
-    # order and order it consistently, so the test isn't flakey.
-    non_flakey_data = {}
-    for key, value in flakey_data.items():
-        if isinstance(value, list):
-            non_flakey_value = {tuple(i) for i in value}
-        else:
-            non_flakey_value = value
-        non_flakey_data[key] = non_flakey_value
-    return non_flakey_data
+        assert cache.read_imports(self._foo_module_file(self.SOME_MTIME + 100.0)) == {
+            DirectImport(
+                importer=Module("mypackage.foo"),
+                imported=Module("yellow"),
+                line_number=1,
+                line_contents="import yellow",
+            ),
+        }
+
+    def test_content_invalidation_raises_cache_miss_for_module_with_different_contents(self):
+        file_system = rust.FakeBasicFileSystem(
+            contents="""
+                /path/to/mypackage/
+                    __init__.py
+                    foo.py
+            """,
+            content_map={"/path/to/mypackage/foo.py": "import yellow"},
+        )
+        _write_cache(
+            file_system,
+            self._content_invalidated_found_packages(self.SOME_MTIME),
+            cache_invalidation="content",
+        )
+        file_system.write("/path/to/mypackage/foo.py", "import brown")
+
+        cache = self._setup_content_invalidated_cache(file_system, mtime=self.SOME_MTIME)
+
+        with pytest.raises(CacheMiss):
+            cache.read_imports(self._foo_module_file(self.SOME_MTIME))
+
+    def _foo_module_file(self, mtime: float) -> ModuleFile:
+        return ModuleFile(module=Module("mypackage.foo"), mtime=mtime)
+
+    def _content_invalidated_found_packages(self, mtime: float) -> set[FoundPackage]:
+        return {
+            FoundPackage(
+                name="mypackage",
+                directory="/path/to/mypackage",
+                module_files=frozenset(
+                    {
+                        ModuleFile(module=Module("mypackage"), mtime=mtime),
+                        self._foo_module_file(mtime),
+                    }
+                ),
+            ),
+        }
+
+    def _setup_content_invalidated_cache(
+        self, file_system: rust.FakeBasicFileSystem, mtime: float
+    ) -> Cache:
+        return Cache.setup(
+            file_system=file_system,
+            found_packages=self._content_invalidated_found_packages(mtime),
+            include_external_packages=False,
+            cache_invalidation="content",
+        )
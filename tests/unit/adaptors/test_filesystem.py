@@ -1,7 +1,7 @@
 from copy import copy
 import pytest  # type: ignore
 from grimp.application.ports.filesystem import BasicFileSystem
-from tests.adaptors.filesystem import FakeFileSystem
+from tests.adaptors.filesystem import DEFAULT_MTIME, FakeFileSystem
 from grimp import _rustgrimp as rust  # type: ignore[attr-defined]
 
 
@@ -155,6 +155,30 @@ class _Base:
 
         assert file_system.read(some_filename) == some_contents
 
+    @pytest.mark.parametrize(
+        "file_name, expected",
+        [
+            ("/path/to/mypackage/foo.py", 12340000.3),
+            ("/path/to/mypackage/bar.py", DEFAULT_MTIME),
+            ("/path/to/mypackage/nonexistent.py", FileNotFoundError),
+        ],
+    )
+    def test_get_mtime(self, file_name, expected):
+        file_system = self.file_system_cls(
+            contents="""
+            /path/to/mypackage/
+                foo.py
+                bar.py
+            """,
+            mtime_map={"/path/to/mypackage/foo.py": 12340000.3},
+        )
+
+        if isinstance(expected, type) and issubclass(expected, Exception):
+            with pytest.raises(expected):
+                file_system.get_mtime(file_name)
+        else:
+            assert file_system.get_mtime(file_name) == expected
+
 
 class TestFakeFileSystem(_Base):
     file_system_cls = FakeFileSystem
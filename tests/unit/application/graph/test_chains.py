@@ -1,6 +1,10 @@
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+
 import pytest  # type: ignore
 
 from grimp.application.graph import ImportGraph
+from grimp.exceptions import ModuleNotPresent
 
 
 @pytest.mark.parametrize(
@@ -14,7 +18,8 @@ from grimp.application.graph import ImportGraph
         ("bar", False, {"foo.a.d", "foo.b.e"}),
     ),
 )
-def test_find_downstream_modules(module, as_package, expected_result):
+@pytest.mark.parametrize("with_reachability_index", (False, True))
+def test_find_downstream_modules(module, as_package, expected_result, with_reachability_index):
     graph = ImportGraph()
     a, b, c = "foo.a", "foo.b", "foo.c"
     d, e, f = "foo.a.d", "foo.b.e", "foo.a.f"
@@ -30,6 +35,8 @@ def test_find_downstream_modules(module, as_package, expected_result):
     graph.add_import(importer=b, imported=f)
     graph.add_import(importer=g, imported=f)
     graph.add_import(importer=d, imported=external)
+    if with_reachability_index:
+        graph.build_reachability_index()
 
     assert expected_result == graph.find_downstream_modules(module, as_package=as_package)
 
@@ -46,7 +53,8 @@ def test_find_downstream_modules(module, as_package, expected_result):
         ("bar", False, {"foo.a.f", "foo.b.g"}),
     ),
 )
-def test_find_upstream_modules(module, as_package, expected_result):
+@pytest.mark.parametrize("with_reachability_index", (False, True))
+def test_find_upstream_modules(module, as_package, expected_result, with_reachability_index):
     graph = ImportGraph()
     a, b, c = "foo.a", "foo.d.b", "foo.d.c"
     d, e, f = "foo.d", "foo.c.e", "foo.a.f"
@@ -62,6 +70,8 @@ def test_find_upstream_modules(module, as_package, expected_result):
     graph.add_import(importer=b, imported=f)
     graph.add_import(importer=f, imported=g)
     graph.add_import(importer=external, imported=f)
+    if with_reachability_index:
+        graph.build_reachability_index()
 
     assert expected_result == graph.find_upstream_modules(module, as_package=as_package)
 
@@ -603,7 +613,8 @@ class TestFindShortestChains:
         ("a", "squashed", True, True),  # Package involving squashed module.
     ),
 )
-def test_chain_exists(importer, imported, as_packages, expected_result):
+@pytest.mark.parametrize("with_reachability_index", (False, True))
+def test_chain_exists(importer, imported, as_packages, expected_result, with_reachability_index):
     """
     Build a graph to analyse for chains. This is much easier to debug visually,
     so here is the dot syntax for the graph, which can be viewed using a dot file viewer.
@@ -683,6 +694,8 @@ def test_chain_exists(importer, imported, as_packages, expected_result):
         (a_three, squashed),
     ):
         graph.add_import(importer=_importer, imported=_imported)
+    if with_reachability_index:
+        graph.build_reachability_index()
 
     kwargs = dict(imported=imported, importer=importer)
     if as_packages is not None:
@@ -693,3 +706,141 @@ def test_chain_exists(importer, imported, as_packages, expected_result):
             graph.chain_exists(**kwargs)
     else:
         assert expected_result == graph.chain_exists(**kwargs)
+
+
+class TestIterShortestChains:
+    @pytest.fixture
+    def graph(self) -> ImportGraph:
+        graph = ImportGraph()
+        graph.add_module("foo")
+        graph.add_module("bar")
+        graph.add_import(importer="foo.a", imported="bar.a")
+        graph.add_import(importer="foo.b", imported="baz")
+        graph.add_import(importer="baz", imported="bar.b")
+        graph.add_import(importer="foo.c", imported="bar.c.one")
+        return graph
+
+    def test_yields_same_chains_as_find_shortest_chains_shortest_first(self, graph: ImportGraph):
+        chains = list(graph.iter_shortest_chains("foo", "bar"))
+
+        assert len(chains) == 3
+        assert set(chains) == graph.find_shortest_chains("foo", "bar")
+        assert chains[-1] == ("foo.b", "baz", "bar.b")
+
+    def test_as_packages_false(self, graph: ImportGraph):
+        assert list(graph.iter_shortest_chains("foo.b", "bar.b", as_packages=False)) == [
+            ("foo.b", "baz", "bar.b")
+        ]
+
+    @pytest.mark.parametrize("limit, expected_count", ((0, 0), (2, 2), (5, 3)))
+    def test_limit(self, graph: ImportGraph, limit: int, expected_count: int):
+        assert len(list(graph.iter_shortest_chains("foo", "bar", limit=limit))) == expected_count
+
+    def test_raises_if_graph_changes_during_iteration(self, graph: ImportGraph):
+        chains = graph.iter_shortest_chains("foo", "bar")
+        next(chains)
+
+        graph.add_import(importer="foo.d", imported="bar.d")
+
+        with pytest.raises(RuntimeError, match="Graph changed during iteration."):
+            next(chains)
+
+    def test_raises_module_not_present(self, graph: ImportGraph):
+        with pytest.raises(ModuleNotPresent):
+            graph.iter_shortest_chains("foo", "missing")
+
+    def test_modules_with_shared_descendants_raises_value_error(self, graph: ImportGraph):
+        with pytest.raises(ValueError, match="Modules have shared descendants."):
+            graph.iter_shortest_chains("foo", "foo.a")
+
+
+class TestBatchChainQueries:
+    @pytest.fixture
+    def graph(self) -> ImportGraph:
+        graph = ImportGraph()
+        graph.add_module("foo.c")
+        graph.add_import(importer="foo.a.one", imported="foo.b")
+        graph.add_import(importer="foo.b", imported="foo.c.one")
+        graph.add_import(importer="foo.d", imported="foo.a")
+        return graph
+
+    QUERIES = [
+        ("foo.a", "foo.c", True),
+        ("foo.a", "foo.c", False),
+        ("foo.c", "foo.a", True),
+        ("foo.d", "foo.b", False),
+        ("foo.a.one", "foo.c.one", False),
+    ]
+
+    def test_find_shortest_chains_many(self, graph: ImportGraph):
+        assert graph.find_shortest_chains_many(self.QUERIES) == [
+            graph.find_shortest_chains(importer, imported, as_packages)
+            for importer, imported, as_packages in self.QUERIES
+        ]
+        assert graph.find_shortest_chains_many(self.QUERIES)[0] == {
+            ("foo.a.one", "foo.b", "foo.c.one")
+        }
+
+    def test_chain_exists_many(self, graph: ImportGraph):
+        assert graph.chain_exists_many(self.QUERIES) == [True, False, False, False, True]
+
+    def test_no_queries(self, graph: ImportGraph):
+        assert graph.find_shortest_chains_many([]) == []
+        assert graph.chain_exists_many([]) == []
+
+    @pytest.mark.parametrize("method_name", ("find_shortest_chains_many", "chain_exists_many"))
+    def test_raises_module_not_present(self, graph: ImportGraph, method_name: str):
+        with pytest.raises(ModuleNotPresent, match="foo.missing"):
+            getattr(graph, method_name)([("foo.a", "foo.b", True), ("foo.a", "foo.missing", True)])
+
+
+class TestReachabilityIndex:
+    def test_index_is_discarded_when_import_added(self):
+        graph = ImportGraph()
+        graph.add_import(importer="foo.a", imported="foo.b")
+        graph.add_module("foo.c")
+        graph.build_reachability_index()
+        assert not graph.chain_exists("foo.a", "foo.c")
+
+        graph.add_import(importer="foo.b", imported="foo.c")
+
+        assert graph.chain_exists("foo.a", "foo.c")
+        assert graph.find_upstream_modules("foo.a") == {"foo.b", "foo.c"}
+
+    def test_index_is_discarded_when_import_removed(self):
+        graph = ImportGraph()
+        graph.add_import(importer="foo.a", imported="foo.b")
+        graph.add_import(importer="foo.b", imported="foo.c")
+        graph.build_reachability_index()
+        assert graph.chain_exists("foo.a", "foo.c")
+
+        graph.remove_import(importer="foo.b", imported="foo.c")
+
+        assert not graph.chain_exists("foo.a", "foo.c")
+        assert graph.find_downstream_modules("foo.c") == set()
+
+    def test_graph_can_be_queried_by_other_threads_while_index_is_built(self):
+        graph = ImportGraph()
+        graph.add_imports([(f"foo.m{i}", f"foo.m{i + 1}") for i in range(3000)])
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            building = executor.submit(graph.build_reachability_index)
+            queries = [
+                executor.submit(graph.chain_exists, "foo.m0", f"foo.m{i}") for i in range(1, 100)
+            ]
+
+            building.result()
+            assert all(query.result() for query in queries)
+        assert graph.chain_exists("foo.m0", "foo.m3000")
+
+    def test_copy_keeps_working_independently(self):
+        graph = ImportGraph()
+        graph.add_import(importer="foo.a", imported="foo.b")
+        graph.add_module("foo.c")
+        graph.build_reachability_index()
+        copied_graph = deepcopy(graph)
+
+        copied_graph.add_import(importer="foo.b", imported="foo.c")
+
+        assert not graph.chain_exists("foo.a", "foo.c")
+        assert copied_graph.chain_exists("foo.a", "foo.c")
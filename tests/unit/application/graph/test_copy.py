@@ -84,3 +84,40 @@ class TestCopy:
         graph.squash_module("foo")
 
         assert not copied_graph.is_module_squashed("foo")
+
+    def test_changing_copy_doesnt_affect_original(self):
+        graph = ImportGraph()
+        graph.add_import(
+            importer="foo.one", imported="bar", line_number=3, line_contents="import bar"
+        )
+        copied_graph = deepcopy(graph)
+
+        copied_graph.add_module("foo")
+        copied_graph.add_import(importer="bar", imported="baz")
+        copied_graph.remove_import(importer="foo.one", imported="bar")
+
+        assert graph.modules == {"foo.one", "bar"}
+        assert graph.find_modules_directly_imported_by("foo.one") == {"bar"}
+        assert graph.find_modules_directly_imported_by("bar") == set()
+        assert graph.get_import_details(importer="foo.one", imported="bar") == [
+            {
+                "importer": "foo.one",
+                "imported": "bar",
+                "line_number": 3,
+                "line_contents": "import bar",
+            }
+        ]
+        assert copied_graph.modules == {"foo", "foo.one", "bar", "baz"}
+
+    def test_copies_of_copies_are_independent(self):
+        graph = ImportGraph()
+        graph.add_import(importer="foo", imported="bar")
+        copied_graph = deepcopy(graph)
+        copy_of_copied_graph = deepcopy(copied_graph)
+
+        copied_graph.remove_module("bar")
+        copy_of_copied_graph.add_import(importer="bar", imported="baz")
+
+        assert graph.modules == {"foo", "bar"}
+        assert copied_graph.modules == {"foo"}
+        assert copy_of_copied_graph.modules == {"foo", "bar", "baz"}
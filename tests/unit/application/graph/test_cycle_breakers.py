@@ -233,3 +233,71 @@ class TestNominateCycleBreakers:
         ):
             graph.add_import(importer=importer, imported=imported)
         return graph
+
+
+class TestNominateCycleBreakersByPackage:
+    def test_nonexistent_package(self):
+        graph = ImportGraph()
+        graph.add_module("pkg")
+
+        with pytest.raises(ModuleNotPresent):
+            graph.nominate_cycle_breakers_by_package(["pkg", "nonexistent"])
+
+    def test_empty_graph(self):
+        graph = ImportGraph()
+
+        assert graph.nominate_cycle_breakers_by_package() == {}
+
+    def test_all_packages(self):
+        graph = self._build_graph_with_cycles()
+
+        result = graph.nominate_cycle_breakers_by_package()
+
+        assert result == {
+            "pkg": {
+                ("pkg.bar.red.one", "pkg.foo"),
+                ("pkg.bar.yellow.one", "pkg.foo.blue"),
+            },
+            "pkg.bar": {("pkg.bar.yellow.one", "pkg.bar.red")},
+        }
+
+    @pytest.mark.parametrize("package", ("pkg", "pkg.bar", "pkg.foo", "pkg.bar.red"))
+    def test_matches_nominate_cycle_breakers(self, package: str):
+        graph = self._build_graph_with_cycles()
+
+        result = graph.nominate_cycle_breakers_by_package([package])
+
+        expected = graph.nominate_cycle_breakers(package)
+        assert result == ({package: expected} if expected else {})
+
+    def _build_graph_with_cycles(self) -> ImportGraph:
+        graph = ImportGraph()
+        for module in (
+            "pkg",
+            "pkg.foo",
+            "pkg.foo.blue",
+            "pkg.foo.green",
+            "pkg.bar",
+            "pkg.bar.red",
+            "pkg.bar.red.one",
+            "pkg.bar.yellow",
+            "pkg.bar.yellow.one",
+        ):
+            graph.add_module(module)
+        for importer, imported in (
+            # A cycle between pkg.foo and pkg.bar.
+            ("pkg.foo.blue", "pkg.bar.red"),
+            ("pkg.foo.blue", "pkg.bar.yellow"),
+            ("pkg.foo.green", "pkg.bar"),
+            ("pkg.bar.red.one", "pkg.foo"),
+            ("pkg.bar.yellow.one", "pkg.foo.blue"),
+            # A cycle between pkg.bar.red and pkg.bar.yellow.
+            ("pkg.bar.red", "pkg.bar.yellow"),
+            ("pkg.bar.red.one", "pkg.bar.yellow.one"),
+            ("pkg.bar.yellow.one", "pkg.bar.red"),
+            # Imports between packages and their descendants are disregarded.
+            ("pkg.foo", "pkg.foo.blue"),
+            ("pkg.foo.blue", "pkg.foo"),
+        ):
+            graph.add_import(importer=importer, imported=imported)
+        return graph
@@ -0,0 +1,89 @@
+from grimp.application.graph import ImportGraph
+import pytest
+from grimp.exceptions import ModuleNotPresent
+
+
+class TestFindStronglyConnectedComponents:
+    def test_graph_with_no_cycles(self):
+        graph = ImportGraph()
+        graph.add_import(importer="pkg.a", imported="pkg.b")
+        graph.add_import(importer="pkg.b", imported="pkg.c")
+
+        assert graph.find_strongly_connected_components() == set()
+
+    def test_finds_components_of_modules(self):
+        graph = self._build_graph()
+
+        result = graph.find_strongly_connected_components()
+
+        assert result == {
+            frozenset({"pkg.foo.blue", "pkg.bar.green"}),
+            frozenset({"pkg.baz.one", "pkg.baz.two", "pkg.baz.three"}),
+        }
+
+    def test_finds_components_of_squashed_children(self):
+        graph = self._build_graph()
+
+        result = graph.find_strongly_connected_components("pkg")
+
+        assert result == {frozenset({"pkg.foo", "pkg.bar"})}
+
+    def test_module_that_imports_itself_is_a_component(self):
+        graph = ImportGraph()
+        graph.add_import(importer="pkg.a", imported="pkg.a")
+        graph.add_import(importer="pkg.a", imported="pkg.b")
+
+        assert graph.find_strongly_connected_components() == {frozenset({"pkg.a"})}
+
+    def test_nonexistent_package(self):
+        graph = ImportGraph()
+        graph.add_module("pkg")
+
+        with pytest.raises(ModuleNotPresent):
+            graph.find_strongly_connected_components("nonexistent")
+
+    @staticmethod
+    def _build_graph() -> ImportGraph:
+        graph = ImportGraph()
+        graph.add_module("pkg")
+        for importer, imported in (
+            ("pkg.foo.blue", "pkg.bar.green"),
+            ("pkg.bar.green", "pkg.foo.blue"),
+            ("pkg.bar.green", "pkg.baz.one"),
+            ("pkg.baz.one", "pkg.baz.two"),
+            ("pkg.baz.two", "pkg.baz.three"),
+            ("pkg.baz.three", "pkg.baz.one"),
+        ):
+            graph.add_import(importer=importer, imported=imported)
+        return graph
+
+
+class TestFindCycles:
+    def test_finds_shortest_cycle_from_first_module(self):
+        graph = ImportGraph()
+        for importer, imported in (
+            ("pkg.a", "pkg.b"),
+            ("pkg.b", "pkg.c"),
+            ("pkg.c", "pkg.a"),
+            ("pkg.c", "pkg.b"),
+            ("pkg.d", "pkg.e"),
+            ("pkg.e", "pkg.d"),
+        ):
+            graph.add_import(importer=importer, imported=imported)
+
+        assert graph.find_cycles() == {("pkg.a", "pkg.b", "pkg.c"), ("pkg.d", "pkg.e")}
+
+    def test_module_that_imports_itself_is_a_cycle(self):
+        graph = ImportGraph()
+        graph.add_import(importer="pkg.a", imported="pkg.a")
+        graph.add_import(importer="pkg.a", imported="pkg.b")
+
+        assert graph.find_cycles() == {("pkg.a",)}
+
+    def test_finds_cycles_between_squashed_children(self):
+        graph = ImportGraph()
+        graph.add_module("pkg")
+        graph.add_import(importer="pkg.foo.blue", imported="pkg.bar.green")
+        graph.add_import(importer="pkg.bar.green.one", imported="pkg.foo")
+
+        assert graph.find_cycles("pkg") == {("pkg.bar", "pkg.foo")}
@@ -2,7 +2,7 @@ import pytest  # type: ignore
 
 from grimp.application.graph import ImportGraph
 import re
-from grimp.exceptions import InvalidImportExpression
+from grimp.exceptions import InvalidImportExpression, ModuleNotPresent
 
 
 def test_find_modules_directly_imported_by():
@@ -358,3 +358,78 @@ class TestFindMatchingDirectImports:
             match=re.escape(f"{expression} is not a valid import expression."),
         ):
             graph.find_matching_direct_imports(expression)
+
+
+class TestCollapseImports:
+    @pytest.mark.parametrize(
+        "kwargs, expected_result",
+        [
+            (
+                dict(depth=1),
+                {("pkg", "utils"): 1},
+            ),
+            (
+                dict(depth=2),
+                {
+                    ("pkg.animals", "pkg.food"): 2,
+                    ("pkg.food", "pkg.animals"): 1,
+                    ("pkg.food", "utils"): 1,
+                    ("pkg", "pkg.food"): 1,
+                },
+            ),
+            (
+                # Modules are collapsed into the closest package that contains them.
+                dict(packages={"pkg", "pkg.food.fish"}),
+                {
+                    ("pkg", "pkg.food.fish"): 1,
+                    ("pkg.food.fish", "pkg"): 1,
+                    ("pkg", "utils"): 1,
+                },
+            ),
+        ],
+    )
+    def test_collapse_imports(self, kwargs, expected_result):
+        graph = ImportGraph()
+        for importer, imported in (
+            ("pkg.animals.dog", "pkg.food.chicken"),
+            ("pkg.animals.cat", "pkg.food.fish.salmon"),
+            ("pkg.animals.cat", "pkg.animals"),
+            ("pkg.food.fish.salmon", "pkg.food.fish"),
+            ("pkg.food.fish", "pkg.animals.cat"),
+            ("pkg.food.chicken", "utils"),
+            ("pkg", "pkg.food"),
+        ):
+            graph.add_import(importer=importer, imported=imported)
+
+        assert graph.collapse_imports(**kwargs) == expected_result
+
+    def test_does_not_change_graph(self):
+        graph = ImportGraph()
+        graph.add_import(importer="pkg.a.one", imported="pkg.b.two")
+
+        graph.collapse_imports(depth=2)
+
+        assert graph.direct_import_exists(importer="pkg.a.one", imported="pkg.b.two")
+        assert graph.modules == {"pkg.a.one", "pkg.b.two"}
+
+    @pytest.mark.parametrize(
+        "kwargs",
+        [
+            dict(),
+            dict(depth=1, packages={"pkg"}),
+            dict(depth=0),
+        ],
+    )
+    def test_raises_value_error_if_arguments_are_invalid(self, kwargs):
+        graph = ImportGraph()
+        graph.add_module("pkg")
+
+        with pytest.raises(ValueError):
+            graph.collapse_imports(**kwargs)
+
+    def test_raises_module_not_present_if_package_is_not_in_graph(self):
+        graph = ImportGraph()
+        graph.add_module("pkg")
+
+        with pytest.raises(ModuleNotPresent):
+            graph.collapse_imports(packages={"pkg", "nonexistent"})
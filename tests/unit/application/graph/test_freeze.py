@@ -0,0 +1,83 @@
+import pytest  # type: ignore
+
+from grimp.application.graph import ImportGraph
+
+
+class TestFreeze:
+    @staticmethod
+    def _build_graph() -> ImportGraph:
+        graph = ImportGraph()
+        graph.add_module("mypackage")
+        graph.add_module("external", is_squashed=True)
+        graph.add_import(
+            importer="mypackage.foo.one",
+            imported="mypackage.bar",
+            line_number=3,
+            line_contents="from mypackage import bar",
+        )
+        graph.add_import(importer="mypackage.bar", imported="mypackage.baz.two")
+        graph.add_import(importer="mypackage.baz.two", imported="mypackage.bar")
+        graph.add_import(importer="mypackage.baz.two", imported="external")
+        return graph
+
+    def test_queries_match_unfrozen_graph(self):
+        graph = self._build_graph()
+
+        frozen_graph = graph.freeze()
+
+        assert frozen_graph.is_frozen
+        assert not graph.is_frozen
+        assert frozen_graph.modules == graph.modules
+        assert frozen_graph.count_imports() == graph.count_imports()
+        for module in graph.modules:
+            assert frozen_graph.find_modules_directly_imported_by(
+                module
+            ) == graph.find_modules_directly_imported_by(module)
+            assert frozen_graph.find_modules_that_directly_import(
+                module
+            ) == graph.find_modules_that_directly_import(module)
+            assert frozen_graph.find_upstream_modules(module) == graph.find_upstream_modules(
+                module
+            )
+            assert frozen_graph.find_downstream_modules(module) == graph.find_downstream_modules(
+                module
+            )
+        assert frozen_graph.find_shortest_chains(
+            "mypackage.foo", "mypackage.baz"
+        ) == graph.find_shortest_chains("mypackage.foo", "mypackage.baz")
+        assert frozen_graph.get_import_details(
+            importer="mypackage.foo.one", imported="mypackage.bar"
+        ) == graph.get_import_details(importer="mypackage.foo.one", imported="mypackage.bar")
+        assert frozen_graph.find_matching_direct_imports(
+            "mypackage.** -> external"
+        ) == graph.find_matching_direct_imports("mypackage.** -> external")
+        assert frozen_graph.find_strongly_connected_components() == {
+            frozenset({"mypackage.bar", "mypackage.baz.two"})
+        }
+
+    @pytest.mark.parametrize(
+        "method_name, kwargs",
+        (
+            ("add_module", dict(module="mypackage.new")),
+            ("add_modules", dict(modules=["mypackage.new"])),
+            ("remove_module", dict(module="mypackage.bar")),
+            ("squash_module", dict(module="mypackage.bar")),
+            ("add_import", dict(importer="mypackage.bar", imported="mypackage.foo.one")),
+            ("add_imports", dict(imports=[("mypackage.bar", "mypackage.foo.one")])),
+            ("remove_import", dict(importer="mypackage.bar", imported="mypackage.baz.two")),
+        ),
+    )
+    def test_cannot_change_frozen_graph(self, method_name, kwargs):
+        frozen_graph = self._build_graph().freeze()
+
+        with pytest.raises(ValueError, match="Cannot change a frozen graph."):
+            getattr(frozen_graph, method_name)(**kwargs)
+
+    def test_original_graph_can_still_be_changed(self):
+        graph = self._build_graph()
+        frozen_graph = graph.freeze()
+
+        graph.remove_import(importer="mypackage.bar", imported="mypackage.baz.two")
+
+        assert not graph.chain_exists("mypackage.foo.one", "mypackage.baz.two")
+        assert frozen_graph.chain_exists("mypackage.foo.one", "mypackage.baz.two")
@@ -1113,3 +1113,86 @@ class TestClosedLayers:
             graph.add_import(importer=higher_module, imported=lower_module)
 
         return graph
+
+
+class TestLimitingTheSearch:
+    def _build_graph(self) -> ImportGraph:
+        graph = ImportGraph()
+        for module in ("mypackage", "mypackage.high", "mypackage.low"):
+            graph.add_module(module)
+        # Three illegal direct imports from low to high.
+        for i in range(3):
+            graph.add_import(importer=f"mypackage.low.l{i}", imported=f"mypackage.high.h{i}")
+        return graph
+
+    @pytest.mark.parametrize(
+        "max_routes_per_dependency, expected_route_count, expected_truncated",
+        (
+            (None, 3, False),
+            (1, 1, True),
+            (2, 2, True),
+            (3, 3, False),
+            (10, 3, False),
+        ),
+    )
+    def test_max_routes_per_dependency(
+        self, max_routes_per_dependency, expected_route_count, expected_truncated
+    ):
+        graph = self._build_graph()
+
+        result = graph.find_illegal_dependencies_for_layers(
+            layers=("high", "low"),
+            containers={"mypackage"},
+            max_routes_per_dependency=max_routes_per_dependency,
+        )
+
+        assert len(result) == 1
+        [dependency] = result
+        assert (dependency.importer, dependency.imported) == ("mypackage.low", "mypackage.high")
+        assert len(dependency.routes) == expected_route_count
+        assert dependency.truncated == expected_truncated
+
+    def test_zero_timeout_still_finds_one_route_per_dependency(self):
+        graph = self._build_graph()
+
+        result = graph.find_illegal_dependencies_for_layers(
+            layers=("high", "low"), containers={"mypackage"}, timeout=0
+        )
+
+        [dependency] = result
+        assert len(dependency.routes) == 1
+        assert dependency.truncated
+
+    def test_zero_timeout_marks_dependency_with_single_route_as_truncated(self):
+        graph = self._build_graph()
+        for i in (1, 2):
+            graph.remove_import(importer=f"mypackage.low.l{i}", imported=f"mypackage.high.h{i}")
+
+        result = graph.find_illegal_dependencies_for_layers(
+            layers=("high", "low"), containers={"mypackage"}, timeout=0
+        )
+
+        # Once the timeout has passed, no time is spent checking for more routes.
+        [dependency] = result
+        assert len(dependency.routes) == 1
+        assert dependency.truncated
+
+    def test_generous_timeout_finds_all_routes(self):
+        graph = self._build_graph()
+
+        result = graph.find_illegal_dependencies_for_layers(
+            layers=("high", "low"), containers={"mypackage"}, timeout=60
+        )
+
+        [dependency] = result
+        assert len(dependency.routes) == 3
+        assert not dependency.truncated
+
+    @pytest.mark.parametrize("kwargs", ({"max_routes_per_dependency": 0}, {"timeout": -1}))
+    def test_invalid_limits_raise_value_error(self, kwargs):
+        graph = self._build_graph()
+
+        with pytest.raises(ValueError):
+            graph.find_illegal_dependencies_for_layers(
+                layers=("high", "low"), containers={"mypackage"}, **kwargs
+            )
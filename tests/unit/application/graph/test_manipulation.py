@@ -22,6 +22,88 @@ class TestAddModule:
         assert graph.modules == {"mypackage.foo.bar"}
 
 
+class TestAddModules:
+    def test_adds_modules(self):
+        graph = ImportGraph()
+
+        graph.add_modules(module for module in ("mypackage.foo", "mypackage.bar"))
+
+        assert graph.modules == {"mypackage.foo", "mypackage.bar"}
+
+    def test_adds_squashed_modules(self):
+        graph = ImportGraph()
+
+        graph.add_modules(["django", "flask"], is_squashed=True)
+
+        assert graph.is_module_squashed("django")
+        assert graph.is_module_squashed("flask")
+
+    def test_cannot_add_descendant_of_squashed_module(self):
+        graph = ImportGraph()
+        graph.add_module("mypackage.foo", is_squashed=True)
+
+        with pytest.raises(ValueError, match="Module is a descendant of squashed module"):
+            graph.add_modules(["mypackage.bar", "mypackage.foo.blue"])
+
+
+class TestAddImports:
+    def test_adds_imports(self):
+        graph = ImportGraph()
+
+        graph.add_imports(
+            [
+                ("mypackage.blue", "mypackage.green"),
+                ("mypackage.green", "mypackage.yellow", 5, "from . import yellow"),
+            ]
+        )
+
+        assert graph.modules == {"mypackage.blue", "mypackage.green", "mypackage.yellow"}
+        assert graph.direct_import_exists(importer="mypackage.blue", imported="mypackage.green")
+        assert (
+            graph.get_import_details(importer="mypackage.blue", imported="mypackage.green") == []
+        )
+        assert graph.get_import_details(
+            importer="mypackage.green", imported="mypackage.yellow"
+        ) == [
+            {
+                "importer": "mypackage.green",
+                "imported": "mypackage.yellow",
+                "line_number": 5,
+                "line_contents": "from . import yellow",
+            }
+        ]
+
+    def test_raises_value_error_for_wrong_length_tuple(self):
+        graph = ImportGraph()
+
+        with pytest.raises(ValueError):
+            graph.add_imports([("mypackage.blue", "mypackage.green", 5)])
+
+    @pytest.mark.parametrize(
+        "bad_import",
+        (
+            ("mypackage.red", "mypackage.orange", 5),
+            ("mypackage.red", "mypackage.orange", "five", "from . import orange"),
+        ),
+    )
+    def test_bad_import_leaves_graph_unchanged(self, bad_import):
+        graph = ImportGraph()
+        graph.add_import(importer="mypackage.blue", imported="mypackage.green")
+
+        with pytest.raises((ValueError, TypeError)):
+            graph.add_imports(
+                [
+                    ("mypackage.green", "mypackage.yellow"),
+                    ("mypackage.yellow", "mypackage.purple", 5, "from . import purple"),
+                    bad_import,
+                    ("mypackage.purple", "mypackage.brown"),
+                ]
+            )
+
+        assert graph.modules == {"mypackage.blue", "mypackage.green"}
+        assert graph.count_imports() == 1
+
+
 class TestRemoveModule:
     def test_removes_module_removes_import_details_for_imported(self):
         graph = ImportGraph()
@@ -0,0 +1,126 @@
+import pickle
+
+import pytest  # type: ignore
+
+from grimp.application.graph import ImportGraph
+
+
+def _build_graph() -> ImportGraph:
+    graph = ImportGraph()
+    graph.add_module("mypackage")
+    graph.add_module("external", is_squashed=True)
+    graph.add_import(
+        importer="mypackage.foo.one",
+        imported="mypackage.bar",
+        line_number=3,
+        line_contents="from mypackage import bar",
+    )
+    graph.add_import(
+        importer="mypackage.foo.one",
+        imported="mypackage.bar",
+        line_number=7,
+        line_contents="from mypackage import bar",
+    )
+    graph.add_import(importer="mypackage.bar", imported="mypackage.baz.two")
+    graph.add_import(importer="mypackage.baz.two", imported="external")
+    return graph
+
+
+def _assert_graphs_match(graph: ImportGraph, other_graph: ImportGraph) -> None:
+    assert other_graph.modules == graph.modules
+    # Invisible modules are restored too, so the hierarchy is the same.
+    assert other_graph.find_children("mypackage") == graph.find_children("mypackage")
+    assert other_graph.is_module_squashed("external")
+    assert not other_graph.is_module_squashed("mypackage")
+    assert other_graph.count_imports() == graph.count_imports()
+    assert other_graph.find_matching_direct_imports("** -> **") == (
+        graph.find_matching_direct_imports("** -> **")
+    )
+    assert sorted(
+        other_graph.get_import_details(importer="mypackage.foo.one", imported="mypackage.bar"),
+        key=lambda import_details: import_details["line_number"],
+    ) == [
+        {
+            "importer": "mypackage.foo.one",
+            "imported": "mypackage.bar",
+            "line_number": 3,
+            "line_contents": "from mypackage import bar",
+        },
+        {
+            "importer": "mypackage.foo.one",
+            "imported": "mypackage.bar",
+            "line_number": 7,
+            "line_contents": "from mypackage import bar",
+        },
+    ]
+
+
+class TestDumpAndLoad:
+    def test_loads_dumped_graph(self, tmp_path):
+        graph = _build_graph()
+        path = tmp_path / "graph.bin"
+
+        graph.dump(path)
+        loaded_graph = ImportGraph.load(path)
+
+        _assert_graphs_match(graph, loaded_graph)
+
+    def test_loaded_frozen_graph_can_be_changed(self, tmp_path):
+        graph = _build_graph().freeze()
+        path = tmp_path / "graph.bin"
+
+        graph.dump(str(path))
+        loaded_graph = ImportGraph.load(str(path))
+
+        assert not loaded_graph.is_frozen
+        _assert_graphs_match(graph, loaded_graph)
+        loaded_graph.add_import(importer="mypackage.bar", imported="mypackage.foo.one")
+        assert loaded_graph.direct_import_exists(
+            importer="mypackage.bar", imported="mypackage.foo.one"
+        )
+
+    def test_loads_empty_graph(self, tmp_path):
+        path = tmp_path / "graph.bin"
+
+        ImportGraph().dump(path)
+
+        assert ImportGraph.load(path).modules == set()
+
+    @pytest.mark.parametrize(
+        "contents",
+        [
+            b"",
+            b"not a graph",
+        ],
+    )
+    def test_raises_value_error_for_invalid_file(self, tmp_path, contents):
+        path = tmp_path / "graph.bin"
+        path.write_bytes(contents)
+
+        with pytest.raises(ValueError):
+            ImportGraph.load(path)
+
+    def test_raises_value_error_for_truncated_file(self, tmp_path):
+        path = tmp_path / "graph.bin"
+        _build_graph().dump(path)
+        path.write_bytes(path.read_bytes()[:-1])
+
+        with pytest.raises(ValueError):
+            ImportGraph.load(path)
+
+
+class TestPickle:
+    def test_unpickled_graph_matches(self):
+        graph = _build_graph()
+
+        unpickled_graph = pickle.loads(pickle.dumps(graph))
+
+        _assert_graphs_match(graph, unpickled_graph)
+
+    def test_unpickled_graph_is_independent(self):
+        graph = _build_graph()
+        unpickled_graph = pickle.loads(pickle.dumps(graph))
+
+        unpickled_graph.remove_module("mypackage.bar")
+
+        assert "mypackage.bar" in graph.modules
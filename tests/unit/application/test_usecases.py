@@ -1,7 +1,9 @@
+from collections.abc import Mapping
 from unittest.mock import sentinel
 import pytest  # type: ignore
 
 from grimp.application import usecases
+from grimp.application.graph import ImportGraph
 from grimp.application.ports.caching import Cache
 from grimp.application.ports.modulefinder import ModuleFile
 from grimp.domain.valueobjects import DirectImport, Module
@@ -78,6 +80,10 @@ class TestBuildGraph:
         with pytest.raises(TypeError, match="Package names must be strings, got bool."):
             usecases.build_graph("mypackage", True)
 
+    def test_unknown_cache_invalidation_raises_value_error(self):
+        with pytest.raises(ValueError, match="Unknown cache_invalidation 'size'."):
+            usecases.build_graph("mypackage", cache_invalidation="size")
+
     @pytest.mark.parametrize(
         "supplied_cache_dir", ("/path/to/somewhere", None, sentinel.not_supplied)
     )
@@ -114,7 +120,7 @@ class TestBuildGraph:
 
             def write(
                 self,
-                imports_by_module: dict[Module, set[DirectImport]],
+                imports_by_module: Mapping[Module, set[DirectImport]],
             ) -> None:
                 pass
 
@@ -163,3 +169,114 @@ class TestBuildGraph:
             "mypackage.foo.one",
         }
         assert expected_modules == graph.modules
+
+
+class TestUpdateGraph:
+    CONTENTS = """
+        /path/to/mypackage/
+            __init__.py
+            foo/
+                __init__.py
+                one.py
+                two.py
+            bar/
+                __init__.py
+                three.py
+    """
+    CONTENT_MAP = {
+        "/path/to/mypackage/foo/one.py": "import mypackage.foo.two\nimport decimal",
+        "/path/to/mypackage/foo/two.py": (
+            "from mypackage.bar import three\n"
+            "import mypackage.qux.thing\n"
+            "from mypackage.baz import five"
+        ),
+        "/path/to/mypackage/bar/three.py": "from mypackage.bar import four",
+    }
+
+    class FakePackageFinder(BaseFakePackageFinder):
+        directory_map = {"mypackage": "/path/to/mypackage"}
+
+    @pytest.mark.parametrize(
+        "new_contents, new_content_map, changed_paths",
+        (
+            pytest.param(
+                CONTENTS,
+                {**CONTENT_MAP, "/path/to/mypackage/foo/one.py": "import mypackage.bar"},
+                ["/path/to/mypackage/foo/one.py"],
+                id="modified module",
+            ),
+            pytest.param(
+                CONTENTS.replace("three.py", "three.py\n                four.py"),
+                {**CONTENT_MAP, "/path/to/mypackage/bar/four.py": "import json"},
+                ["/path/to/mypackage/bar/four.py"],
+                id="added module",
+            ),
+            pytest.param(
+                CONTENTS.replace("            foo/", "            qux.py\n            foo/"),
+                CONTENT_MAP,
+                ["/path/to/mypackage/qux.py"],
+                id="added parent of imported module",
+            ),
+            pytest.param(
+                CONTENTS.replace(
+                    "            bar/",
+                    "            baz/\n                __init__.py\n                five.py\n            bar/",
+                ),
+                CONTENT_MAP,
+                ["/path/to/mypackage/baz/__init__.py", "/path/to/mypackage/baz/five.py"],
+                id="added package",
+            ),
+            pytest.param(
+                CONTENTS.replace("two.py", ""),
+                {k: v for k, v in CONTENT_MAP.items() if not k.endswith("two.py")},
+                ["/path/to/mypackage/foo/two.py"],
+                id="deleted module",
+            ),
+            pytest.param(
+                CONTENTS.replace("                three.py\n", "").replace(
+                    "            bar/\n                __init__.py\n", ""
+                ),
+                {k: v for k, v in CONTENT_MAP.items() if "bar" not in k},
+                ["/path/to/mypackage/bar/__init__.py", "/path/to/mypackage/bar/three.py"],
+                id="deleted package",
+            ),
+            pytest.param(
+                CONTENTS,
+                CONTENT_MAP,
+                ["/path/to/mypackage/foo/missing.txt", "/path/to/elsewhere/foo.py"],
+                id="irrelevant paths",
+            ),
+        ),
+    )
+    @pytest.mark.parametrize("include_external_packages", (True, False))
+    def test_updated_graph_matches_rebuilt_graph(
+        self, new_contents, new_content_map, changed_paths, include_external_packages
+    ):
+        with override_settings(
+            FILE_SYSTEM=FakeFileSystem(contents=self.CONTENTS, content_map=self.CONTENT_MAP),
+            PACKAGE_FINDER=self.FakePackageFinder(),
+        ):
+            graph = usecases.build_graph(
+                "mypackage", include_external_packages=include_external_packages, cache_dir=None
+            )
+
+        with override_settings(
+            FILE_SYSTEM=FakeFileSystem(contents=new_contents, content_map=new_content_map),
+            PACKAGE_FINDER=self.FakePackageFinder(),
+        ):
+            usecases.update_graph(graph, changed_paths)
+            rebuilt_graph = usecases.build_graph(
+                "mypackage", include_external_packages=include_external_packages, cache_dir=None
+            )
+
+        assert graph.modules == rebuilt_graph.modules
+        for module in rebuilt_graph.modules:
+            assert graph.find_modules_directly_imported_by(
+                module
+            ) == rebuilt_graph.find_modules_directly_imported_by(module)
+
+    def test_graph_not_built_by_build_graph_raises_value_error(self):
+        with pytest.raises(
+            ValueError, match="Only graphs returned by build_graph can be updated."
+        ):
+            usecases.update_graph(ImportGraph(), ["/path/to/mypackage/foo.py"])